@@ -0,0 +1,121 @@
+"""
+Compare the cost of rendering a timeline page and a profile with the
+standard library JSONResponse and with ORJSONResponse.
+
+No database is needed, run from the app directory:
+
+    python -m benchmarks.bench_serialization [--tweets 50] [--likes 5]
+"""
+
+import argparse
+import asyncio
+from timeit import repeat
+from typing import Callable, List, Tuple
+
+import models.timeline  # noqa: F401
+from database.utils import Profile, get_username_map
+from fastapi.responses import ORJSONResponse
+from models.likes import Like
+from models.media import Media
+from models.users import Tweet
+from routers.tweets import serialize_tweets
+from routers.users import serialize_user
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.responses import JSONResponse, Response
+from utils.settings import PROFILE_PREVIEW_SIZE
+
+RESPONSE_CLASSES = (JSONResponse, ORJSONResponse)
+
+
+def make_tweets(tweet_count: int, like_count: int) -> List[Tweet]:
+    tweets = []
+    for tweet_id in range(1, tweet_count + 1):
+        tweet = Tweet(
+            id=tweet_id,
+            user_id=tweet_id % 10 + 1,
+            tweet_data="Тестовый твит with some unicode ✓ " * 4,
+        )
+        tweet.media = [
+            Media(
+                media_path=f"ab/cd/{tweet_id:064x}.png",
+                thumbnail_path=f"ab/cd/{tweet_id:064x}.thumbnail.webp",
+                medium_path=f"ab/cd/{tweet_id:064x}.medium.webp",
+            )
+        ]
+        tweet.likes = [
+            Like(user_id=user_id, tweet_id=tweet_id)
+            for user_id in range(1, like_count + 1)
+        ]
+        tweets.append(tweet)
+    return tweets
+
+
+def make_follows(follow_count: int) -> List[Tuple[int, str]]:
+    return [
+        (user_id, f"user {user_id}") for user_id in range(2, follow_count + 2)
+    ]
+
+
+def measure(render: Callable[[], Response], number: int) -> float:
+    """Best time of one call in microseconds"""
+    return min(repeat(render, number=number, repeat=5)) / number * 1e6
+
+
+def main(tweet_count: int, like_count: int, number: int) -> None:
+    session = AsyncSession()
+    # Usernames are already resolved, serialize_tweets makes no query.
+    get_username_map(session).update(
+        (user_id, f"user {user_id}") for user_id in range(1, 101)
+    )
+    tweets = make_tweets(tweet_count, like_count)
+    follows = make_follows(min(like_count * 10, PROFILE_PREVIEW_SIZE))
+    profile = Profile(
+        id=1,
+        username="user 1",
+        follower_count=len(follows),
+        following_count=len(follows),
+        tweet_count=tweet_count,
+        received_like_count=tweet_count * like_count,
+    )
+
+    loop = asyncio.new_event_loop()
+    timeline = loop.run_until_complete(serialize_tweets(session, tweets))
+    print(f"{'payload':<28}{'response class':<18}{'us/page':>10}")
+    for response_class in RESPONSE_CLASSES:
+
+        def render_timeline() -> Response:
+            payload = loop.run_until_complete(
+                serialize_tweets(session, tweets)
+            )
+            return response_class(content={"result": True, "tweets": payload})
+
+        def encode_timeline() -> Response:
+            return response_class(content={"result": True, "tweets": timeline})
+
+        def render_profile() -> Response:
+            return response_class(
+                content={
+                    "result": True,
+                    "user": serialize_user(profile, follows, follows),
+                }
+            )
+
+        for name, render in (
+            (f"timeline ({tweet_count} tweets)", render_timeline),
+            ("  of which encoding", encode_timeline),
+            ("profile", render_profile),
+        ):
+            print(
+                f"{name:<28}{response_class.__name__:<18}"
+                f"{measure(render, number):>10.1f}"
+            )
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tweets", type=int, default=50)
+    parser.add_argument("--likes", type=int, default=5)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+    main(args.tweets, args.likes, args.number)
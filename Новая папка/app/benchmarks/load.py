@@ -0,0 +1,324 @@
+"""
+Drive the API endpoints at fixed concurrency levels and report throughput
+and latency percentiles as JSON, one result per endpoint and level.
+
+Seed the database with benchmarks.seed, start the API, then:
+
+    python -m benchmarks.load --users 100000 --concurrency 1,16,64 \
+        --output results.json
+
+Every request authenticates as a random seeded user, drawn with the same
+power law as the dataset, so the popular accounts get most of the
+traffic. Searches and tag pages draw the seeded hashtags the same way,
+pass the --tags the dataset was seeded with. The same --seed replays
+the same sequence of requests.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List
+
+from benchmarks.seed import PowerLaw, topic
+from httpx import AsyncClient, Limits, Response
+
+Scenario = Callable[
+    [AsyncClient, PowerLaw, argparse.Namespace], Awaitable[Response]
+]
+
+
+def headers(user_id: int) -> Dict[str, str]:
+    return {"api-key": f"bench{user_id}"}
+
+
+@lru_cache(maxsize=None)
+def topic_popularity(tags: int, exponent: float) -> PowerLaw:
+    """The distribution of the seeded hashtags, shared by the workers"""
+    return PowerLaw(tags, exponent, random.Random())
+
+
+def draw_topic(users: PowerLaw, args: argparse.Namespace) -> str:
+    popularity = topic_popularity(args.tags, args.exponent)
+    return topic(popularity.with_rng(users.rng).draw())
+
+
+async def get_tweets(client, users, args):
+    return await client.get("/api/tweets", headers=headers(users.draw()))
+
+
+async def get_home_timeline(client, users, args):
+    user_id = users.draw()
+    return await client.get(f"/api/tweets/{user_id}", headers=headers(user_id))
+
+
+async def get_me(client, users, args):
+    return await client.get("/api/users/me", headers=headers(users.draw()))
+
+
+async def get_user(client, users, args):
+    return await client.get(
+        f"/api/users/{users.draw()}", headers=headers(users.draw())
+    )
+
+
+async def search_tweets(client, users, args):
+    return await client.get(
+        "/api/tweets/search",
+        params={"q": draw_topic(users, args)},
+        headers=headers(users.draw()),
+    )
+
+
+async def get_tag_timeline(client, users, args):
+    return await client.get(
+        f"/api/tweets/tags/{draw_topic(users, args)}",
+        headers=headers(users.draw()),
+    )
+
+
+async def get_mention_timeline(client, users, args):
+    return await client.get(
+        f"/api/tweets/mentions/{users.draw()}", headers=headers(users.draw())
+    )
+
+
+async def get_followers(client, users, args):
+    return await client.get(
+        f"/api/users/{users.draw()}/followers", headers=headers(users.draw())
+    )
+
+
+async def get_following(client, users, args):
+    return await client.get(
+        f"/api/users/{users.draw()}/following", headers=headers(users.draw())
+    )
+
+
+async def get_mutual(client, users, args):
+    return await client.get(
+        f"/api/users/{users.draw()}/mutual", headers=headers(users.draw())
+    )
+
+
+async def create_tweet(client, users, args):
+    return await client.post(
+        "/api/tweets",
+        headers=headers(users.draw()),
+        json={"tweet_data": f"Benchmark tweet {users.rng.random()}"},
+    )
+
+
+async def like_tweet(client, users, args):
+    # Likes are toggled, so repeated runs keep the dataset stable.
+    user_id = users.draw()
+    url = f"/api/tweets/{users.rng.randint(1, args.tweets)}/likes"
+    response = await client.post(url, headers=headers(user_id))
+    if response.status_code != 201:
+        response = await client.delete(url, headers=headers(user_id))
+    return response
+
+
+async def follow_user(client, users, args):
+    user_id, followed_id = users.draw(), users.draw()
+    while followed_id == user_id:
+        followed_id = users.draw()
+    url = f"/api/users/{followed_id}/follow"
+    response = await client.post(url, headers=headers(user_id))
+    if response.status_code != 201:
+        response = await client.delete(url, headers=headers(user_id))
+    return response
+
+
+async def like_tweets(client, users, args):
+    # There is no batch unlike, the liked tweets stay liked: reseed with
+    # --reset to start from the same dataset again.
+    tweet_ids = users.rng.sample(range(1, args.tweets + 1), args.batch_size)
+    return await client.post(
+        "/api/tweets/likes",
+        headers=headers(users.draw()),
+        json={"tweet_ids": tweet_ids},
+    )
+
+
+async def follow_users(client, users, args):
+    # Follows stay too, see like_tweets.
+    user_id = users.draw()
+    return await client.post(
+        "/api/users/follow",
+        headers=headers(user_id),
+        json={"user_ids": users.draw_distinct(args.batch_size, user_id)},
+    )
+
+
+async def upload_media(client, users, args):
+    content = users.rng.randbytes(1024)
+    return await client.post(
+        "/api/medias",
+        headers=headers(users.draw()),
+        files={"file": ("bench.bin", content)},
+    )
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "get_tweets": get_tweets,
+    "get_home_timeline": get_home_timeline,
+    "get_me": get_me,
+    "get_user": get_user,
+    "search_tweets": search_tweets,
+    "get_tag_timeline": get_tag_timeline,
+    "get_mention_timeline": get_mention_timeline,
+    "get_followers": get_followers,
+    "get_following": get_following,
+    "get_mutual": get_mutual,
+    "create_tweet": create_tweet,
+    "like_tweet": like_tweet,
+    "like_tweets": like_tweets,
+    "follow_user": follow_user,
+    "follow_users": follow_users,
+    "upload_media": upload_media,
+}
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    if len(latencies) < 2:
+        latencies = latencies * 2 or [0.0, 0.0]
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "mean": round(statistics.fmean(latencies) * 1000, 3),
+        "p50": round(cuts[49] * 1000, 3),
+        "p95": round(cuts[94] * 1000, 3),
+        "p99": round(cuts[98] * 1000, 3),
+        "max": round(max(latencies) * 1000, 3),
+    }
+
+
+async def run_level(
+    client: AsyncClient,
+    name: str,
+    concurrency: int,
+    args: argparse.Namespace,
+) -> dict:
+    """Send args.requests requests of a scenario from `concurrency` workers"""
+    scenario = SCENARIOS[name]
+    popularity = PowerLaw(args.users, args.exponent, random.Random(args.seed))
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    remaining = args.requests
+
+    async def worker(worker_id: int) -> None:
+        nonlocal remaining
+        rng = random.Random(f"{args.seed}-{name}-{concurrency}-{worker_id}")
+        users = popularity.with_rng(rng)
+        while remaining > 0:
+            remaining -= 1
+            started = perf_counter()
+            try:
+                response = await scenario(client, users, args)
+                status = str(response.status_code)
+            except Exception as exc:
+                status = type(exc).__name__
+            latencies.append(perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    for _ in range(args.warmup):
+        await scenario(client, popularity, args)
+    started = perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    duration = perf_counter() - started
+    errors = sum(
+        count
+        for status, count in statuses.items()
+        if not status.startswith("2")
+    )
+    return {
+        "endpoint": name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "latency_ms": summarize(latencies),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    async with AsyncClient(
+        base_url=args.base_url,
+        timeout=args.timeout,
+        limits=Limits(max_connections=max(levels)),
+    ) as client:
+        results = []
+        for name in args.endpoints.split(","):
+            for concurrency in levels:
+                results.append(
+                    await run_level(client, name, concurrency, args)
+                )
+                print(
+                    f"{name} x{concurrency}: "
+                    f"{results[-1]['throughput_rps']} rps, "
+                    f"p99 {results[-1]['latency_ms']['p99']} ms",
+                    file=sys.stderr,
+                )
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "base_url": args.base_url,
+        "options": vars(args),
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument(
+        "--users", type=int, default=100_000, help="Seeded users"
+    )
+    parser.add_argument(
+        "--tweets", type=int, default=10_000_000, help="Seeded tweets"
+    )
+    parser.add_argument(
+        "--tags", type=int, default=1000, help="Seeded hashtags"
+    )
+    parser.add_argument("--exponent", type=float, default=1.1)
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=20,
+        help="Tweets or users per batch like or follow",
+    )
+    parser.add_argument("--endpoints", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,16,64")
+    parser.add_argument(
+        "--requests", type=int, default=2000, help="Requests per level"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=20, help="Untimed requests per level"
+    )
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write JSON here, not to stdout")
+    args = parser.parse_args()
+    unknown = set(args.endpoints.split(",")) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report)
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
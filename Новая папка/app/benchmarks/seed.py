@@ -0,0 +1,403 @@
+"""
+Seed a benchmark dataset into the database configured by the DB_*
+environment variables. The schema must be migrated first:
+
+    alembic upgrade head
+    python -m benchmarks.seed --users 100000 --tweets 10000000
+
+Rows are streamed with COPY. The follow graph and the activity of the
+users follow a power law: a few users have most of the followers, tweet
+the most and get the most likes, and are mentioned the most. Hashtags
+"topic<rank>" are drawn from a power law too. The same --seed always
+produces the same dataset.
+
+Users get the api key "bench<id>", which benchmarks.load uses to
+authenticate as random users.
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+from time import perf_counter
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
+
+from database.database import engine
+from faker import Faker
+from models.tags import HASHTAG_MAX_LENGTH
+from utils.settings import FANOUT_FOLLOWER_THRESHOLD, HOME_TIMELINE_DEPTH
+from utils.tweet_text import extract_hashtags, extract_mentions
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 50_000
+SEEDED_TABLES = (
+    "home_timeline",
+    "tweet_hashtags",
+    "tweet_mentions",
+    "likes",
+    "media",
+    "media_files",
+    "user_to_user",
+    "tweets",
+    "users",
+    "data_versions",
+)
+
+
+class PowerLaw:
+    """Draws ids from 1 to size, id k with a weight of 1 / k ** exponent"""
+
+    def __init__(self, size: int, exponent: float, rng: random.Random):
+        self.rng = rng
+        self.cumulative = list(
+            accumulate(1 / rank**exponent for rank in range(1, size + 1))
+        )
+
+    def with_rng(self, rng: random.Random) -> "PowerLaw":
+        """Share the distribution with a generator of its own"""
+        clone = object.__new__(PowerLaw)
+        clone.rng, clone.cumulative = rng, self.cumulative
+        return clone
+
+    def draw(self) -> int:
+        point = self.rng.random() * self.cumulative[-1]
+        return bisect(self.cumulative, point) + 1
+
+    def draw_distinct(self, count: int, exclude: int) -> List[int]:
+        drawn: Set[int] = set()
+        for _ in range(count * 3):
+            if len(drawn) == count:
+                break
+            drawn.add(self.draw())
+        drawn.discard(exclude)
+        return sorted(drawn)
+
+
+def topic(rank: int) -> str:
+    """Hashtag of the given popularity rank, without the "#" sign"""
+    return f"topic{rank}"
+
+
+def chunked(rows: Iterator[tuple], size: int) -> Iterator[List[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate_users(count: int, faker: Faker) -> Iterator[tuple]:
+    for user_id in range(1, count + 1):
+        # Without dots, so a mention of the username parses whole.
+        username = faker.user_name().replace(".", "_")
+        yield user_id, f"bench{user_id}", f"{username}{user_id}"
+
+
+def generate_follows(
+    args: argparse.Namespace, popularity: PowerLaw, rng: random.Random
+) -> Iterator[tuple]:
+    for follower_id in range(1, args.users + 1):
+        # Most users follow a handful of accounts, a few follow many.
+        count = min(int(rng.paretovariate(1.5) * args.follows / 3), 5000)
+        for following_id in popularity.draw_distinct(count, follower_id):
+            yield follower_id, following_id
+
+
+def generate_tweets(
+    args: argparse.Namespace,
+    popularity: PowerLaw,
+    topics: PowerLaw,
+    followers: Sequence[int],
+    usernames: Sequence[str],
+    sentences: Sequence[str],
+    rng: random.Random,
+) -> Iterator[Tuple[tuple, List[tuple]]]:
+    """
+    Yield every tweet row with its like rows, so like_count matches the
+    likes. Tweets are spread evenly over the last --days days, a share
+    of them tag a topic or mention a user.
+    """
+    start = datetime.now() - timedelta(days=args.days)
+    step = timedelta(days=args.days) / args.tweets
+    for tweet_id in range(1, args.tweets + 1):
+        author_id = popularity.draw()
+        like_count = min(int(rng.expovariate(1 / args.likes)), args.users)
+        likes = [
+            (user_id, tweet_id)
+            for user_id in popularity.draw_distinct(like_count, author_id)
+        ]
+        text = rng.choice(sentences)
+        if rng.random() < args.tagged:
+            text += f" #{topic(topics.draw())}"
+        if rng.random() < args.mentioned:
+            text += f" @{usernames[popularity.draw()]}"
+        tweet = (
+            tweet_id,
+            author_id,
+            start + step * tweet_id,
+            text,
+            len(likes),
+            followers[author_id] <= FANOUT_FOLLOWER_THRESHOLD,
+        )
+        yield tweet, likes
+
+
+def tweet_entities(
+    tweet: tuple, user_ids: Dict[str, int]
+) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Hashtag and mention rows of a generated tweet, parsed like the app
+    parses new tweets.
+    """
+    tweet_id, _, create_date, text = tweet[:4]
+    hashtags = [
+        (tweet_id, tag, create_date)
+        for tag in extract_hashtags(text, HASHTAG_MAX_LENGTH)
+    ]
+    mentions = [
+        (tweet_id, user_ids[username], create_date)
+        for username in extract_mentions(text)
+        if username in user_ids
+    ]
+    return hashtags, mentions
+
+
+async def copy_rows(
+    connection, table: str, columns: Sequence[str], rows: Iterator[tuple]
+) -> int:
+    copied = 0
+    for chunk in chunked(rows, CHUNK_SIZE):
+        await connection.copy_records_to_table(
+            table, records=chunk, columns=columns
+        )
+        copied += len(chunk)
+    return copied
+
+
+# The statements of the app keep the counters of users in step, the
+# copied rows are counted afterwards.
+USER_COUNTERS = {
+    "follower_count": "SELECT following_id, count(*) FROM user_to_user "
+    "GROUP BY following_id",
+    "following_count": "SELECT follower_id, count(*) FROM user_to_user "
+    "GROUP BY follower_id",
+    "tweet_count": "SELECT user_id, count(*) FROM tweets GROUP BY user_id",
+    "received_like_count": "SELECT tweets.user_id, count(*) FROM likes "
+    "JOIN tweets ON tweets.id = likes.tweet_id GROUP BY tweets.user_id",
+}
+
+
+async def fill_user_counters(connection) -> None:
+    for counter, counts in USER_COUNTERS.items():
+        await connection.execute(
+            f"UPDATE users SET {counter} = counted.count "
+            f"FROM ({counts}) AS counted (user_id, count) "
+            "WHERE users.id = counted.user_id"
+        )
+
+
+async def materialize_home_timelines(connection, users: int) -> None:
+    """
+    Fill home_timeline the way fan-out on write would have: the latest
+    fanned out tweets of the user and of the followed authors, up to
+    HOME_TIMELINE_DEPTH per timeline.
+    """
+    for low in range(1, users + 1, 1000):
+        await connection.execute(
+            """
+            INSERT INTO home_timeline (owner_id, tweet_id, create_date)
+            SELECT owners.id, latest.id, latest.create_date
+            FROM users AS owners
+            CROSS JOIN LATERAL (
+                SELECT tweets.id, tweets.create_date
+                FROM tweets
+                WHERE tweets.fanned_out AND (
+                    tweets.user_id = owners.id
+                    OR tweets.user_id IN (
+                        SELECT following_id FROM user_to_user
+                        WHERE follower_id = owners.id
+                    )
+                )
+                ORDER BY tweets.create_date DESC, tweets.id DESC
+                LIMIT $3
+            ) AS latest
+            WHERE owners.id BETWEEN $1 AND $2
+            """,
+            low,
+            low + 999,
+            HOME_TIMELINE_DEPTH,
+        )
+
+
+async def seed(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    faker = Faker()
+    Faker.seed(args.seed)
+    sentences = [faker.sentence() for _ in range(10_000)]
+    popularity = PowerLaw(args.users, args.exponent, rng)
+    topics = PowerLaw(args.tags, args.exponent, rng)
+
+    async with engine.connect() as sa_connection:
+        raw_connection = await sa_connection.get_raw_connection()
+        connection = raw_connection.driver_connection
+        if args.reset:
+            await connection.execute(
+                f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY CASCADE"
+            )
+        elif await connection.fetchval("SELECT count(*) FROM users"):
+            raise SystemExit("The database is not empty, pass --reset.")
+
+        started = perf_counter()
+        users = list(generate_users(args.users, faker))
+        await copy_rows(
+            connection, "users", ("id", "api_key", "username"), iter(users)
+        )
+        usernames = [""] + [username for _, _, username in users]
+        user_ids = {username: user_id for user_id, _, username in users}
+        del users
+        logger.info("Users copied in %.1fs", perf_counter() - started)
+
+        follows = list(generate_follows(args, popularity, rng))
+        await copy_rows(
+            connection,
+            "user_to_user",
+            ("follower_id", "following_id"),
+            iter(follows),
+        )
+        followers = [0] * (args.users + 1)
+        for _, following_id in follows:
+            followers[following_id] += 1
+        logger.info(
+            "%s follows copied in %.1fs",
+            len(follows),
+            perf_counter() - started,
+        )
+        del follows
+
+        like_rows: List[tuple] = []
+        hashtag_rows: List[tuple] = []
+        mention_rows: List[tuple] = []
+
+        def tweet_rows() -> Iterator[tuple]:
+            for tweet, likes in generate_tweets(
+                args,
+                popularity,
+                topics,
+                followers,
+                usernames,
+                sentences,
+                rng,
+            ):
+                like_rows.extend(likes)
+                hashtags, mentions = tweet_entities(tweet, user_ids)
+                hashtag_rows.extend(hashtags)
+                mention_rows.extend(mentions)
+                yield tweet
+
+        like_count = 0
+        for chunk in chunked(tweet_rows(), CHUNK_SIZE):
+            await connection.copy_records_to_table(
+                "tweets",
+                records=chunk,
+                columns=(
+                    "id",
+                    "user_id",
+                    "create_date",
+                    "tweet_data",
+                    "like_count",
+                    "fanned_out",
+                ),
+            )
+            await connection.copy_records_to_table(
+                "likes", records=like_rows, columns=("user_id", "tweet_id")
+            )
+            await connection.copy_records_to_table(
+                "tweet_hashtags",
+                records=hashtag_rows,
+                columns=("tweet_id", "tag", "create_date"),
+            )
+            await connection.copy_records_to_table(
+                "tweet_mentions",
+                records=mention_rows,
+                columns=("tweet_id", "user_id", "create_date"),
+            )
+            like_count += len(like_rows)
+            like_rows.clear()
+            hashtag_rows.clear()
+            mention_rows.clear()
+        logger.info(
+            "Tweets and %s likes copied in %.1fs",
+            like_count,
+            perf_counter() - started,
+        )
+
+        for table in ("users", "tweets", "likes"):
+            await connection.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 1) FROM {table}))"
+            )
+        await fill_user_counters(connection)
+        logger.info("Counters filled in %.1fs", perf_counter() - started)
+        await connection.execute("ANALYZE")
+        if args.timelines:
+            await materialize_home_timelines(connection, args.users)
+            logger.info(
+                "Home timelines built in %.1fs", perf_counter() - started
+            )
+            await connection.execute("ANALYZE home_timeline")
+        await sa_connection.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--tweets", type=int, default=10_000_000)
+    parser.add_argument(
+        "--follows", type=float, default=50, help="Mean follows per user"
+    )
+    parser.add_argument(
+        "--likes", type=float, default=2, help="Mean likes per tweet"
+    )
+    parser.add_argument(
+        "--exponent",
+        type=float,
+        default=1.1,
+        help="Power law exponent of popularity",
+    )
+    parser.add_argument(
+        "--tags", type=int, default=1000, help="Distinct hashtags"
+    )
+    parser.add_argument(
+        "--tagged", type=float, default=0.3, help="Share of tagged tweets"
+    )
+    parser.add_argument(
+        "--mentioned",
+        type=float,
+        default=0.1,
+        help="Share of tweets mentioning a user",
+    )
+    parser.add_argument(
+        "--days", type=int, default=365, help="Time span of the tweets"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--no-timelines",
+        dest="timelines",
+        action="store_false",
+        help="Skip building the home timelines",
+    )
+    parser.add_argument(
+        "--reset", action="store_true", help="Truncate seeded tables first"
+    )
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(seed(parser.parse_args()))
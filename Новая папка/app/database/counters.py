@@ -0,0 +1,199 @@
+from typing import Iterable, Tuple
+
+from models.likes import Like
+from models.tweets import Tweet
+from models.users import User, user_to_user
+from sqlalchemy import CTE, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+COUNTERS = (
+    "follower_count",
+    "following_count",
+    "tweet_count",
+    "received_like_count",
+)
+
+
+async def lock_users(session: AsyncSession, user_ids: Iterable[int]) -> None:
+    """
+    Lock the users rows whose counters the transaction is about to move.
+
+    An UPDATE locks its rows in whatever order it reaches them, so two
+    writes moving the counters of the same users, like follows A->B and
+    B->A, could lock them in opposite orders and deadlock. Every counter
+    write locks its users here first, in id order, before any other row
+    it changes.
+    """
+    await session.execute(
+        select(User.id)
+        .where(User.id.in_(set(user_ids)))
+        .order_by(User.id)
+        .with_for_update()
+    )
+
+
+async def lock_authors(
+    session: AsyncSession, tweet_ids: Iterable[int]
+) -> None:
+    """Lock the authors of the tweets, see `lock_users`"""
+    await session.execute(
+        select(User.id)
+        .where(
+            User.id.in_(
+                select(Tweet.user_id).where(Tweet.id.in_(set(tweet_ids)))
+            )
+        )
+        .order_by(User.id)
+        .with_for_update()
+    )
+
+
+def count_follows(
+    follows: CTE, follower_id: int, delta: int
+) -> Tuple[CTE, CTE]:
+    """
+    Build the UPDATEs moving the follow counters by `delta` for every
+    follow of the follower in `follows`, to run in the statement that
+    inserted or deleted the follows, once `lock_users` locked them.
+    :param follows: CTE returning the following_id of the changed follows.
+    :param follower_id: The user who followed or unfollowed.
+    :param delta: 1 for new follows, -1 for removed ones.
+    :return: The CTEs updating the followed users and the follower.
+    """
+    followed = (
+        update(User)
+        .where(User.id.in_(select(follows.c.following_id)))
+        .values(follower_count=User.follower_count + delta)
+        .returning(User.id)
+        .cte()
+    )
+    changed = select(func.count()).select_from(follows).scalar_subquery()
+    follower = (
+        update(User)
+        .where(User.id == follower_id, changed > 0)
+        .values(following_count=User.following_count + changed * delta)
+        .returning(User.id)
+        .cte()
+    )
+    return followed, follower
+
+
+def credit_likes(tweets: CTE, delta: int) -> CTE:
+    """
+    Build the UPDATE moving the received like counter of the authors by
+    `delta` for every tweet in `tweets`, to run in the statement that
+    changed the like_count of the tweets, once `lock_authors` locked
+    the authors.
+    :param tweets: CTE returning the user_id of the liked tweets.
+    :param delta: 1 for new likes, -1 for removed ones.
+    """
+    authors = (
+        select(tweets.c.user_id, func.count().label("tweets"))
+        .group_by(tweets.c.user_id)
+        .subquery()
+    )
+    return (
+        update(User)
+        .where(User.id == authors.c.user_id)
+        .values(
+            received_like_count=User.received_like_count
+            + authors.c.tweets * delta
+        )
+        .returning(User.id)
+        .cte()
+    )
+
+
+async def count_new_tweet(session: AsyncSession, author_id: int) -> None:
+    await session.execute(
+        update(User)
+        .where(User.id == author_id)
+        .values(tweet_count=User.tweet_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def uncount_tweet(session: AsyncSession, tweet_id: int) -> None:
+    """
+    Take a tweet about to be deleted, and the likes it received, off the
+    counters of its author. Likes lock the author before the tweet, so
+    this runs before the tweet is deleted.
+    """
+    await session.execute(
+        update(User)
+        .where(User.id == Tweet.user_id, Tweet.id == tweet_id)
+        .values(
+            tweet_count=User.tweet_count - 1,
+            received_like_count=User.received_like_count - Tweet.like_count,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def repair_counters(
+    session: AsyncSession, after_id: int, batch_size: int
+) -> Tuple[int, int]:
+    """
+    Recompute the counters of the next batch of users from the rows they
+    count, and fix the ones that drifted.
+
+    The users of the batch are locked in id order like every counter
+    write does, so no write moves their counters while they are
+    recomputed.
+    :param after_id: Id of the last user of the previous batch.
+    :param batch_size: Number of users in the batch.
+    :return: Id of the last user of the batch, 0 when no user is left,
+    and the number of users whose counters were fixed.
+    """
+    query = await session.execute(
+        select(User.id)
+        .where(User.id > after_id)
+        .order_by(User.id)
+        .limit(batch_size)
+        .with_for_update()
+    )
+    user_ids = query.scalars().all()
+    if not user_ids:
+        return 0, 0
+
+    actual = (
+        select(
+            User.id,
+            select(func.count())
+            .where(user_to_user.c.following_id == User.id)
+            .scalar_subquery()
+            .label("follower_count"),
+            select(func.count())
+            .where(user_to_user.c.follower_id == User.id)
+            .scalar_subquery()
+            .label("following_count"),
+            select(func.count())
+            .where(Tweet.user_id == User.id)
+            .scalar_subquery()
+            .label("tweet_count"),
+            select(func.count())
+            .select_from(Like)
+            .join(Tweet, Tweet.id == Like.tweet_id)
+            .where(Tweet.user_id == User.id)
+            .scalar_subquery()
+            .label("received_like_count"),
+        )
+        .where(User.id.between(user_ids[0], user_ids[-1]))
+        .subquery()
+    )
+    repaired = await session.execute(
+        update(User)
+        .where(
+            User.id == actual.c.id,
+            or_(
+                *(
+                    getattr(User, counter) != actual.c[counter]
+                    for counter in COUNTERS
+                )
+            ),
+        )
+        .values({counter: actual.c[counter] for counter in COUNTERS})
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    )
+    return user_ids[-1], len(repaired.all())
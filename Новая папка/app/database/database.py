@@ -1,28 +1,81 @@
 import os
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
+from database.pool import MeteredQueuePool
+from database.query_stats import instrument_engine
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
+    AsyncEngine,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from utils.settings import (
+    DB_ECHO,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_STATEMENT_CACHE_SIZE,
+)
 
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
-DATABASE_URL = (
-    f'postgresql+asyncpg://{os.environ.get("DB_USERNAME")}:'
-    f'{os.environ.get("DB_PASSWORD")}@{os.environ.get("DB_HOST")}'
-    f':5432/{os.environ.get("DB_NAME")}'
-)
-engine = create_async_engine(DATABASE_URL, echo=True, future=True)
+def get_database_url(host: Optional[str]) -> str:
+    return (
+        f'postgresql+asyncpg://{os.environ.get("DB_USERNAME")}:'
+        f'{os.environ.get("DB_PASSWORD")}@{host}'
+        f':5432/{os.environ.get("DB_NAME")}'
+    )
+
+
+def create_engine_from_settings(
+    host: Optional[str], name: str = "primary"
+) -> AsyncEngine:
+    """
+    Create an engine for the given database host, configured from the
+    DB_* settings. Its statements are counted by `track_queries`, its
+    pool metrics are labelled with `name`.
+    """
+    engine = create_async_engine(
+        get_database_url(host),
+        echo=DB_ECHO,
+        poolclass=MeteredQueuePool,
+        pool_logging_name=name,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            # asyncpg's own cache and the one SQLAlchemy keeps on top of
+            # it, both have to be 0 behind pgbouncer in transaction mode.
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        },
+    )
+    instrument_engine(engine)
+    return engine
+
+
+DATABASE_URL = get_database_url(os.environ.get("DB_HOST"))
+engine = create_engine_from_settings(os.environ.get("DB_HOST"))
 session = async_sessionmaker(engine, expire_on_commit=False)
 
+# Reads that tolerate replication lag go to the replica, when there is one.
+read_engine = engine
+if os.environ.get("DB_REPLICA_HOST"):
+    read_engine = create_engine_from_settings(
+        os.environ.get("DB_REPLICA_HOST"), name="replica"
+    )
+read_session = async_sessionmaker(read_engine, expire_on_commit=False)
+
 
 async def async_get_db() -> AsyncGenerator[AsyncSession, None]:
     async_session = session
@@ -32,3 +85,10 @@ async def async_get_db() -> AsyncGenerator[AsyncSession, None]:
             await db.commit()
         except SQLAlchemyError:
             await db.rollback()
+
+
+async def async_get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Session for read-only routes, bound to the replica if configured"""
+    async_session = read_session
+    async with async_session() as db:
+        yield db
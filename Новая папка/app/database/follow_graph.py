@@ -0,0 +1,150 @@
+"""
+Process-local copy of the follow graph, see utils.follow_graph.
+
+Every worker loads user_to_user at startup and keeps its copy current
+with the notifications the follow statements send on CHANNEL when they
+commit, its own included. Postgres delivers them in commit order, the
+order the graph must apply them in. Until the notification of a write
+arrives, readers of the users it changed fall back to SQL.
+"""
+
+import asyncio
+import logging
+import os
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence
+
+import asyncpg
+from database.database import get_database_url
+from database.versions import USER_SCOPE_PREFIX, user_scope
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.follow_graph import FollowEdit, FollowGraph
+from utils.settings import (
+    FOLLOW_GRAPH_DB_HOST,
+    FOLLOW_GRAPH_MAX_EDITS,
+    FOLLOW_GRAPH_RETRY_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "follow_graph"
+LOAD_CHUNK_SIZE = 50_000
+
+_graph: Optional[FollowGraph] = None
+# Edits received while a new graph loads, applied to it once loaded.
+_pending: Optional[List[FollowEdit]] = None
+_wake_up: Optional[asyncio.Event] = None
+
+
+def get_follow_graph(user_id: int, version: int) -> Optional[FollowGraph]:
+    """
+    The follow graph of this worker, if it has every follow change of the
+    user up to `version` of user_scope(user_id). Otherwise, or while the
+    graph loads, None and the caller reads the follows with SQL.
+    """
+    if _graph is not None and _graph.version(user_id) >= version:
+        return _graph
+    return None
+
+
+def apply_follow_edit(edit: FollowEdit) -> None:
+    """Apply a notified edit to the graph of this worker"""
+    if _pending is not None:
+        _pending.append(edit)
+    if _graph is not None:
+        _graph.apply(edit)
+        if _graph.edits > FOLLOW_GRAPH_MAX_EDITS and _wake_up is not None:
+            _wake_up.set()
+
+
+async def notify_follow_edit(
+    session: AsyncSession,
+    follower_id: int,
+    user_ids: Sequence[int],
+    versions: Dict[str, int],
+    followed: bool,
+) -> None:
+    """
+    Announce follows or unfollows to every worker, Postgres delivers the
+    notification once the transaction commits.
+    :param versions: The versions returned by `bump_versions` for the
+    scopes of the follower and of the users.
+    """
+    edit = FollowEdit(
+        follower=(follower_id, versions[user_scope(follower_id)]),
+        users=tuple(
+            (user_id, versions[user_scope(user_id)]) for user_id in user_ids
+        ),
+        followed=followed,
+    )
+    await session.execute(select(func.pg_notify(CHANNEL, edit.dumps())))
+
+
+async def load_follow_graph(connection: asyncpg.Connection) -> FollowGraph:
+    """Read the follows and the versions of the user scopes at once"""
+    graph = FollowGraph()
+    async with connection.transaction(
+        isolation="repeatable_read", readonly=True
+    ):
+        versions = await connection.fetch(
+            "SELECT substr(scope, $1)::int, version FROM data_versions "
+            "WHERE scope LIKE $2",
+            len(USER_SCOPE_PREFIX) + 1,
+            f"{USER_SCOPE_PREFIX}%",
+        )
+        graph.set_versions(versions)
+        # An index-only scan of the primary key, in the order of the rows.
+        cursor = await connection.cursor(
+            "SELECT follower_id, following_id FROM user_to_user "
+            "ORDER BY follower_id, following_id"
+        )
+        while edges := await cursor.fetch(LOAD_CHUNK_SIZE):
+            graph.extend(edges)
+    return graph
+
+
+def _on_notification(connection, pid, channel, payload: str) -> None:
+    apply_follow_edit(FollowEdit.loads(payload))
+
+
+async def run_follow_graph() -> None:
+    """
+    Background task started with the application: loads the graph, then
+    applies the notifications to it. The graph is loaded again once
+    FOLLOW_GRAPH_MAX_EDITS edits piled up on top of it, the previous one
+    serves meanwhile. When the listener loses its connection the graph
+    is dropped and loaded again after FOLLOW_GRAPH_RETRY_INTERVAL.
+    """
+    global _graph, _pending, _wake_up
+    _wake_up = asyncio.Event()
+    host = FOLLOW_GRAPH_DB_HOST or os.environ.get("DB_HOST")
+    dsn = get_database_url(host).replace("+asyncpg", "")
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            connection.add_termination_listener(lambda _: _wake_up.set())
+            await connection.add_listener(CHANNEL, _on_notification)
+            while not connection.is_closed():
+                started = perf_counter()
+                _pending = []
+                graph = await load_follow_graph(connection)
+                for edit in _pending:
+                    graph.apply(edit)
+                _graph, _pending = graph, None
+                logger.info(
+                    "Follow graph of %s follows loaded in %.1fs",
+                    len(graph),
+                    perf_counter() - started,
+                )
+                _wake_up.clear()
+                await _wake_up.wait()
+            logger.warning("Follow graph lost its connection")
+        except Exception:
+            logger.exception("Follow graph failed")
+        finally:
+            _graph = _pending = None
+            if connection is not None:
+                await connection.close()
+        await asyncio.sleep(FOLLOW_GRAPH_RETRY_INTERVAL)
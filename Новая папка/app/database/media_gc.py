@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from datetime import timedelta
+from time import monotonic
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from database.database import session as async_session
+from database.utils import release_media_references
+from models.media import Media, MediaFile
+from sqlalchemy import Integer, String, column, delete, func, select, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.file_utils import discard_file
+from utils.images import get_variant_path
+from utils.settings import (
+    IMAGE_VARIANT_SIZES,
+    MEDIA_GC_BATCH_SIZE,
+    MEDIA_GC_CONCURRENCY,
+    MEDIA_GC_INTERVAL,
+    MEDIA_ORPHAN_MAX_AGE,
+    MEDIA_ORPHAN_SWEEP_INTERVAL,
+    MEDIA_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+_wake_up: Optional[asyncio.Event] = None
+
+
+async def claim_deleted_media_files(
+    session: AsyncSession, limit: int
+) -> List[Tuple[str, str]]:
+    """
+    Lock a batch of tombstoned files. Rows locked by another worker are
+    skipped, so every process can run a collector. A row revived by an
+    upload meanwhile fails the conditions, checked again once locked.
+    :return: The hash and path of every claimed file.
+    """
+    query = await session.execute(
+        select(MediaFile.sha256, MediaFile.media_path)
+        .where(MediaFile.deleted_at.is_not(None), MediaFile.ref_count <= 0)
+        .order_by(MediaFile.deleted_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return list(query.tuples())
+
+
+async def purge_media_files(
+    session: AsyncSession, hashes: Sequence[str]
+) -> None:
+    await session.execute(
+        delete(MediaFile)
+        .where(MediaFile.sha256.in_(hashes), MediaFile.ref_count <= 0)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def delete_unattached_media(
+    session: AsyncSession, max_age: timedelta, limit: int
+) -> List[Optional[str]]:
+    """
+    Delete a batch of Media rows that were uploaded but never attached to
+    a tweet.
+    :return: The content hash of every deleted row.
+    """
+    unattached = (
+        select(Media.id)
+        .where(
+            Media.tweet_id.is_(None),
+            Media.created_at < func.now() - max_age,
+        )
+        .order_by(Media.created_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    query = await session.execute(
+        delete(Media)
+        .where(Media.id.in_(unattached.scalar_subquery()))
+        .returning(Media.sha256)
+        .execution_options(synchronize_session=False)
+    )
+    return list(query.scalars())
+
+
+async def remove_stored_file(media_path: str) -> None:
+    await discard_file(MEDIA_PATH / media_path)
+    for variant in IMAGE_VARIANT_SIZES:
+        await discard_file(MEDIA_PATH / get_variant_path(media_path, variant))
+
+
+async def collect_deleted_media(session: AsyncSession) -> int:
+    """
+    Remove the files of one batch of tombstoned rows, then the rows.
+
+    The rows stay locked while their files are removed, and are deleted
+    only after every removal succeeded: after a crash the batch is simply
+    collected again.
+    :return: Number of collected files.
+    """
+    semaphore = asyncio.Semaphore(MEDIA_GC_CONCURRENCY)
+
+    async def remove(media_path: str) -> None:
+        async with semaphore:
+            await remove_stored_file(media_path)
+
+    claimed = await claim_deleted_media_files(session, MEDIA_GC_BATCH_SIZE)
+    if claimed:
+        await asyncio.gather(*(remove(path) for _, path in claimed))
+        await purge_media_files(session, [sha for sha, _ in claimed])
+    await session.commit()
+    return len(claimed)
+
+
+async def sweep_unattached_media(session: AsyncSession) -> int:
+    """
+    Delete media uploaded more than MEDIA_ORPHAN_MAX_AGE seconds ago and
+    never attached to a tweet, in batches of MEDIA_GC_BATCH_SIZE.
+    :return: Number of deleted Media rows.
+    """
+    max_age = timedelta(seconds=MEDIA_ORPHAN_MAX_AGE)
+    swept = 0
+    while True:
+        hashes = await delete_unattached_media(
+            session, max_age, MEDIA_GC_BATCH_SIZE
+        )
+        counts: Dict[str, int] = dict()
+        for sha in hashes:
+            if sha is not None:
+                counts[sha] = counts.get(sha, 0) + 1
+        if counts:
+            references = values(
+                column("sha256", String),
+                column("references", Integer),
+                name="references",
+            ).data(list(counts.items()))
+            await release_media_references(session, references)
+        await session.commit()
+        swept += len(hashes)
+        if len(hashes) < MEDIA_GC_BATCH_SIZE:
+            return swept
+
+
+def wake_media_collector() -> None:
+    """Make the collector run now instead of at its next interval"""
+    if _wake_up is not None:
+        _wake_up.set()
+
+
+async def run_media_collector() -> None:
+    """
+    Background task started with the application: collects tombstoned
+    files every MEDIA_GC_INTERVAL seconds or when woken up, and sweeps
+    unattached media every MEDIA_ORPHAN_SWEEP_INTERVAL seconds.
+    """
+    global _wake_up
+    _wake_up = asyncio.Event()
+    next_sweep = monotonic()
+    while True:
+        try:
+            async with async_session() as db:
+                if monotonic() >= next_sweep:
+                    next_sweep = monotonic() + MEDIA_ORPHAN_SWEEP_INTERVAL
+                    swept = await sweep_unattached_media(db)
+                    if swept:
+                        logger.info("Swept %s unattached media", swept)
+                while await collect_deleted_media(db) == MEDIA_GC_BATCH_SIZE:
+                    pass
+        except Exception:
+            logger.exception("Media collection failed")
+
+        try:
+            await asyncio.wait_for(_wake_up.wait(), MEDIA_GC_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake_up.clear()
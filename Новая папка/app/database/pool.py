@@ -0,0 +1,41 @@
+from time import perf_counter
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from utils.metrics import (
+    DB_POOL_CAPACITY,
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CHECKOUT_WAIT,
+)
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    """
+    Queue pool exporting its saturation: connections checked out against
+    its capacity, and the time callers waited for a connection. Metrics
+    are labelled with the pool logging name.
+    """
+
+    def __init__(self, *args, pool_size=5, max_overflow=10, **kwargs):
+        super().__init__(
+            *args, pool_size=pool_size, max_overflow=max_overflow, **kwargs
+        )
+        self.engine_label = self.logging_name or "default"
+        DB_POOL_CAPACITY.labels(self.engine_label).set(
+            pool_size + max(max_overflow, 0)
+        )
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            connection = super()._do_get()
+        finally:
+            # Timed out checkouts are the ones that matter most.
+            DB_POOL_CHECKOUT_WAIT.labels(self.engine_label).observe(
+                perf_counter() - started
+            )
+        DB_POOL_CHECKED_OUT.labels(self.engine_label).inc()
+        return connection
+
+    def _do_return_conn(self, record) -> None:
+        DB_POOL_CHECKED_OUT.labels(self.engine_label).dec()
+        super()._do_return_conn(record)
@@ -0,0 +1,96 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterator, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+_LITERAL = re.compile(r"\$\d+|%\(\w+\)s|'(?:[^']|'')*'|\b\d+\b")
+_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+class QueryStats:
+    """Number, total time and fingerprints of the statements executed"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter[str] = Counter()
+
+    def repeated(self, threshold: int) -> Dict[str, int]:
+        """
+        Fingerprints executed at least `threshold` times, the mark of a
+        query run in a loop (N+1) instead of once for the whole batch.
+        """
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= threshold
+        }
+
+
+_trackers: ContextVar[Tuple[QueryStats, ...]] = ContextVar(
+    "query_stats", default=()
+)
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Reduce a statement to its shape: parameters and literals become "?"
+    and expanded IN lists a single "?", so the same query with other
+    values gets the same fingerprint.
+    """
+    statement = _LIST.sub("?", _LITERAL.sub("?", statement))
+    return " ".join(statement.split())
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """
+    Record the statements executed by instrumented engines in the current
+    context, including nested ones, into a new QueryStats.
+    """
+    stats = QueryStats()
+    token = _trackers.set((*_trackers.get(), stats))
+    try:
+        yield stats
+    finally:
+        _trackers.reset(token)
+
+
+def _before_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    if _trackers.get():
+        connection.info.setdefault("query_started", []).append(perf_counter())
+
+
+def _after_cursor_execute(
+    connection, cursor, statement, parameters, context, executemany
+):
+    trackers = _trackers.get()
+    if not trackers:
+        return
+    duration = perf_counter() - connection.info["query_started"].pop()
+    statement_fingerprint = fingerprint(statement)
+    for stats in trackers:
+        stats.count += 1
+        stats.duration += duration
+        stats.statements[statement_fingerprint] += 1
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Feed the statements of the engine to `track_queries`"""
+    sync_engine = engine.sync_engine
+    if not event.contains(
+        sync_engine, "before_cursor_execute", _before_cursor_execute
+    ):
+        event.listen(
+            sync_engine, "before_cursor_execute", _before_cursor_execute
+        )
+        event.listen(
+            sync_engine, "after_cursor_execute", _after_cursor_execute
+        )
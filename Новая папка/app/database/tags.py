@@ -0,0 +1,105 @@
+from typing import Optional
+
+from models.tags import HASHTAG_MAX_LENGTH, TweetHashtag, TweetMention
+from models.tweets import Tweet
+from models.users import User
+from sqlalchemy import Select, String, delete, desc, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.pagination import keyset_conditions
+from utils.tweet_text import extract_hashtags, extract_mentions
+
+
+async def index_tweet_entities(session: AsyncSession, tweet: Tweet) -> None:
+    """
+    Record the hashtags and mentions of a freshly flushed tweet, so tag
+    and mention pages never parse tweet text. Mentions of unknown users
+    are dropped by the same statement that records the others.
+    """
+    tags = extract_hashtags(tweet.tweet_data, HASHTAG_MAX_LENGTH)
+    if tags:
+        tagged = select(
+            literal(tweet.id),
+            func.unnest(literal(tags, ARRAY(String))),
+            literal(tweet.create_date),
+        )
+        await session.execute(
+            insert(TweetHashtag)
+            .from_select(["tweet_id", "tag", "create_date"], tagged)
+            .on_conflict_do_nothing()
+        )
+
+    usernames = extract_mentions(tweet.tweet_data)
+    if usernames:
+        mentioned = select(
+            literal(tweet.id), User.id, literal(tweet.create_date)
+        ).where(User.username.in_(usernames))
+        await session.execute(
+            insert(TweetMention)
+            .from_select(["tweet_id", "user_id", "create_date"], mentioned)
+            .on_conflict_do_nothing()
+        )
+
+
+async def remove_tweet_entities(session: AsyncSession, tweet_id: int) -> None:
+    for model in (TweetHashtag, TweetMention):
+        await session.execute(
+            delete(model)
+            .where(model.tweet_id == tweet_id)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def tag_candidates(
+    tag: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+) -> Select:
+    """
+    Select ids of at most `limit + 1` tweets with the hashtag, a range
+    scan over the tag index. The caller pages the tweets they point to.
+    """
+    return (
+        select(
+            TweetHashtag.tweet_id.label("tweet_id"),
+            TweetHashtag.create_date,
+        )
+        .where(
+            TweetHashtag.tag == tag.lower(),
+            *keyset_conditions(
+                TweetHashtag.create_date,
+                TweetHashtag.tweet_id,
+                cursor,
+                since_id,
+            ),
+        )
+        .order_by(desc(TweetHashtag.create_date), desc(TweetHashtag.tweet_id))
+        .limit(limit + 1)
+    )
+
+
+def mention_candidates(
+    user_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+) -> Select:
+    """Select ids of at most `limit + 1` tweets mentioning the user"""
+    return (
+        select(
+            TweetMention.tweet_id.label("tweet_id"),
+            TweetMention.create_date,
+        )
+        .where(
+            TweetMention.user_id == user_id,
+            *keyset_conditions(
+                TweetMention.create_date,
+                TweetMention.tweet_id,
+                cursor,
+                since_id,
+            ),
+        )
+        .order_by(desc(TweetMention.create_date), desc(TweetMention.tweet_id))
+        .limit(limit + 1)
+    )
@@ -0,0 +1,210 @@
+from typing import Optional, Sequence
+
+from models.timeline import HomeTimelineEntry
+from models.tweets import Tweet
+from models.users import user_to_user
+from sqlalchemy import (
+    CompoundSelect,
+    Select,
+    delete,
+    desc,
+    func,
+    literal,
+    select,
+    union_all,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.pagination import keyset_conditions
+from utils.settings import (
+    FANOUT_FOLLOWER_THRESHOLD,
+    HOME_TIMELINE_DEPTH,
+    HOME_TIMELINE_TRIM_INTERVAL,
+)
+
+
+async def should_fan_out(session: AsyncSession, author_id: int) -> bool:
+    """
+    Decide whether a new tweet of the author is pushed to the timelines
+    of the followers. Authors with more followers than the threshold are
+    merged into the timelines at read time instead.
+
+    The count stops at the threshold, so the check costs the same for a
+    celebrity as for everyone else.
+    """
+    followers = (
+        select(literal(1))
+        .where(user_to_user.c.following_id == author_id)
+        .limit(FANOUT_FOLLOWER_THRESHOLD + 1)
+        .subquery()
+    )
+    query = await session.execute(select(func.count()).select_from(followers))
+    return query.scalar_one() <= FANOUT_FOLLOWER_THRESHOLD
+
+
+async def fan_out_tweet(session: AsyncSession, tweet: Tweet) -> None:
+    """
+    Deliver a freshly flushed tweet to the home timelines.
+
+    The author always gets the tweet. The followers get it only if the
+    tweet is marked as fanned out, otherwise they pick it up at read time.
+    """
+    owners = [select(literal(tweet.user_id).label("owner_id"))]
+    if tweet.fanned_out:
+        owners.append(
+            select(user_to_user.c.follower_id).where(
+                user_to_user.c.following_id == tweet.user_id
+            )
+        )
+    audience = union_all(*owners).subquery()
+    entries = select(
+        audience.c.owner_id, literal(tweet.id), literal(tweet.create_date)
+    )
+    await session.execute(
+        insert(HomeTimelineEntry)
+        .from_select(["owner_id", "tweet_id", "create_date"], entries)
+        .on_conflict_do_nothing()
+    )
+
+    if tweet.fanned_out and tweet.id % HOME_TIMELINE_TRIM_INTERVAL == 0:
+        await trim_home_timelines(
+            session,
+            select(user_to_user.c.follower_id).where(
+                user_to_user.c.following_id == tweet.user_id
+            ),
+        )
+
+
+async def trim_home_timelines(
+    session: AsyncSession, owner_ids: Select
+) -> None:
+    """
+    Drop entries beyond HOME_TIMELINE_DEPTH from the given timelines.
+
+    Trimming a large audience reads up to the full depth of every
+    timeline, so fan-out only does it for one tweet in
+    HOME_TIMELINE_TRIM_INTERVAL: timelines may temporarily exceed the
+    depth by about that many entries.
+    """
+    ranked = (
+        select(
+            HomeTimelineEntry.owner_id,
+            HomeTimelineEntry.tweet_id,
+            func.row_number()
+            .over(
+                partition_by=HomeTimelineEntry.owner_id,
+                order_by=(
+                    desc(HomeTimelineEntry.create_date),
+                    desc(HomeTimelineEntry.tweet_id),
+                ),
+            )
+            .label("position"),
+        )
+        .where(HomeTimelineEntry.owner_id.in_(owner_ids))
+        .subquery()
+    )
+    stale = (
+        select(ranked.c.owner_id, ranked.c.tweet_id)
+        .where(ranked.c.position > HOME_TIMELINE_DEPTH)
+        .subquery()
+    )
+    await session.execute(
+        delete(HomeTimelineEntry)
+        .where(
+            HomeTimelineEntry.owner_id == stale.c.owner_id,
+            HomeTimelineEntry.tweet_id == stale.c.tweet_id,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def backfill_home_timeline(
+    session: AsyncSession, owner_id: int, author_ids: Sequence[int]
+) -> None:
+    """
+    Copy the most recent fanned out tweets of newly followed authors
+    into the timeline of the follower.
+    """
+    recent_tweets = (
+        select(literal(owner_id), Tweet.id, Tweet.create_date)
+        .where(Tweet.user_id.in_(author_ids), Tweet.fanned_out.is_(True))
+        .order_by(desc(Tweet.create_date), desc(Tweet.id))
+        .limit(HOME_TIMELINE_DEPTH)
+    )
+    await session.execute(
+        insert(HomeTimelineEntry)
+        .from_select(["owner_id", "tweet_id", "create_date"], recent_tweets)
+        .on_conflict_do_nothing()
+    )
+    await trim_home_timelines(session, select(literal(owner_id)))
+
+
+async def retract_home_timeline(
+    session: AsyncSession, owner_id: int, author_id: int
+) -> None:
+    """Remove tweets of an unfollowed author from the follower timeline"""
+    await session.execute(
+        delete(HomeTimelineEntry)
+        .where(
+            HomeTimelineEntry.owner_id == owner_id,
+            HomeTimelineEntry.tweet_id == Tweet.id,
+            Tweet.user_id == author_id,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def remove_tweet_from_timelines(
+    session: AsyncSession, tweet_id: int
+) -> None:
+    await session.execute(
+        delete(HomeTimelineEntry)
+        .where(HomeTimelineEntry.tweet_id == tweet_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def home_timeline_candidates(
+    owner_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+) -> CompoundSelect:
+    """
+    Select ids of at most `limit + 1` tweets from each source of the home
+    timeline: the materialized entries of the owner, and the tweets of
+    followed authors that were not fanned out. Both branches are bounded
+    index range scans, the caller orders and limits the union.
+    """
+    pushed = (
+        select(
+            HomeTimelineEntry.tweet_id.label("tweet_id"),
+            HomeTimelineEntry.create_date.label("create_date"),
+        )
+        .where(
+            HomeTimelineEntry.owner_id == owner_id,
+            *keyset_conditions(
+                HomeTimelineEntry.create_date,
+                HomeTimelineEntry.tweet_id,
+                cursor,
+                since_id,
+            ),
+        )
+        .order_by(
+            desc(HomeTimelineEntry.create_date),
+            desc(HomeTimelineEntry.tweet_id),
+        )
+        .limit(limit + 1)
+    )
+    pulled = (
+        select(Tweet.id.label("tweet_id"), Tweet.create_date)
+        .join(user_to_user, user_to_user.c.following_id == Tweet.user_id)
+        .where(
+            user_to_user.c.follower_id == owner_id,
+            Tweet.fanned_out.is_(False),
+            *keyset_conditions(Tweet.create_date, Tweet.id, cursor, since_id),
+        )
+        .order_by(desc(Tweet.create_date), desc(Tweet.id))
+        .limit(limit + 1)
+    )
+    return union_all(pushed.subquery().select(), pulled.subquery().select())
@@ -1,12 +1,68 @@
-from typing import List
-
+from pathlib import Path
+from typing import (
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from database.counters import (
+    count_follows,
+    credit_likes,
+    lock_authors,
+    lock_users,
+)
 from database.database import async_get_db, engine
+from database.follow_graph import get_follow_graph
+from database.tags import mention_candidates, tag_candidates
+from database.timeline import home_timeline_candidates
 from fastapi import Depends, HTTPException, status
-from models.media import Media
-from models.users import Base, Like, Tweet, User
-from sqlalchemy import and_, desc, or_, select
+from models.media import Media, MediaFile
+from models.tweets import SEARCH_CONFIG
+from models.users import Base, Like, Tweet, User, user_to_user
+from sqlalchemy import (
+    REAL,
+    FromClause,
+    Select,
+    case,
+    cast,
+    delete,
+    desc,
+    exists,
+    func,
+    literal,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from utils.file_utils import SavedFile
+from utils.pagination import (
+    decode_rank_cursor,
+    decode_user_cursor,
+    encode_cursor,
+    encode_rank_cursor,
+    encode_user_cursor,
+    keyset_conditions,
+)
+from utils.settings import SEARCH_CANDIDATES
+from utils.single_flight import SingleFlight
+
+# Shared by the timeline reads, its stats show how many were coalesced.
+timeline_flight: SingleFlight[Tuple[Sequence[Tweet], Optional[str]]] = (
+    SingleFlight("timeline")
+)
+
+ALEMBIC_CONFIG_PATH = Path(__file__).resolve().parent.parent / "alembic.ini"
 
 
 async def init_models():
@@ -14,6 +70,31 @@ async def init_models():
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def check_schema_revision():
+    """
+    Make sure the database is migrated to the latest revision.
+    Migrations are applied by `alembic upgrade head` before the workers
+    start, the workers themselves never change the schema.
+    :raises: RuntimeError if the database is at another revision.
+    """
+    config = Config(ALEMBIC_CONFIG_PATH)
+    config.set_main_option(
+        "script_location", str(ALEMBIC_CONFIG_PATH.parent / "migrations")
+    )
+    head = ScriptDirectory.from_config(config).get_current_head()
+    async with engine.connect() as conn:
+        current = await conn.run_sync(
+            lambda sync_conn: MigrationContext.configure(
+                sync_conn
+            ).get_current_revision()
+        )
+    if current != head:
+        raise RuntimeError(
+            f"Database schema is at revision {current}, expected {head}. "
+            "Run `alembic upgrade head`."
+        )
+
+
 async def create_test_user_if_not_exist(session_: AsyncSession):
     query = select(User).where(User.api_key == "test")
     user_query = await session_.execute(query)
@@ -24,57 +105,115 @@ async def create_test_user_if_not_exist(session_: AsyncSession):
         await session_.commit()
 
 
+def get_identity_map(session: AsyncSession) -> Dict[int, User]:
+    """
+    Users already loaded during the current request.
+
+    The session lives exactly as long as the request, so its `info`
+    dictionary is used as a request-scoped identity map.
+    """
+    return session.info.setdefault("users", dict())
+
+
+def get_username_map(session: AsyncSession) -> Dict[int, str]:
+    """Usernames already fetched during the current request"""
+    return session.info.setdefault("usernames", dict())
+
+
+def remember_user(session: AsyncSession, user: User) -> User:
+    get_identity_map(session)[user.id] = user
+    get_username_map(session)[user.id] = user.username
+    return user
+
+
 async def get_user_by_api_key(
     api_key: str, session: AsyncSession = Depends(async_get_db)
 ):
-    query = (
-        select(User)
-        .where(User.api_key == api_key)
-        .options(
-            selectinload(User.following),
-            selectinload(User.followers),
-        )
-    )
+    """Get id and username of the owner of the api key, or None"""
+    query = select(User.id, User.username).where(User.api_key == api_key)
     user = await session.execute(query)
+    current_user = user.one_or_none()
+    if current_user is not None:
+        get_username_map(session)[current_user.id] = current_user.username
 
-    return user.scalar_one_or_none()
+    return current_user
 
 
 async def get_user_by_id(
     user_id: int, session: AsyncSession = Depends(async_get_db)
 ):
-    query = await session.execute(
-        select(User)
-        .where(User.id == user_id)
-        .options(
-            selectinload(User.following),
-            selectinload(User.followers),
-        )
-    )
+    user = get_identity_map(session).get(user_id)
+    if user is not None:
+        return user
+
+    query = await session.execute(select(User).where(User.id == user_id))
     user = query.scalars().one_or_none()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User does not exist.",
         )
-    return user
+    return remember_user(session, user)
 
 
-async def check_follow_user_ability(
-    current_user: User,
-    user_being_followed: User,
-) -> bool:
-    """Check if the following requests matches all the criteria"""
+class Profile(NamedTuple):
+    """The id, username and counters of a user"""
 
-    if user_being_followed.id == current_user.id:
+    id: int
+    username: str
+    follower_count: int
+    following_count: int
+    tweet_count: int
+    received_like_count: int
+
+
+async def get_user_profile(session: AsyncSession, user_id: int) -> Profile:
+    """
+    Get the id, username and counters of a user with one query. The
+    counters are read from the users row, never counted.
+    """
+    query = await session.execute(
+        select(
+            User.id,
+            User.username,
+            User.follower_count,
+            User.following_count,
+            User.tweet_count,
+            User.received_like_count,
+        ).where(User.id == user_id)
+    )
+    row = query.one_or_none()
+    if row is None:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Unable to follow yourself",
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User does not exist.",
         )
+    profile = Profile._make(row)
+    get_username_map(session)[profile.id] = profile.username
+    return profile
+
+
+async def get_usernames_by_ids(
+    session: AsyncSession, user_ids: Iterable[int]
+) -> Dict[int, str]:
+    """
+    Resolve usernames for a batch of users with at most one query.
 
-    elif user_being_followed in current_user.following:
-        return False
-    return True
+    Args:
+        session (AsyncSession): The SQLAlchemy session.
+        user_ids (Iterable[int]): Ids of the users to resolve.
+
+    Returns:
+        Mapping of user id to username for every user that exists.
+    """
+    usernames = get_username_map(session)
+    missing_ids = set(user_ids).difference(usernames)
+    if missing_ids:
+        query = await session.execute(
+            select(User.id, User.username).where(User.id.in_(missing_ids))
+        )
+        usernames.update(query.tuples().all())
+    return usernames
 
 
 async def associate_media_with_tweet(
@@ -103,21 +242,129 @@ async def associate_media_with_tweet(
     session.add_all(media_objects)
 
 
-async def get_media_by_tweet_id(
-    tweet_id: int, session: AsyncSession = Depends(async_get_db)
-):
+async def add_media_file_reference(
+    session: AsyncSession, saved_file: SavedFile
+) -> Tuple[str, bool]:
+    """
+    Register one more reference to a stored file, creating its row on the
+    first upload of the content.
+
+    Args:
+        session (Session): The SQLAlchemy session.
+        saved_file (SavedFile): The received upload.
+
+    Returns:
+        The path the content is stored at, and whether this is the first
+        reference to it. Identical content uploaded under another
+        extension keeps the path of the first upload.
+    """
+    references = await add_media_file_references(session, [saved_file])
+    return references[saved_file.sha256]
+
+
+async def add_media_file_references(
+    session: AsyncSession, saved_files: Sequence[SavedFile]
+) -> Dict[str, Tuple[str, bool]]:
+    """
+    Register references to a batch of stored files with one statement.
+
+    Args:
+        session (Session): The SQLAlchemy session.
+        saved_files (Sequence[SavedFile]): The received uploads, the same
+            content may appear several times.
+
+    Returns:
+        Mapping of the SHA-256 hash of every file to the path its content
+        is stored at, and whether the batch holds its first references.
     """
-    Get all Media objects associate with Tweet.
+    files_by_hash: Dict[str, SavedFile] = dict()
+    counts: Dict[str, int] = dict()
+    for saved_file in saved_files:
+        files_by_hash.setdefault(saved_file.sha256, saved_file)
+        counts[saved_file.sha256] = counts.get(saved_file.sha256, 0) + 1
+
+    statement = insert(MediaFile).values(
+        [
+            {
+                "sha256": file_hash,
+                "media_path": saved_file.path,
+                "size": saved_file.size,
+                "ref_count": counts[file_hash],
+            }
+            for file_hash, saved_file in files_by_hash.items()
+        ]
+    )
+    query = await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[MediaFile.sha256],
+            # A tombstoned file is revived. Its row is locked while the
+            # collector removes the file, so the upsert waits and then
+            # inserts a fresh row.
+            set_={
+                "ref_count": MediaFile.ref_count
+                + statement.excluded.ref_count,
+                "deleted_at": None,
+            },
+        ).returning(
+            MediaFile.sha256, MediaFile.media_path, MediaFile.ref_count
+        )
+    )
+    return {
+        file_hash: (media_path, ref_count == counts[file_hash])
+        for file_hash, media_path, ref_count in query.tuples()
+    }
+
+
+async def release_media_of_tweet(
+    session: AsyncSession, tweet_id: int
+) -> List[str]:
+    """
+    Drop the references the media of a tweet hold on stored files.
 
     Args:
         session (Session): The SQLAlchemy session.
         tweet_id (int): The Tweet object id.
+
+    Returns:
+        Hashes of the files that lost their last reference. Their rows are
+        tombstoned, the media collector removes the files.
     """
-    media_query = await session.execute(
-        select(Media).filter(Media.tweet_id == tweet_id)
+    references = (
+        select(Media.sha256, func.count().label("references"))
+        .where(Media.tweet_id == tweet_id, Media.sha256.is_not(None))
+        .group_by(Media.sha256)
+        .subquery()
     )
-    media_objects = media_query.scalars().all()
-    return media_objects
+    return await release_media_references(session, references)
+
+
+async def release_media_references(
+    session: AsyncSession, references: FromClause
+) -> List[str]:
+    """
+    Decrease the ref_count of stored files and tombstone the files that
+    lost their last reference.
+
+    Args:
+        session (Session): The SQLAlchemy session.
+        references (FromClause): Rows of (sha256, references) giving the
+            number of references to drop from each file.
+
+    Returns:
+        Hashes of the tombstoned files.
+    """
+    ref_count = MediaFile.ref_count - references.c.references
+    released = await session.execute(
+        update(MediaFile)
+        .where(MediaFile.sha256 == references.c.sha256)
+        .values(
+            ref_count=ref_count,
+            deleted_at=case((ref_count <= 0, func.now()), else_=None),
+        )
+        .returning(MediaFile.sha256, MediaFile.ref_count)
+        .execution_options(synchronize_session=False)
+    )
+    return [sha for sha, ref_count in released.tuples() if ref_count <= 0]
 
 
 async def get_tweet_by_id(
@@ -144,51 +391,548 @@ async def get_tweet_by_id(
     tweet = await session.get(Tweet, tweet_id)
 
     if not tweet:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Tweet was not found!",
-        )
+        raise_tweet_not_found()
     return tweet
 
 
-async def get_all_following_tweets(session: AsyncSession, current_user: User):
-    query = await session.execute(
+async def paginate_tweets(
+    session: AsyncSession,
+    query: Select,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+) -> Tuple[Sequence[Tweet], Optional[str]]:
+    """
+    Fetch one page of tweets ordered from newest to oldest.
+
+    The page is selected by keyset on (create_date, id), so every page is
+    a single bounded index range scan no matter how deep the client is.
+
+    Args:
+        session (AsyncSession): The SQLAlchemy session.
+        query (Select): Base query selecting tweets to paginate.
+        limit (int): Maximum number of tweets on the page.
+        cursor (str, optional): Cursor returned with the previous page,
+            only tweets older than it are returned.
+        since_id (int, optional): Only tweets newer than the tweet with
+            this id are returned.
+
+    Returns:
+        The tweets of the page and the cursor of the next page, which is
+        None when there are no more tweets.
+    """
+    query = query.where(
+        *keyset_conditions(Tweet.create_date, Tweet.id, cursor, since_id)
+    )
+    result = await session.execute(
+        query.order_by(desc(Tweet.create_date), desc(Tweet.id)).limit(
+            limit + 1
+        )
+    )
+    tweets = result.scalars().all()
+
+    next_cursor = None
+    if len(tweets) > limit:
+        tweets = tweets[:limit]
+        last_tweet = tweets[-1]
+        next_cursor = encode_cursor(last_tweet.create_date, last_tweet.id)
+    return tweets, next_cursor
+
+
+async def get_all_following_tweets(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+    version: Hashable = None,
+):
+    """
+    Get a page of the home timeline of the user: tweets of the user and
+    of everyone the user follows.
+
+    Concurrent calls with the same arguments share one query, see
+    `get_all_tweets`.
+    """
+    candidates = home_timeline_candidates(
+        user_id, limit, cursor, since_id
+    ).subquery()
+    query = (
         select(Tweet)
-        .where(
-            or_(
-                Tweet.user_id.in_(uuid.id for uuid in current_user.following),
-                Tweet.user_id == current_user.id,
-            )
+        .join(candidates, Tweet.id == candidates.c.tweet_id)
+        .options(
+            selectinload(Tweet.likes),
+            selectinload(Tweet.media),
         )
+    )
+    return await timeline_flight.do(
+        ("following", user_id, limit, cursor, since_id, version),
+        lambda: paginate_tweets(session, query, limit, cursor, since_id),
+    )
+
+
+async def get_tagged_tweets(
+    session: AsyncSession,
+    tag: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+    version: Hashable = None,
+):
+    """
+    Get a page of the tweets with the hashtag, newest first.
+
+    Concurrent calls with the same arguments share one query, see
+    `get_all_tweets`.
+    """
+    candidates = tag_candidates(tag, limit, cursor, since_id).subquery()
+    query = (
+        select(Tweet)
+        .join(candidates, Tweet.id == candidates.c.tweet_id)
         .options(
-            selectinload(Tweet.user),
             selectinload(Tweet.likes),
             selectinload(Tweet.media),
         )
-        .order_by(desc(Tweet.create_date))
+    )
+    return await timeline_flight.do(
+        ("tag", tag.lower(), limit, cursor, since_id, version),
+        lambda: paginate_tweets(session, query, limit, cursor, since_id),
     )
 
-    return query.scalars().all()
 
+async def get_mentioning_tweets(
+    session: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+    version: Hashable = None,
+):
+    """
+    Get a page of the tweets mentioning the user, newest first.
 
-async def get_all_tweets(session: AsyncSession):
-    query = await session.execute(
+    Concurrent calls with the same arguments share one query, see
+    `get_all_tweets`.
+    """
+    candidates = mention_candidates(
+        user_id, limit, cursor, since_id
+    ).subquery()
+    query = (
         select(Tweet)
+        .join(candidates, Tweet.id == candidates.c.tweet_id)
         .options(
-            selectinload(Tweet.user),
             selectinload(Tweet.likes),
             selectinload(Tweet.media),
         )
-        .order_by(desc(Tweet.create_date))
     )
-    return query.scalars().all()
+    return await timeline_flight.do(
+        ("mentions", user_id, limit, cursor, since_id, version),
+        lambda: paginate_tweets(session, query, limit, cursor, since_id),
+    )
 
 
-async def get_like_by_id(session: AsyncSession, tweet_id: int, user_id: int):
-    """Get a like by user_id and tweet_id, or return None if not found"""
+async def get_all_tweets(
+    session: AsyncSession,
+    limit: int,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+    version: Hashable = None,
+):
+    """
+    Get a page of tweets of all users.
+
+    Concurrent calls with the same arguments share one query. The tweets
+    are loaded by the session of the first caller and are read-only for
+    the others. Callers that read the data version beforehand pass it as
+    `version`, so they never get a page older than that version.
+    """
+    query = select(Tweet).options(
+        selectinload(Tweet.likes),
+        selectinload(Tweet.media),
+    )
+    return await timeline_flight.do(
+        ("all", limit, cursor, since_id, version),
+        lambda: paginate_tweets(session, query, limit, cursor, since_id),
+    )
+
+
+async def search_tweets(
+    session: AsyncSession,
+    text: str,
+    limit: int,
+    cursor: Optional[str] = None,
+) -> Tuple[Sequence[Tweet], Optional[str]]:
+    """
+    Get a page of the tweets matching a web search style query, like
+    `cats -dogs "good boy"`, best ranked first.
+
+    Only the SEARCH_CANDIDATES most recent matches are ranked. For a
+    rare term Postgres reads them from the GIN index, for a common one it
+    walks the tweets by date until it has enough: either way the cost is
+    bounded however many tweets match.
+
+    Returns:
+        The tweets of the page and the cursor of the next page, which is
+        None when there are no more tweets.
+    """
+    ts_query = func.websearch_to_tsquery(cast(SEARCH_CONFIG, REGCONFIG), text)
+    candidates = (
+        select(Tweet.id, Tweet.search_vector)
+        .where(Tweet.search_vector.bool_op("@@")(ts_query))
+        .order_by(desc(Tweet.create_date), desc(Tweet.id))
+        .limit(SEARCH_CANDIDATES)
+        .subquery()
+    )
+    ranked = select(
+        candidates.c.id,
+        func.ts_rank(candidates.c.search_vector, ts_query).label("rank"),
+    ).subquery()
+
+    query = (
+        select(Tweet, ranked.c.rank)
+        .join(ranked, Tweet.id == ranked.c.id)
+        .options(
+            selectinload(Tweet.likes),
+            selectinload(Tweet.media),
+        )
+        .order_by(desc(ranked.c.rank), desc(Tweet.id))
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        rank, tweet_id = decode_rank_cursor(cursor)
+        query = query.where(
+            tuple_(ranked.c.rank, Tweet.id)
+            < tuple_(cast(rank, REAL), tweet_id)
+        )
+    result = await session.execute(query)
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_tweet, last_rank = rows[-1]
+        next_cursor = encode_rank_cursor(last_rank, last_tweet.id)
+    return [tweet for tweet, _ in rows], next_cursor
+
+
+def raise_tweet_not_found():
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Tweet was not found!",
+    )
+
+
+async def add_like(session: AsyncSession, tweet_id: int, user_id: int) -> bool:
+    """
+    Like a tweet with a single statement, once the author of the tweet
+    is locked, see `database.counters.lock_users`.
+
+    The like is inserted with ON CONFLICT DO NOTHING, so concurrent
+    requests can not create duplicates, and the like_count of the tweet
+    and the received like counter of its author are increased in the
+    same statement only when a row was inserted.
+    Users can not like their own tweets.
+
+    Args:
+        session (AsyncSession): The SQLAlchemy session.
+        tweet_id (int): The id of the tweet to like.
+        user_id (int): The id of the user who likes the tweet.
+
+    Returns:
+        True if a new like was added, False if it already existed.
+
+    Raises:
+        HTTPException: If the tweet does not exist.
+    """
+    await lock_authors(session, [tweet_id])
+    target = select(Tweet.id, Tweet.user_id).where(Tweet.id == tweet_id).cte()
+    inserted = (
+        insert(Like)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(literal(user_id), target.c.id).where(
+                target.c.user_id != user_id
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(Like.tweet_id)
+        .cte()
+    )
+    counted = (
+        update(Tweet)
+        .where(Tweet.id.in_(select(inserted.c.tweet_id)))
+        .values(like_count=Tweet.like_count + 1)
+        .returning(Tweet.id, Tweet.user_id)
+        .cte()
+    )
     query = await session.execute(
-        select(Like).where(
-            and_(Like.user_id == user_id, Like.tweet_id == tweet_id)
+        select(
+            select(func.count()).select_from(target).scalar_subquery(),
+            select(func.count()).select_from(counted).scalar_subquery(),
+        ).add_cte(credit_likes(counted, 1))
+    )
+    found, liked = query.one()
+    if not found:
+        raise_tweet_not_found()
+    return bool(liked)
+
+
+async def add_likes(
+    session: AsyncSession, tweet_ids: Sequence[int], user_id: int
+) -> Dict[int, str]:
+    """
+    Like a batch of tweets with a single statement, see `add_like`.
+
+    Args:
+        session (AsyncSession): The SQLAlchemy session.
+        tweet_ids (Sequence[int]): The ids of the tweets to like.
+        user_id (int): The id of the user who likes the tweets.
+
+    Returns:
+        Mapping of every requested tweet id to the outcome: "liked",
+        "already_liked", "own_tweet" or "not_found".
+    """
+    await lock_authors(session, tweet_ids)
+    target = (
+        select(Tweet.id, Tweet.user_id)
+        .where(Tweet.id.in_(set(tweet_ids)))
+        .cte()
+    )
+    inserted = (
+        insert(Like)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(literal(user_id), target.c.id).where(
+                target.c.user_id != user_id
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+        .returning(Like.tweet_id)
+        .cte()
+    )
+    counted = (
+        update(Tweet)
+        .where(Tweet.id.in_(select(inserted.c.tweet_id)))
+        .values(like_count=Tweet.like_count + 1)
+        .returning(Tweet.id, Tweet.user_id)
+        .cte()
+    )
+    query = await session.execute(
+        select(target.c.id, target.c.user_id, counted.c.id)
+        .outerjoin(counted, counted.c.id == target.c.id)
+        .add_cte(credit_likes(counted, 1))
+    )
+    outcomes = dict.fromkeys(tweet_ids, "not_found")
+    for tweet_id, author_id, liked_id in query.tuples():
+        if liked_id is not None:
+            outcomes[tweet_id] = "liked"
+        elif author_id == user_id:
+            outcomes[tweet_id] = "own_tweet"
+        else:
+            outcomes[tweet_id] = "already_liked"
+    return outcomes
+
+
+async def follow_users(
+    session: AsyncSession, follower_id: int, user_ids: Sequence[int]
+) -> Dict[int, str]:
+    """
+    Follow a batch of users with a single statement, which also updates
+    the follow counters of the users, once they are locked.
+
+    Args:
+        session (AsyncSession): The SQLAlchemy session.
+        follower_id (int): The id of the user who follows.
+        user_ids (Sequence[int]): The ids of the users to follow.
+
+    Returns:
+        Mapping of every requested user id to the outcome: "followed",
+        "already_following", "self" or "not_found".
+    """
+    await lock_users(session, [follower_id, *user_ids])
+    target = (
+        select(User.id)
+        .where(User.id.in_(set(user_ids)), User.id != follower_id)
+        .cte()
+    )
+    inserted = (
+        insert(user_to_user)
+        .from_select(
+            ["follower_id", "following_id"],
+            select(literal(follower_id), target.c.id),
+        )
+        .on_conflict_do_nothing()
+        .returning(user_to_user.c.following_id)
+        .cte()
+    )
+    query = await session.execute(
+        select(target.c.id, inserted.c.following_id)
+        .outerjoin(inserted, inserted.c.following_id == target.c.id)
+        .add_cte(*count_follows(inserted, follower_id, 1))
+    )
+    outcomes = dict.fromkeys(user_ids, "not_found")
+    if follower_id in outcomes:
+        outcomes[follower_id] = "self"
+    for user_id, followed_id in query.tuples():
+        outcomes[user_id] = (
+            "followed" if followed_id is not None else "already_following"
+        )
+    return outcomes
+
+
+async def unfollow_user(
+    session: AsyncSession, follower_id: int, following_id: int
+) -> bool:
+    """
+    Remove a follow with a single DELETE ... RETURNING statement, which
+    also updates the follow counters of both users, once they are locked.
+
+    Returns:
+        True if the follow was removed, False if there was no follow.
+    """
+    await lock_users(session, [follower_id, following_id])
+    deleted = (
+        delete(user_to_user)
+        .where(
+            user_to_user.c.follower_id == follower_id,
+            user_to_user.c.following_id == following_id,
+        )
+        .returning(user_to_user.c.following_id)
+        .cte()
+    )
+    query = await session.execute(
+        select(func.count())
+        .select_from(deleted)
+        .add_cte(*count_follows(deleted, follower_id, -1))
+    )
+    return bool(query.scalar_one())
+
+
+# Direction of a follow list: the column holding the owner of the list
+# and the column holding the listed users.
+FOLLOW_COLUMNS = {
+    "followers": (user_to_user.c.following_id, user_to_user.c.follower_id),
+    "following": (user_to_user.c.follower_id, user_to_user.c.following_id),
+    "mutual": (user_to_user.c.follower_id, user_to_user.c.following_id),
+}
+
+
+def follow_list_query(
+    user_id: int, direction: str, before: Optional[int]
+) -> Select:
+    owner_column, listed_column = FOLLOW_COLUMNS[direction]
+    query = (
+        select(User.id, User.username)
+        .join(user_to_user, listed_column == User.id)
+        .where(owner_column == user_id)
+        .order_by(desc(listed_column))
+    )
+    if direction == "mutual":
+        back = user_to_user.alias("back")
+        query = query.join(
+            back,
+            (back.c.follower_id == User.id) & (back.c.following_id == user_id),
+        )
+    if before is not None:
+        query = query.where(listed_column < before)
+    return query
+
+
+async def get_follow_page(
+    session: AsyncSession,
+    user_id: int,
+    direction: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    version: Optional[int] = None,
+) -> Tuple[Sequence[Tuple[int, str]], Optional[str]]:
+    """
+    Get a page of the followers, the followings or the mutual follows of
+    a user, the users with the highest ids first.
+
+    The id of the listed user is the keyset, so a page is a range scan of
+    ix_user_to_user_following_id_follower_id for followers and of the
+    primary key of user_to_user for followings, however long the list is.
+    Followings and mutual follows are read from the follow graph of the
+    worker instead when it is as recent as the version the caller read.
+
+    Args:
+        session (AsyncSession): The SQLAlchemy session.
+        user_id (int): The owner of the list.
+        direction (str): "followers", "following" or "mutual".
+        limit (int): The page size.
+        cursor (str): The cursor returned with the previous page.
+        version (int): The version of user_scope(user_id) read by the
+            caller, None to always use SQL.
+
+    Returns:
+        The (id, username) pairs of the page and the cursor of the next
+        page, None on the last page.
+    """
+    before = decode_user_cursor(cursor) if cursor is not None else None
+    users: Sequence[Tuple[int, str]]
+    graph = None
+    if version is not None and direction != "followers":
+        graph = get_follow_graph(user_id, version)
+
+    if graph is not None:
+        if direction == "mutual":
+            user_ids = graph.mutual(user_id, before, limit + 1)
+        else:
+            user_ids = graph.following(user_id, before, limit + 1)
+        usernames = await get_usernames_by_ids(session, user_ids)
+        users = [
+            (listed_id, usernames[listed_id])
+            for listed_id in user_ids
+            if listed_id in usernames
+        ]
+    else:
+        query = await session.execute(
+            follow_list_query(user_id, direction, before).limit(limit + 1)
         )
+        users = query.tuples().all()
+        get_username_map(session).update(users)
+    if len(users) <= limit:
+        return users, None
+    users = users[:limit]
+    return users, encode_user_cursor(users[-1][0])
+
+
+async def remove_like(
+    session: AsyncSession, tweet_id: int, user_id: int
+) -> bool:
+    """
+    Remove a like with a single DELETE ... RETURNING statement, which
+    also decreases the like_count of the tweet and the received like
+    counter of its author, once the author is locked.
+
+    Returns:
+        True if the like was removed, False if there was no like.
+
+    Raises:
+        HTTPException: If the tweet does not exist.
+    """
+    await lock_authors(session, [tweet_id])
+    deleted = (
+        delete(Like)
+        .where(Like.user_id == user_id, Like.tweet_id == tweet_id)
+        .returning(Like.tweet_id)
+        .cte()
+    )
+    counted = (
+        update(Tweet)
+        .where(Tweet.id.in_(select(deleted.c.tweet_id)))
+        .values(like_count=Tweet.like_count - 1)
+        .returning(Tweet.id, Tweet.user_id)
+        .cte()
+    )
+    query = await session.execute(
+        select(
+            exists().where(Tweet.id == tweet_id),
+            select(func.count()).select_from(counted).scalar_subquery(),
+        ).add_cte(credit_likes(counted, -1))
     )
-    return query.scalar_one_or_none()
+    found, unliked = query.one()
+    if not found:
+        raise_tweet_not_found()
+    return bool(unliked)
@@ -0,0 +1,79 @@
+from random import randrange
+from typing import Dict, List, Tuple
+
+from models.versions import DataVersion
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Every tweet, deletion, like and unlike: the content of the timelines.
+TWEETS_SCOPE = "tweets"
+USER_SCOPE_PREFIX = "user:"
+
+# Scopes written by many concurrent transactions, with their number of
+# shards. A write bumps one shard picked at random, so writes rarely
+# wait for the lock of the same row. The version of the scope is the
+# sum of its shards, which every commit still raises. Only ever raise a
+# number of shards, dropping a shard would lower the version.
+SHARDED_SCOPES = {TWEETS_SCOPE: 16}
+
+
+def shard_scopes(scope: str) -> List[str]:
+    """Scopes of the rows holding the version of a scope"""
+    if scope not in SHARDED_SCOPES:
+        return [scope]
+    return [f"{scope}:{shard}" for shard in range(SHARDED_SCOPES[scope])]
+
+
+def user_scope(user_id: int) -> str:
+    """Scope of the follow lists of a user and of their home timeline"""
+    return f"{USER_SCOPE_PREFIX}{user_id}"
+
+
+def _bumped_row(scope: str) -> str:
+    if scope not in SHARDED_SCOPES:
+        return scope
+    return f"{scope}:{randrange(SHARDED_SCOPES[scope])}"
+
+
+async def bump_versions(session: AsyncSession, *scopes: str) -> Dict[str, int]:
+    """
+    Increment the version of the given scopes in the current transaction.
+
+    The row of a scope is locked until the transaction ends, keep the
+    bump close to the commit. A sharded scope bumps one of its shards.
+    :return: The new version of every bumped row, by the scope of the
+    row: the scope itself, or the shard of a sharded scope.
+    """
+    # Rows are upserted in order, so concurrent bumps lock them in the
+    # same order and cannot deadlock.
+    row_scopes = sorted({_bumped_row(scope) for scope in scopes})
+    rows = [{"scope": scope, "version": 1} for scope in row_scopes]
+    statement = insert(DataVersion).values(rows)
+    query = await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[DataVersion.scope],
+            set_={"version": DataVersion.version + 1},
+        ).returning(DataVersion.scope, DataVersion.version)
+    )
+    return dict(query.tuples().all())
+
+
+async def get_versions(session: AsyncSession, *scopes: str) -> Tuple[int, ...]:
+    """
+    Read the current version of the given scopes with a single query.
+    :return: Versions in the order of `scopes`, 0 for a scope that was
+    never bumped.
+    """
+    shards = {scope: shard_scopes(scope) for scope in scopes}
+    query = await session.execute(
+        select(DataVersion.scope, DataVersion.version).where(
+            DataVersion.scope.in_(
+                [row for rows in shards.values() for row in rows]
+            )
+        )
+    )
+    versions = dict(query.tuples().all())
+    return tuple(
+        sum(versions.get(row, 0) for row in shards[scope]) for scope in scopes
+    )
@@ -1,17 +1,46 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
 import uvicorn
 from database.database import async_get_db, engine
-from database.utils import create_test_user_if_not_exist, init_models
+from database.follow_graph import run_follow_graph
+from database.media_gc import run_media_collector
+from database.utils import (
+    check_schema_revision,
+    create_test_user_if_not_exist,
+    init_models,
+)
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError, ResponseValidationError
-from routers import media, tweets, users
+from fastapi.responses import ORJSONResponse
+from routers import media, metrics, tweets, users
 from starlette.exceptions import HTTPException
 from utils.exceptions import (
     custom_http_exception_handler,
     response_validation_exception_handler,
     validation_exception_handler,
 )
+from utils.images import shutdown_process_pool
+from utils.metrics import mark_worker_dead
+from utils.middleware import (
+    BodySizeLimitMiddleware,
+    MetricsMiddleware,
+    ProfilingMiddleware,
+    QueryBudgetMiddleware,
+    ServerTimingMiddleware,
+)
+from utils.settings import (
+    DB_SCHEMA_MODE,
+    FOLLOW_GRAPH,
+    MEDIA_BATCH_MAX_FILES,
+    MEDIA_FORM_OVERHEAD,
+    MEDIA_MAX_SIZE,
+    PROFILE_TOKEN,
+    PROFILE_TOP_FUNCTIONS,
+    QUERY_BUDGET,
+    QUERY_REPEAT_THRESHOLD,
+    SERVER_TIMING,
+)
 
 session = async_get_db()
 
@@ -22,15 +51,32 @@ async def lifespan(_: FastAPI):
     Function that handles startup and shutdown events.
     To understand more, read https://fastapi.tiangolo.com/advanced/events/
     """
-    await init_models()
-    await create_test_user_if_not_exist(await anext(session))
+    if DB_SCHEMA_MODE == "create":
+        await init_models()
+        await create_test_user_if_not_exist(await anext(session))
+    else:
+        await check_schema_revision()
+    tasks = [asyncio.create_task(run_media_collector())]
+    if FOLLOW_GRAPH:
+        tasks.append(asyncio.create_task(run_follow_graph()))
 
     yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    shutdown_process_pool()
     if engine is not None:
         await engine.dispose()
+    mark_worker_dead()
 
 
-app = FastAPI(lifespan=lifespan, debug=True, docs_url="/docs")
+app = FastAPI(
+    lifespan=lifespan,
+    debug=True,
+    docs_url="/docs",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 app.add_exception_handler(HTTPException, custom_http_exception_handler)
@@ -38,10 +84,32 @@ app.add_exception_handler(
     ResponseValidationError, response_validation_exception_handler
 )
 
+if QUERY_BUDGET:
+    app.add_middleware(
+        QueryBudgetMiddleware,
+        budget=QUERY_BUDGET,
+        repeat_threshold=QUERY_REPEAT_THRESHOLD,
+    )
+if SERVER_TIMING:
+    app.add_middleware(ServerTimingMiddleware)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    limits={
+        "/api/medias": MEDIA_MAX_SIZE + MEDIA_FORM_OVERHEAD,
+        "/api/medias/batch": MEDIA_BATCH_MAX_FILES
+        * (MEDIA_MAX_SIZE + MEDIA_FORM_OVERHEAD),
+    },
+)
+app.add_middleware(MetricsMiddleware)
+if PROFILE_TOKEN:
+    app.add_middleware(
+        ProfilingMiddleware, token=PROFILE_TOKEN, top=PROFILE_TOP_FUNCTIONS
+    )
 
 app.include_router(media.router)
 app.include_router(users.router)
 app.include_router(tweets.router)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
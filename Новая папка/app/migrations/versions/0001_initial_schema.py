@@ -0,0 +1,90 @@
+"""
+Initial schema, as created by Base.metadata.create_all before migrations.
+
+Databases created by the application at startup are already at this
+revision, mark them with `alembic stamp 0001` before upgrading.
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-03-01 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    users = op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("api_key", sa.String(length=255), nullable=False),
+        sa.Column("username", sa.String(length=255), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+
+    op.create_table(
+        "user_to_user",
+        sa.Column("follower_id", sa.Integer(), nullable=False),
+        sa.Column("following_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["follower_id"], ["users.id"]),
+        sa.ForeignKeyConstraint(["following_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("follower_id", "following_id"),
+    )
+
+    op.create_table(
+        "tweets",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column(
+            "create_date",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.Column("tweet_data", sa.String(length=2500), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tweets_id", "tweets", ["id"])
+
+    op.create_table(
+        "likes",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_likes_id", "likes", ["id"])
+
+    op.create_table(
+        "media",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("media_path", sa.String(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_media_id", "media", ["id"])
+
+    # The user the frontend authenticates with by default, it used to be
+    # created by the application on every startup.
+    op.bulk_insert(users, [{"api_key": "test", "username": "test user"}])
+
+
+def downgrade() -> None:
+    op.drop_table("media")
+    op.drop_table("likes")
+    op.drop_table("tweets")
+    op.drop_table("user_to_user")
+    op.drop_table("users")
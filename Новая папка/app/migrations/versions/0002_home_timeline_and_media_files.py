@@ -0,0 +1,137 @@
+"""
+Home timeline, like counters and content-addressed media files.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-03-15 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "like_count", sa.Integer(), server_default="0", nullable=False
+        ),
+    )
+    # Existing tweets were never fanned out, they are merged into the
+    # timelines of the followers at read time. New tweets default to
+    # fan-out on write.
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "fanned_out",
+            sa.Boolean(),
+            server_default=sa.false(),
+            nullable=False,
+        ),
+    )
+    op.alter_column("tweets", "fanned_out", server_default=sa.true())
+
+    op.execute(
+        """
+        DELETE FROM likes
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY user_id, tweet_id ORDER BY id
+                ) AS position
+                FROM likes
+            ) AS ranked
+            WHERE position > 1
+        )
+        """
+    )
+    op.create_unique_constraint(
+        "uq_likes_user_id_tweet_id", "likes", ["user_id", "tweet_id"]
+    )
+    op.execute(
+        """
+        UPDATE tweets SET like_count = counts.like_count
+        FROM (
+            SELECT tweet_id, count(*) AS like_count
+            FROM likes GROUP BY tweet_id
+        ) AS counts
+        WHERE tweets.id = counts.tweet_id
+        """
+    )
+
+    op.create_table(
+        "media_files",
+        sa.Column("sha256", sa.String(length=64), nullable=False),
+        sa.Column("media_path", sa.String(), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "ref_count", sa.Integer(), server_default="0", nullable=False
+        ),
+        sa.PrimaryKeyConstraint("sha256"),
+    )
+    op.add_column(
+        "media", sa.Column("sha256", sa.String(length=64), nullable=True)
+    )
+    op.add_column("media", sa.Column("size", sa.BigInteger(), nullable=True))
+    op.add_column(
+        "media", sa.Column("thumbnail_path", sa.String(), nullable=True)
+    )
+    op.add_column(
+        "media", sa.Column("medium_path", sa.String(), nullable=True)
+    )
+    op.create_foreign_key(
+        "media_sha256_fkey", "media", "media_files", ["sha256"], ["sha256"]
+    )
+
+    op.create_table(
+        "home_timeline",
+        sa.Column("owner_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("create_date", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["owner_id"], ["users.id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(
+            ["tweet_id"], ["tweets.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("owner_id", "tweet_id"),
+    )
+    op.create_index("ix_home_timeline_tweet_id", "home_timeline", ["tweet_id"])
+    op.create_index(
+        "ix_home_timeline_owner_id_create_date_tweet_id",
+        "home_timeline",
+        ["owner_id", "create_date", "tweet_id"],
+    )
+    # Authors see their own tweets through their home timeline only.
+    op.execute(
+        """
+        INSERT INTO home_timeline (owner_id, tweet_id, create_date)
+        SELECT user_id, id, create_date FROM (
+            SELECT user_id, id, create_date, row_number() OVER (
+                PARTITION BY user_id ORDER BY create_date DESC, id DESC
+            ) AS position
+            FROM tweets
+        ) AS ranked
+        WHERE position <= 800
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("home_timeline")
+    op.drop_constraint("media_sha256_fkey", "media", type_="foreignkey")
+    op.drop_column("media", "medium_path")
+    op.drop_column("media", "thumbnail_path")
+    op.drop_column("media", "size")
+    op.drop_column("media", "sha256")
+    op.drop_table("media_files")
+    op.drop_constraint("uq_likes_user_id_tweet_id", "likes", type_="unique")
+    op.drop_column("tweets", "fanned_out")
+    op.drop_column("tweets", "like_count")
@@ -0,0 +1,72 @@
+"""
+Indexes for the timeline, like, media, authentication and follower
+queries.
+
+The indexes are built with CREATE INDEX CONCURRENTLY, so the tables stay
+writable while they are built. That cannot run inside a transaction, each
+statement is run in autocommit mode. An interrupted build leaves an
+INVALID index behind: drop it and run the upgrade again.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-04-01 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = (
+    ("ix_tweets_create_date_id", "tweets", ["create_date", "id"], None),
+    (
+        "ix_tweets_user_id_create_date_id",
+        "tweets",
+        ["user_id", "create_date", "id"],
+        None,
+    ),
+    (
+        "ix_tweets_not_fanned_out",
+        "tweets",
+        ["user_id", "create_date", "id"],
+        sa.text("NOT fanned_out"),
+    ),
+    ("ix_likes_tweet_id", "likes", ["tweet_id"], None),
+    ("ix_media_tweet_id", "media", ["tweet_id"], None),
+    ("ix_users_api_key", "users", ["api_key"], None),
+    (
+        "ix_user_to_user_following_id_follower_id",
+        "user_to_user",
+        ["following_id", "follower_id"],
+        None,
+    ),
+)
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                postgresql_where=where,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
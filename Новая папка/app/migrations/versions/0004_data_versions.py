@@ -0,0 +1,32 @@
+"""
+Change counters for ETags.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-04-10 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "data_versions",
+        sa.Column("scope", sa.String(length=64), nullable=False),
+        sa.Column(
+            "version", sa.BigInteger(), server_default="0", nullable=False
+        ),
+        sa.PrimaryKeyConstraint("scope"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("data_versions")
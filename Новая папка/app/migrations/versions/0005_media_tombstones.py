@@ -0,0 +1,59 @@
+"""
+Tombstones for stored files and upload dates of media.
+
+Media uploaded before this revision is dated at the upgrade, unattached
+media is swept MEDIA_ORPHAN_MAX_AGE after it.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-04-20 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "media_files", sa.Column("deleted_at", sa.DateTime(), nullable=True)
+    )
+    op.add_column(
+        "media",
+        sa.Column(
+            "created_at",
+            sa.DateTime(),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_media_files_deleted_at",
+            "media_files",
+            ["deleted_at"],
+            postgresql_where=sa.text("deleted_at IS NOT NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_media_unattached_created_at",
+            "media",
+            ["created_at"],
+            postgresql_where=sa.text("tweet_id IS NULL"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_unattached_created_at", table_name="media")
+    op.drop_index("ix_media_files_deleted_at", table_name="media_files")
+    op.drop_column("media", "created_at")
+    op.drop_column("media_files", "deleted_at")
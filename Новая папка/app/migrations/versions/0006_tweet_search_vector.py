@@ -0,0 +1,51 @@
+"""
+Full-text search vector of tweets.
+
+Adding the generated column rewrites the tweets table under an exclusive
+lock, plan the upgrade for a quiet moment on a large table. The GIN index
+is then built without blocking writes.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-05-04 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                "to_tsvector('simple'::regconfig, tweet_data)",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tweets_search_vector",
+            "tweets",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_search_vector", table_name="tweets")
+    op.drop_column("tweets", "search_vector")
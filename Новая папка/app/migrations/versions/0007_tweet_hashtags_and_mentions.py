@@ -0,0 +1,92 @@
+"""
+Hashtags and mentions of tweets.
+
+Existing tweets are indexed with the same patterns as
+utils.tweet_text, in SQL.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2024-05-11 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0007"
+down_revision: Union[str, None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tweet_hashtags",
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("tag", sa.String(length=100), nullable=False),
+        sa.Column("create_date", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["tweet_id"], ["tweets.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("tweet_id", "tag"),
+    )
+    op.create_index(
+        "ix_tweet_hashtags_tag_create_date_tweet_id",
+        "tweet_hashtags",
+        ["tag", "create_date", "tweet_id"],
+    )
+    op.create_table(
+        "tweet_mentions",
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("create_date", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["tweet_id"], ["tweets.id"], ondelete="CASCADE"
+        ),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tweet_id", "user_id"),
+    )
+    op.create_index(
+        "ix_tweet_mentions_user_id_create_date_tweet_id",
+        "tweet_mentions",
+        ["user_id", "create_date", "tweet_id"],
+    )
+
+    op.execute(
+        r"""
+        INSERT INTO tweet_hashtags (tweet_id, tag, create_date)
+        SELECT DISTINCT tweets.id, lower(found.match[1]), tweets.create_date
+        FROM tweets
+        CROSS JOIN LATERAL regexp_matches(
+            tweets.tweet_data, '(?<!\w)#(\w+)', 'g'
+        ) AS found(match)
+        WHERE tweets.tweet_data LIKE '%#%'
+            AND length(found.match[1]) <= 100
+        """
+    )
+    op.execute(
+        r"""
+        INSERT INTO tweet_mentions (tweet_id, user_id, create_date)
+        SELECT DISTINCT tweets.id, users.id, tweets.create_date
+        FROM tweets
+        CROSS JOIN LATERAL regexp_matches(
+            tweets.tweet_data, '(?<!\w)@(\w+)', 'g'
+        ) AS found(match)
+        JOIN users ON users.username = found.match[1]
+        WHERE tweets.tweet_data LIKE '%@%'
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_tweet_mentions_user_id_create_date_tweet_id",
+        table_name="tweet_mentions",
+    )
+    op.drop_table("tweet_mentions")
+    op.drop_index(
+        "ix_tweet_hashtags_tag_create_date_tweet_id",
+        table_name="tweet_hashtags",
+    )
+    op.drop_table("tweet_hashtags")
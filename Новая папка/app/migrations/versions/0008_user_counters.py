@@ -0,0 +1,70 @@
+"""
+Follow, tweet and received like counters of users.
+
+The columns are added with a constant default, which does not rewrite
+the table. Existing users are then counted in one pass over each table.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-05-18 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTERS = (
+    "follower_count",
+    "following_count",
+    "tweet_count",
+    "received_like_count",
+)
+
+
+def upgrade() -> None:
+    for counter in COUNTERS:
+        op.add_column(
+            "users",
+            sa.Column(
+                counter, sa.Integer(), server_default="0", nullable=False
+            ),
+        )
+
+    op.execute(
+        """
+        UPDATE users
+        SET follower_count = coalesce(followers.count, 0),
+            following_count = coalesce(followings.count, 0),
+            tweet_count = coalesce(tweets.count, 0),
+            received_like_count = coalesce(likes.count, 0)
+        FROM users AS counted
+        LEFT JOIN (
+            SELECT following_id AS user_id, count(*) FROM user_to_user
+            GROUP BY following_id
+        ) AS followers ON followers.user_id = counted.id
+        LEFT JOIN (
+            SELECT follower_id AS user_id, count(*) FROM user_to_user
+            GROUP BY follower_id
+        ) AS followings ON followings.user_id = counted.id
+        LEFT JOIN (
+            SELECT user_id, count(*) FROM tweets GROUP BY user_id
+        ) AS tweets ON tweets.user_id = counted.id
+        LEFT JOIN (
+            SELECT tweets.user_id, count(*) FROM likes
+            JOIN tweets ON tweets.id = likes.tweet_id
+            GROUP BY tweets.user_id
+        ) AS likes ON likes.user_id = counted.id
+        WHERE users.id = counted.id
+        """
+    )
+
+
+def downgrade() -> None:
+    for counter in reversed(COUNTERS):
+        op.drop_column("users", counter)
@@ -0,0 +1,37 @@
+"""
+Split the version of the tweets scope in shards.
+
+The version of the scope becomes the sum of its shards, the current one
+moves to the first shard so the version goes on from where it was.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-05-25 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE data_versions SET scope = 'tweets:0' WHERE scope = 'tweets'"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        """
+        INSERT INTO data_versions (scope, version)
+        SELECT 'tweets', sum(version) FROM data_versions
+        WHERE scope LIKE 'tweets:%'
+        HAVING count(*) > 0
+        """
+    )
+    op.execute("DELETE FROM data_versions WHERE scope LIKE 'tweets:%'")
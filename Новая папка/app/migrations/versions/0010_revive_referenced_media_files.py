@@ -0,0 +1,30 @@
+"""
+Revive the media files tombstoned while still referenced.
+
+A file uploaded again after its last reference was dropped kept its
+tombstone. Such rows are live again, the collector skips them.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2024-06-01 12:00:00.000000
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0010"
+down_revision: Union[str, None] = "0009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "UPDATE media_files SET deleted_at = NULL "
+        "WHERE deleted_at IS NOT NULL AND ref_count > 0"
+    )
+
+
+def downgrade() -> None:
+    pass
@@ -1,10 +1,15 @@
 from database.database import Base
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 
 
 class Like(Base):
     __tablename__ = "likes"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "tweet_id", name="uq_likes_user_id_tweet_id"
+        ),
+    )
 
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True, index=True
@@ -13,7 +18,7 @@ class Like(Base):
         ForeignKey("users.id"), nullable=False
     )
     tweet_id: Mapped[int] = mapped_column(
-        ForeignKey("tweets.id"), nullable=False
+        ForeignKey("tweets.id"), nullable=False, index=True
     )
 
     def __repr__(self):
@@ -1,22 +1,77 @@
+from datetime import datetime
+from typing import Optional
+
 from database.database import Base
-from sqlalchemy import ForeignKey
+from sqlalchemy import BigInteger, ForeignKey, Index, String, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 
+class MediaFile(Base):
+    """
+    A stored file, shared by every Media row with the same content.
+    Once ref_count drops to zero the row is tombstoned with deleted_at,
+    and the media collector removes the file and then the row.
+    """
+
+    __tablename__ = "media_files"
+    __table_args__ = (
+        Index(
+            "ix_media_files_deleted_at",
+            "deleted_at",
+            postgresql_where=text("deleted_at IS NOT NULL"),
+        ),
+    )
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    media_path: Mapped[str]
+    size: Mapped[int] = mapped_column(BigInteger)
+    ref_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    deleted_at: Mapped[Optional[datetime]]
+
+    def __repr__(self):
+        return self._repr(
+            sha256=self.sha256,
+            media_path=self.media_path,
+            size=self.size,
+            ref_count=self.ref_count,
+            deleted_at=self.deleted_at,
+        )
+
+
 class Media(Base):
     __tablename__ = "media"
+    __table_args__ = (
+        Index(
+            "ix_media_unattached_created_at",
+            "created_at",
+            postgresql_where=text("tweet_id IS NULL"),
+        ),
+    )
+
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True, index=True
     )
 
     media_path: Mapped[str]
+    sha256: Mapped[Optional[str]] = mapped_column(
+        ForeignKey("media_files.sha256")
+    )
+    size: Mapped[Optional[int]] = mapped_column(BigInteger)
+    thumbnail_path: Mapped[Optional[str]]
+    medium_path: Mapped[Optional[str]]
     tweet_id: Mapped[int] = mapped_column(
-        ForeignKey("tweets.id"), nullable=True
+        ForeignKey("tweets.id"), nullable=True, index=True
     )
+    created_at: Mapped[datetime] = mapped_column(server_default=func.now())
 
     def __repr__(self):
         return self._repr(
             id=self.id,
             media_path=self.media_path,
+            sha256=self.sha256,
+            size=self.size,
+            thumbnail_path=self.thumbnail_path,
+            medium_path=self.medium_path,
             tweet_id=self.tweet_id,
+            created_at=self.created_at,
         )
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+from database.database import Base
+from sqlalchemy import ForeignKey, Index, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+HASHTAG_MAX_LENGTH = 100
+
+
+class TweetHashtag(Base):
+    """
+    Hashtag of a tweet, extracted when the tweet is created. The creation
+    date is copied from the tweet, so a tag page is a range scan.
+    """
+
+    __tablename__ = "tweet_hashtags"
+    __table_args__ = (
+        Index(
+            "ix_tweet_hashtags_tag_create_date_tweet_id",
+            "tag",
+            "create_date",
+            "tweet_id",
+        ),
+    )
+
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    tag: Mapped[str] = mapped_column(
+        String(HASHTAG_MAX_LENGTH), primary_key=True
+    )
+    create_date: Mapped[datetime]
+
+    def __repr__(self):
+        return self._repr(tweet_id=self.tweet_id, tag=self.tag)
+
+
+class TweetMention(Base):
+    """User mentioned in a tweet, extracted when the tweet is created"""
+
+    __tablename__ = "tweet_mentions"
+    __table_args__ = (
+        Index(
+            "ix_tweet_mentions_user_id_create_date_tweet_id",
+            "user_id",
+            "create_date",
+            "tweet_id",
+        ),
+    )
+
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    create_date: Mapped[datetime]
+
+    def __repr__(self):
+        return self._repr(tweet_id=self.tweet_id, user_id=self.user_id)
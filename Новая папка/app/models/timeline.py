@@ -0,0 +1,40 @@
+from datetime import datetime
+
+from database.database import Base
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class HomeTimelineEntry(Base):
+    """
+    Materialized home timeline: one row per tweet delivered to an owner.
+    Rows are written on tweet creation (fan-out on write), so reading a
+    timeline is a range scan over the owner's own entries.
+    """
+
+    __tablename__ = "home_timeline"
+    __table_args__ = (
+        Index(
+            "ix_home_timeline_owner_id_create_date_tweet_id",
+            "owner_id",
+            "create_date",
+            "tweet_id",
+        ),
+    )
+
+    owner_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"),
+        primary_key=True,
+        index=True,
+    )
+    create_date: Mapped[datetime]
+
+    def __repr__(self):
+        return self._repr(
+            owner_id=self.owner_id,
+            tweet_id=self.tweet_id,
+            create_date=self.create_date,
+        )
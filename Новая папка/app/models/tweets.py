@@ -1,8 +1,9 @@
 from datetime import datetime
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Any, List
 
 from database.database import Base
-from sqlalchemy import ForeignKey, String, func
+from sqlalchemy import Computed, ForeignKey, Index, String, func, text, true
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 if TYPE_CHECKING:
@@ -10,8 +11,29 @@ if TYPE_CHECKING:
     from app.models.media import Media
 
 
+# Text search configuration of Tweet.search_vector. "simple" does not
+# stem, so it fits tweets in any language. Changing it needs a migration.
+SEARCH_CONFIG = "simple"
+
+
 class Tweet(Base):
     __tablename__ = "tweets"
+    __table_args__ = (
+        Index("ix_tweets_create_date_id", "create_date", "id"),
+        Index(
+            "ix_tweets_user_id_create_date_id", "user_id", "create_date", "id"
+        ),
+        Index(
+            "ix_tweets_not_fanned_out",
+            "user_id",
+            "create_date",
+            "id",
+            postgresql_where=text("NOT fanned_out"),
+        ),
+        Index(
+            "ix_tweets_search_vector", "search_vector", postgresql_using="gin"
+        ),
+    )
 
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True, index=True
@@ -19,6 +41,19 @@ class Tweet(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     create_date: Mapped[datetime] = mapped_column(server_default=func.now())
     tweet_data: Mapped[str] = mapped_column(String(2500))
+    like_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    fanned_out: Mapped[bool] = mapped_column(
+        default=True, server_default=true()
+    )
+    # Kept up to date by Postgres, and only loaded when asked for.
+    search_vector: Mapped[Any] = mapped_column(
+        TSVECTOR,
+        Computed(
+            f"to_tsvector('{SEARCH_CONFIG}'::regconfig, tweet_data)",
+            persisted=True,
+        ),
+        deferred=True,
+    )
     media: Mapped[List["Media"]] = relationship(
         backref="tweets", cascade="all, delete"
     )
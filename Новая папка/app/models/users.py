@@ -3,8 +3,8 @@ from typing import List
 from database.database import Base
 from models.likes import Like
 from models.tweets import Tweet
-from sqlalchemy import Column, ForeignKey, Integer, String, Table
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Table
+from sqlalchemy.orm import Mapped, backref, mapped_column, relationship
 
 
 user_to_user = Table(
@@ -12,6 +12,13 @@ user_to_user = Table(
     Base.metadata,
     Column("follower_id", Integer, ForeignKey("users.id"), primary_key=True),
     Column("following_id", Integer, ForeignKey("users.id"), primary_key=True),
+    # The primary key serves "who does X follow", this index serves
+    # "who follows X".
+    Index(
+        "ix_user_to_user_following_id_follower_id",
+        "following_id",
+        "follower_id",
+    ),
 )
 
 
@@ -21,9 +28,18 @@ class User(Base):
     id: Mapped[int] = mapped_column(
         primary_key=True, autoincrement=True, index=True
     )
-    api_key: Mapped[str] = mapped_column(String(255))
+    api_key: Mapped[str] = mapped_column(String(255), index=True)
     username: Mapped[str] = mapped_column(String(255), unique=True, index=True)
 
+    # Kept in step with the rows they count by the statements changing
+    # those rows, scripts.repair_counters fixes any drift.
+    follower_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    following_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    tweet_count: Mapped[int] = mapped_column(default=0, server_default="0")
+    received_like_count: Mapped[int] = mapped_column(
+        default=0, server_default="0"
+    )
+
     tweets: Mapped[List["Tweet"]] = relationship(
         backref="user", cascade="all, delete-orphan"
     )
@@ -36,8 +52,10 @@ class User(Base):
         secondary=user_to_user,
         primaryjoin=lambda: User.id == user_to_user.c.follower_id,
         secondaryjoin=lambda: User.id == user_to_user.c.following_id,
-        backref="followers",
-        lazy="selectin",
+        # The lists are unbounded, they are read page by page with the
+        # follow queries of database.utils and never loaded implicitly.
+        backref=backref("followers", lazy="raise"),
+        lazy="raise",
     )
 
     def __repr__(self):
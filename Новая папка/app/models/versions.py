@@ -0,0 +1,21 @@
+from database.database import Base
+from sqlalchemy import BigInteger, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class DataVersion(Base):
+    """
+    Change counter of a slice of the data, used to build ETags.
+    Counters are bumped in the transaction that changes the data, so a
+    version is visible exactly when the change is.
+    """
+
+    __tablename__ = "data_versions"
+
+    scope: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(
+        BigInteger, default=0, server_default="0"
+    )
+
+    def __repr__(self):
+        return self._repr(scope=self.scope, version=self.version)
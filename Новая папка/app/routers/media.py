@@ -1,15 +1,66 @@
-from typing import Annotated
+import asyncio
+import logging
+from typing import Annotated, Any, Dict, List, Optional
 
 from database.database import async_get_db
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
+from database.database import session as async_session
+from database.utils import add_media_file_reference, add_media_file_references
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    UploadFile,
+    status,
+)
 from models.media import Media
-from models.users import User
-from schemas.media_schema import MediaUpload
+from schemas.media_schema import MediaBatchOut, MediaUpload
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
-from utils.auth import authenticate_user
-from utils.file_utils import save_uploaded_file
+from utils.auth import Principal, authenticate_user
+from utils.file_utils import (
+    FileTooLargeError,
+    SavedFile,
+    discard_file,
+    save_uploaded_file,
+    store_file,
+)
+from utils.images import get_process_pool, make_image_variants
+from utils.settings import MEDIA_BATCH_MAX_FILES, MEDIA_PATH
 
 router = APIRouter(prefix="/api", tags=["media_v1"])
+logger = logging.getLogger(__name__)
+
+
+async def generate_image_variants(media_id: int, media_path: str) -> None:
+    """
+    Resize an uploaded image in the process pool and record the WebP
+    derivatives on its Media row. Runs after the response is sent.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        variants = await loop.run_in_executor(
+            get_process_pool(),
+            make_image_variants,
+            str(MEDIA_PATH),
+            media_path,
+        )
+    except Exception:
+        logger.exception("Failed to resize media %s", media_id)
+        return
+    if not variants:
+        return
+
+    async with async_session() as db:
+        await db.execute(
+            update(Media)
+            .where(Media.id == media_id)
+            .values(
+                thumbnail_path=variants["thumbnail"],
+                medium_path=variants["medium"],
+            )
+        )
+        await db.commit()
 
 
 @router.post(
@@ -17,19 +68,120 @@ router = APIRouter(prefix="/api", tags=["media_v1"])
 )
 async def upload_media(
     file: UploadFile,
-    user: Annotated[User, "User model obtained from the api key"] = Depends(
-        authenticate_user
-    ),
+    background_tasks: BackgroundTasks,
+    user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
     try:
-        file = await save_uploaded_file(file)
-        new_media = Media(media_path=file)
+        saved_file = await save_uploaded_file(file)
+    except FileTooLargeError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(exc),
+        )
+    except ValueError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+        )
+
+    try:
+        media_path, first_reference = await add_media_file_reference(
+            session, saved_file
+        )
+        # A fresh row means nobody references the content, so a file left
+        # at that path by a concurrent deletion is replaced.
+        await store_file(
+            saved_file.temp_path, media_path, overwrite=first_reference
+        )
+        new_media = Media(
+            media_path=media_path,
+            sha256=saved_file.sha256,
+            size=saved_file.size,
+        )
         session.add(new_media)
         await session.commit()
 
+        if file.content_type and file.content_type.startswith("image/"):
+            background_tasks.add_task(
+                generate_image_variants, new_media.id, media_path
+            )
         return new_media
-    except ValueError as exc:
+    finally:
+        await discard_file(saved_file.temp_path)
+
+
+@router.post(
+    "/medias/batch",
+    status_code=status.HTTP_201_CREATED,
+    response_model=MediaBatchOut,
+)
+async def upload_many_media(
+    files: List[UploadFile],
+    background_tasks: BackgroundTasks,
+    user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """
+    Upload several files in one request and one transaction. Files that
+    can not be received are reported in their item, the others are
+    stored.
+    """
+    if len(files) > MEDIA_BATCH_MAX_FILES:
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MEDIA_BATCH_MAX_FILES} files can be uploaded "
+            "at once.",
         )
+
+    saved_files: List[Optional[SavedFile]] = []
+    results: List[Dict[str, Any]] = []
+    try:
+        for file in files:
+            result: Dict[str, Any] = {"filename": file.filename}
+            try:
+                saved_files.append(await save_uploaded_file(file))
+            except ValueError as exc:
+                saved_files.append(None)
+                result["error"] = str(exc)
+            results.append(result)
+
+        received = [saved for saved in saved_files if saved is not None]
+        if not received:
+            return {"result": True, "medias": results}
+
+        references = await add_media_file_references(session, received)
+        new_media: Dict[int, Media] = dict()
+        stored_hashes = set()
+        for position, saved_file in enumerate(saved_files):
+            if saved_file is None:
+                continue
+            media_path, first_reference = references[saved_file.sha256]
+            if saved_file.sha256 not in stored_hashes:
+                await store_file(
+                    saved_file.temp_path, media_path, overwrite=first_reference
+                )
+                stored_hashes.add(saved_file.sha256)
+            new_media[position] = Media(
+                media_path=media_path,
+                sha256=saved_file.sha256,
+                size=saved_file.size,
+            )
+        session.add_all(new_media.values())
+        await session.commit()
+
+        for position, media in new_media.items():
+            results[position]["media_id"] = media.id
+            content_type = files[position].content_type
+            if content_type and content_type.startswith("image/"):
+                background_tasks.add_task(
+                    generate_image_variants, media.id, media.media_path
+                )
+        return {"result": True, "medias": results}
+    finally:
+        for saved_file in saved_files:
+            if saved_file is not None:
+                await discard_file(saved_file.temp_path)
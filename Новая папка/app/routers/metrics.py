@@ -0,0 +1,45 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from starlette.responses import Response
+from utils.metrics import metrics_response
+from utils.settings import METRICS_TOKEN
+
+router = APIRouter(tags=["metrics"])
+
+METRICS_BEARER = HTTPBearer(auto_error=False)
+
+
+def check_metrics_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(
+        METRICS_BEARER
+    ),
+) -> None:
+    """Only let the holder of METRICS_TOKEN read the metrics"""
+    if not METRICS_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Not Found"
+        )
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Metrics token authentication failed",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.get(
+    "/metrics",
+    include_in_schema=False,
+    dependencies=[Depends(check_metrics_token)],
+)
+def get_metrics() -> Response:
+    """
+    Metrics in the Prometheus text format. Reading the files of every
+    worker blocks, so the route runs in the thread pool.
+    """
+    return metrics_response()
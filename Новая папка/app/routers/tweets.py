@@ -1,30 +1,107 @@
-from typing import Annotated, Union
+from typing import Annotated, Any, Dict, List, Optional, Sequence, Union
 
-from aiofiles import os as aiofiles_os
-from database.database import async_get_db
+import orjson
+from database.counters import count_new_tweet, uncount_tweet
+from database.database import async_get_db, async_get_read_db
+from database.media_gc import wake_media_collector
+from database.tags import index_tweet_entities, remove_tweet_entities
+from database.timeline import (
+    fan_out_tweet,
+    remove_tweet_from_timelines,
+    should_fan_out,
+)
 from database.utils import (
+    add_like,
+    add_likes,
     associate_media_with_tweet,
     get_all_following_tweets,
     get_all_tweets,
-    get_like_by_id,
-    get_media_by_tweet_id,
+    get_mentioning_tweets,
+    get_tagged_tweets,
     get_tweet_by_id,
-    get_user_by_id,
+    get_usernames_by_ids,
+    release_media_of_tweet,
+    remove_like,
+    search_tweets,
+)
+from database.versions import (
+    TWEETS_SCOPE,
+    bump_versions,
+    get_versions,
+    user_scope,
 )
-from fastapi import APIRouter, Depends, HTTPException, status
-from models.likes import Like
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse
 from models.tweets import Tweet
-from models.users import User
 from schemas.base_schema import DefaultSchema
-from schemas.tweet_schema import TweetCreate, TweetIn, TweetOut
+from schemas.tweet_schema import (
+    LikeBatchIn,
+    LikeBatchOut,
+    TweetCreate,
+    TweetIn,
+    TweetOut,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import JSONResponse
-from utils.auth import authenticate_user
-from utils.settings import MEDIA_PATH
+from starlette.responses import Response
+from utils.auth import Principal, authenticate_user
+from utils.etag import CACHE_CONTROL, etag_matches, make_etag, not_modified
+from utils.response_cache import cached_response, response_cache
+from utils.settings import (
+    SEARCH_QUERY_MAX_LENGTH,
+    TIMELINE_MAX_PAGE_SIZE,
+    TIMELINE_PAGE_SIZE,
+)
+from utils.timing import hydration, timed
 
 router = APIRouter(prefix="/api", tags=["tweets_and_likes_v1"])
 
 
+async def serialize_tweets(
+    session: AsyncSession, tweets: Sequence[Tweet]
+) -> List[Dict[str, Any]]:
+    """
+    Build the timeline payload for a page of tweets.
+
+    Authors and likers of the whole page are resolved with a single
+    batched query instead of one lookup per tweet and per like.
+    """
+    user_ids = set()
+    for tweet in tweets:
+        user_ids.add(tweet.user_id)
+        user_ids.update(like.user_id for like in tweet.likes)
+    usernames = await get_usernames_by_ids(session, user_ids)
+
+    username = usernames.get
+    all_tweets = []
+    for tweet in tweets:
+        attachments = []
+        attachment_variants = []
+        for media in tweet.media:
+            attachments.append(media.media_path)
+            attachment_variants.append(
+                {
+                    "original": media.media_path,
+                    "thumbnail": media.thumbnail_path,
+                    "medium": media.medium_path,
+                }
+            )
+        user_id = tweet.user_id
+        all_tweets.append(
+            {
+                "id": tweet.id,
+                "content": tweet.tweet_data,
+                "attachments": attachments,
+                "attachment_variants": attachment_variants,
+                "author": {"id": user_id, "name": username(user_id)},
+                "likes": [
+                    {"user_id": like.user_id, "name": username(like.user_id)}
+                    for like in tweet.likes
+                ],
+            }
+        )
+    return all_tweets
+
+
 @router.post(
     "/tweets",
     status_code=status.HTTP_201_CREATED,
@@ -33,16 +110,20 @@ router = APIRouter(prefix="/api", tags=["tweets_and_likes_v1"])
 async def create_tweet(
     tweet_in: TweetIn,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
     new_tweet = Tweet(
         user_id=current_user.id,
         tweet_data=tweet_in.tweet_data,
+        fanned_out=await should_fan_out(session, current_user.id),
     )
     session.add(new_tweet)
     await session.flush()
+    await count_new_tweet(session, current_user.id)
+    await fan_out_tweet(session, new_tweet)
+    await index_tweet_entities(session, new_tweet)
     tweet_media_ids = tweet_in.tweet_media_ids
 
     if tweet_media_ids:
@@ -50,7 +131,9 @@ async def create_tweet(
             session=session, media_ids=tweet_media_ids, tweet=new_tweet
         )
 
+    await bump_versions(session, TWEETS_SCOPE)
     await session.commit()
+    response_cache.invalidate(TWEETS_SCOPE)
 
     return {"result": True, "tweet_id": new_tweet.id}
 
@@ -63,7 +146,7 @@ async def create_tweet(
 async def delete_tweet(
     tweet_id: int,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
@@ -73,13 +156,17 @@ async def delete_tweet(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Sorry, you can't delete tweets created by another user.",
         )
-    media_to_delete = await get_media_by_tweet_id(tweet_id, session)
-    for media in media_to_delete:
-        path_to_delete = MEDIA_PATH / media.media_path
-        await aiofiles_os.remove(path_to_delete)
+    released_files = await release_media_of_tweet(session, tweet_id)
 
+    await remove_tweet_from_timelines(session, tweet_id)
+    await remove_tweet_entities(session, tweet_id)
+    await uncount_tweet(session, tweet_id)
     await session.delete(tweet_to_delete)
+    await bump_versions(session, TWEETS_SCOPE)
     await session.commit()
+    response_cache.invalidate(TWEETS_SCOPE)
+    if released_files:
+        wake_media_collector()
     return tweet_to_delete
 
 
@@ -91,25 +178,48 @@ async def delete_tweet(
 async def like_a_tweet(
     tweet_id: int,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
-    tweet_to_like = await get_tweet_by_id(tweet_id=tweet_id, session=session)
-    like = await get_like_by_id(
-        session=session, tweet_id=tweet_id, user_id=current_user.id
-    )
-    if not like:
-        if tweet_to_like.user_id != current_user.id:
-            like_to_add = Like(
-                user_id=current_user.id, tweet_id=tweet_to_like.id
-            )
-            session.add(like_to_add)
-            await session.commit()
+    if await add_like(session, tweet_id=tweet_id, user_id=current_user.id):
+        await bump_versions(session, TWEETS_SCOPE)
+        await session.commit()
+        response_cache.invalidate(TWEETS_SCOPE)
 
     return dict()
 
 
+@router.post(
+    "/tweets/likes",
+    status_code=status.HTTP_200_OK,
+    response_model=LikeBatchOut,
+)
+async def like_tweets(
+    likes_in: LikeBatchIn,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """Like many tweets at once, the outcome is reported for each tweet"""
+    outcomes = await add_likes(
+        session, tweet_ids=likes_in.tweet_ids, user_id=current_user.id
+    )
+    if "liked" in outcomes.values():
+        await bump_versions(session, TWEETS_SCOPE)
+        await session.commit()
+        response_cache.invalidate(TWEETS_SCOPE)
+
+    return {
+        "result": True,
+        "results": [
+            {"tweet_id": tweet_id, "status": outcome}
+            for tweet_id, outcome in outcomes.items()
+        ],
+    }
+
+
 @router.delete(
     "/tweets/{tweet_id}/likes",
     status_code=status.HTTP_200_OK,
@@ -118,18 +228,14 @@ async def like_a_tweet(
 async def delete_like_from_tweet(
     tweet_id: int,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
-    await session.commit()
-    test_tweet = await get_tweet_by_id(tweet_id=tweet_id, session=session)
-    like = await get_like_by_id(
-        session, tweet_id=test_tweet.id, user_id=current_user.id
-    )
-    if like:
-        await session.delete(like)
+    if await remove_like(session, tweet_id=tweet_id, user_id=current_user.id):
+        await bump_versions(session, TWEETS_SCOPE)
         await session.commit()
+        response_cache.invalidate(TWEETS_SCOPE)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -141,46 +247,187 @@ async def delete_like_from_tweet(
 
 @router.get("/tweets", status_code=status.HTTP_200_OK)
 async def get_tweets(
+    request: Request,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
-    session: AsyncSession = Depends(async_get_db),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
 ):
-    all_tweets = await get_all_tweets(session=session)
-    all_following_tweets = []
-    if all_tweets is None:
-        all_tweets = "No tweets found"
-    else:
-        for tweet in all_tweets:
-            single_tweet = dict()
-            single_tweet["id"] = tweet.id
-            single_tweet["content"] = tweet.tweet_data
-            single_tweet_media = []
-            for media in tweet.media:
-                single_tweet_media.append(media.media_path)
-            single_tweet["attachments"] = single_tweet_media
-            single_tweet_author = dict()
-
-            single_tweet_author["id"] = tweet.user_id
-            tweet_author = await get_user_by_id(tweet.user_id, session)
-            single_tweet_author["name"] = tweet_author.username
-            single_tweet["author"] = single_tweet_author
-
-            single_tweet_likes = []
-            for like in tweet.likes:
-                single_like = dict()
-                single_like["user_id"] = like.user_id
-                tweet_author = await get_user_by_id(like.user_id, session)
-                single_like["name"] = tweet_author.username
-                single_tweet_likes.append(single_like)
-            single_tweet["likes"] = single_tweet_likes
-
-            all_following_tweets.append(single_tweet)
-        all_tweets = all_following_tweets
+    versions = await get_versions(session, TWEETS_SCOPE)
+    etag = make_etag(*versions)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    # Only the first pages are shared by many clients, deeper pages and
+    # polls for newer tweets would just churn the cache.
+    cache_key = None
+    if cursor is None and since_id is None:
+        cache_key = (TWEETS_SCOPE, limit)
+        cached = response_cache.get(cache_key, etag)
+        if cached is not None:
+            return cached_response(request, cached)
+
+    with hydration():
+        all_tweets, next_cursor = await get_all_tweets(
+            session=session,
+            limit=limit,
+            cursor=cursor,
+            since_id=since_id,
+            version=versions,
+        )
+        all_tweets = await serialize_tweets(session, all_tweets)
     answer = dict()
     answer["result"] = True
     answer["tweets"] = all_tweets
-    return JSONResponse(content=answer, status_code=200)
+    answer["next_cursor"] = next_cursor
+    with timed("serialize"):
+        body = orjson.dumps(answer)
+    if cache_key is not None:
+        cached = response_cache.set(cache_key, etag, body)
+        return cached_response(request, cached)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
+
+
+# Declared before /tweets/{user_id}, which would otherwise match it.
+@router.get(
+    "/tweets/search",
+    status_code=status.HTTP_200_OK,
+    response_model=TweetOut,
+)
+async def get_search_tweets(
+    request: Request,
+    q: Annotated[str, Query(min_length=1, max_length=SEARCH_QUERY_MAX_LENGTH)],
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    versions = await get_versions(session, TWEETS_SCOPE)
+    etag = make_etag(*versions)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    with hydration():
+        found_tweets, next_cursor = await search_tweets(
+            session=session, text=q, limit=limit, cursor=cursor
+        )
+        tweets = await serialize_tweets(session, found_tweets)
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = tweets
+    answer["next_cursor"] = next_cursor
+    with timed("serialize"):
+        response = ORJSONResponse(
+            content=answer,
+            status_code=200,
+            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+        )
+    return response
+
+
+@router.get(
+    "/tweets/tags/{tag}",
+    status_code=status.HTTP_200_OK,
+    response_model=TweetOut,
+)
+async def get_tweets_by_tag(
+    tag: str,
+    request: Request,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+):
+    versions = await get_versions(session, TWEETS_SCOPE)
+    etag = make_etag(*versions)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    with hydration():
+        tagged_tweets, next_cursor = await get_tagged_tweets(
+            session=session,
+            tag=tag.lstrip("#"),
+            limit=limit,
+            cursor=cursor,
+            since_id=since_id,
+            version=versions,
+        )
+        tweets = await serialize_tweets(session, tagged_tweets)
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = tweets
+    answer["next_cursor"] = next_cursor
+    with timed("serialize"):
+        response = ORJSONResponse(
+            content=answer,
+            status_code=200,
+            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+        )
+    return response
+
+
+@router.get(
+    "/tweets/mentions/{user_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=TweetOut,
+)
+async def get_tweets_mentioning_user(
+    user_id: int,
+    request: Request,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+):
+    versions = await get_versions(session, TWEETS_SCOPE)
+    etag = make_etag(*versions)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    with hydration():
+        mentioning_tweets, next_cursor = await get_mentioning_tweets(
+            session=session,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+            since_id=since_id,
+            version=versions,
+        )
+        tweets = await serialize_tweets(session, mentioning_tweets)
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = tweets
+    answer["next_cursor"] = next_cursor
+    with timed("serialize"):
+        response = ORJSONResponse(
+            content=answer,
+            status_code=200,
+            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+        )
+    return response
 
 
 @router.get(
@@ -190,13 +437,40 @@ async def get_tweets(
 )
 async def get_following_tweets(
     user_id: int,
+    request: Request,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
-    session: AsyncSession = Depends(async_get_db),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=TIMELINE_MAX_PAGE_SIZE)
+    ] = TIMELINE_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
 ):
-    all_tweets = await get_all_following_tweets(
-        session=session, current_user=user_id
-    )
+    versions = await get_versions(session, TWEETS_SCOPE, user_scope(user_id))
+    etag = make_etag(*versions)
+    if etag_matches(request, etag):
+        return not_modified(etag)
 
-    return {"tweets": all_tweets}
+    with hydration():
+        all_tweets, next_cursor = await get_all_following_tweets(
+            session=session,
+            user_id=user_id,
+            limit=limit,
+            cursor=cursor,
+            since_id=since_id,
+            version=versions,
+        )
+        tweets = await serialize_tweets(session, all_tweets)
+    answer: Dict[str, Any] = dict()
+    answer["result"] = True
+    answer["tweets"] = tweets
+    answer["next_cursor"] = next_cursor
+    with timed("serialize"):
+        response = ORJSONResponse(
+            content=answer,
+            status_code=200,
+            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+        )
+    return response
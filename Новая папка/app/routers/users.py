@@ -1,81 +1,227 @@
-from typing import Annotated, Any, Dict
+from typing import Annotated, Any, Dict, List, Optional, Sequence, Tuple
 
-from database.database import async_get_db
-from database.utils import check_follow_user_ability, get_user_by_id
-from fastapi import APIRouter, Depends, HTTPException, status
-from models.users import User
+import orjson
+from database.database import async_get_db, async_get_read_db
+from database.follow_graph import notify_follow_edit
+from database.timeline import backfill_home_timeline, retract_home_timeline
+from database.utils import (
+    Profile,
+    follow_users,
+    get_follow_page,
+    get_user_by_id,
+    get_user_profile,
+    unfollow_user,
+)
+from database.versions import bump_versions, get_versions, user_scope
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse
 from schemas.base_schema import DefaultSchema
-from schemas.user_schema import UserOutSchema
+from schemas.user_schema import FollowBatchIn, FollowBatchOut, FollowListOut
 from sqlalchemy.ext.asyncio import AsyncSession
-from starlette.responses import JSONResponse
-from utils.auth import authenticate_user
+from starlette.responses import Response
+from utils.auth import Principal, authenticate_user, invalidate_user
+from utils.etag import CACHE_CONTROL, etag_matches, make_etag, not_modified
+from utils.response_cache import cached_response, response_cache
+from utils.settings import (
+    FOLLOW_MAX_PAGE_SIZE,
+    FOLLOW_PAGE_SIZE,
+    PROFILE_PREVIEW_SIZE,
+)
+from utils.timing import hydration, timed
 
 router = APIRouter(prefix="/api", tags=["users_v1"])
 
 
+def serialize_follows(
+    users: Sequence[Tuple[int, str]]
+) -> List[Dict[str, Any]]:
+    return [{"id": user_id, "name": username} for user_id, username in users]
+
+
+def serialize_user(
+    profile: Profile,
+    followers: Sequence[Tuple[int, str]],
+    followings: Sequence[Tuple[int, str]],
+) -> Dict[str, Any]:
+    """
+    Build the profile payload of a user: the counters and a preview of
+    the follow lists, the full lists are paged separately.
+    """
+    return {
+        "id": profile.id,
+        "name": profile.username,
+        "followers": serialize_follows(followers),
+        "followings": serialize_follows(followings),
+        "followers_count": profile.follower_count,
+        "followings_count": profile.following_count,
+        "tweets_count": profile.tweet_count,
+        "likes_received_count": profile.received_like_count,
+    }
+
+
+async def get_profile_response(
+    request: Request, session: AsyncSession, user_id: int
+) -> Response:
+    """
+    Answer a profile request from the ETag or the response cache when
+    neither the follows of the user nor their counters changed.
+    """
+    versions = await get_versions(session, user_scope(user_id))
+    # Tweets and likes show on a profile through the counters of its
+    # user only, so the counters tag them without a version every tweet
+    # and like write would bump.
+    profile = await get_user_profile(session, user_id)
+    # The tag carries the user id: /users/me is the same URL for every
+    # caller, and the cache entry is shared with /users/{user_id}.
+    etag = make_etag(
+        user_id, *versions, profile.tweet_count, profile.received_like_count
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    cache_key = (user_scope(user_id), None)
+    cached = response_cache.get(cache_key, etag)
+    if cached is None:
+        with hydration():
+            followers, _ = await get_follow_page(
+                session, user_id, "followers", PROFILE_PREVIEW_SIZE
+            )
+            followings, _ = await get_follow_page(
+                session,
+                user_id,
+                "following",
+                PROFILE_PREVIEW_SIZE,
+                version=versions[0],
+            )
+            answer: Dict[str, Any] = dict()
+            answer["result"] = True
+            answer["user"] = serialize_user(profile, followers, followings)
+        with timed("serialize"):
+            body = orjson.dumps(answer)
+        cached = response_cache.set(cache_key, etag, body)
+    return cached_response(request, cached)
+
+
 @router.get("/users/me", status_code=status.HTTP_200_OK)
 async def get_info_about_me(
+    request: Request,
     current_user: Annotated[
-        UserOutSchema, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
 ):
-    user = dict()
-    user["id"] = current_user.id
-    user["name"] = current_user.username
-    all_followers = list()
-    followers = current_user.followers
-    for follower in followers:
-        follower_user = dict()
-        follower_user["id"] = follower.id
-        follower_user["name"] = follower.username
-        all_followers.append(follower_user)
-    user["followers"] = all_followers
-    all_followings = list()
-    followings = current_user.following
-    for following in followings:
-        following_user = dict()
-        following_user["id"] = following.id
-        following_user["name"] = following.username
-        all_followings.append(following_user)
-    user["followings"] = all_followings
-    answer: Dict[str, Any] = dict()
-    answer["user"] = user
-    answer["result"] = True
-    return JSONResponse(content=answer, status_code=200)
+    return await get_profile_response(request, session, current_user.id)
 
 
 @router.get("/users/{user_id}", status_code=status.HTTP_200_OK)
 async def get_info_of_user_by_id(
     user_id: int,
-    session: AsyncSession = Depends(async_get_db),
+    request: Request,
+    session: AsyncSession = Depends(async_get_read_db),
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
 ):
-    user_ = await get_user_by_id(user_id, session)
-    user = dict()
-    user["id"] = user_.id
-    user["name"] = user_.username
-    all_followers = list()
-    followers = user_.followers
-    for follower in followers:
-        follower_user = dict()
-        follower_user["id"] = follower.id
-        follower_user["name"] = follower.username
-        all_followers.append(follower_user)
-    user["followers"] = all_followers
-    all_followings = list()
-    followings = user_.following
-    for following in followings:
-        following_user = dict()
-        following_user["id"] = following.id
-        following_user["name"] = following.username
-        all_followings.append(following_user)
-    user["followings"] = all_followings
+    return await get_profile_response(request, session, user_id)
+
+
+async def get_follow_list_response(
+    request: Request,
+    session: AsyncSession,
+    user_id: int,
+    direction: str,
+    limit: int,
+    cursor: Optional[str],
+) -> Response:
+    (version,) = await get_versions(session, user_scope(user_id))
+    etag = make_etag(user_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    with hydration():
+        await get_user_by_id(user_id, session)
+        users, next_cursor = await get_follow_page(
+            session, user_id, direction, limit, cursor, version
+        )
     answer: Dict[str, Any] = dict()
     answer["result"] = True
-    answer["user"] = user
-    return JSONResponse(content=answer, status_code=200)
+    answer["users"] = serialize_follows(users)
+    answer["next_cursor"] = next_cursor
+    with timed("serialize"):
+        response = ORJSONResponse(
+            content=answer,
+            status_code=200,
+            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+        )
+    return response
+
+
+@router.get(
+    "/users/{user_id}/followers",
+    status_code=status.HTTP_200_OK,
+    response_model=FollowListOut,
+)
+async def get_followers_of_user(
+    user_id: int,
+    request: Request,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=FOLLOW_MAX_PAGE_SIZE)
+    ] = FOLLOW_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    """Page through the followers of a user, the newest accounts first"""
+    return await get_follow_list_response(
+        request, session, user_id, "followers", limit, cursor
+    )
+
+
+@router.get(
+    "/users/{user_id}/following",
+    status_code=status.HTTP_200_OK,
+    response_model=FollowListOut,
+)
+async def get_followings_of_user(
+    user_id: int,
+    request: Request,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=FOLLOW_MAX_PAGE_SIZE)
+    ] = FOLLOW_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    """Page through the users a user follows, the newest accounts first"""
+    return await get_follow_list_response(
+        request, session, user_id, "following", limit, cursor
+    )
+
+
+@router.get(
+    "/users/{user_id}/mutual",
+    status_code=status.HTTP_200_OK,
+    response_model=FollowListOut,
+)
+async def get_mutual_follows_of_user(
+    user_id: int,
+    request: Request,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_read_db),
+    limit: Annotated[
+        int, Query(ge=1, le=FOLLOW_MAX_PAGE_SIZE)
+    ] = FOLLOW_PAGE_SIZE,
+    cursor: Optional[str] = None,
+):
+    """Page through the users who follow a user back"""
+    return await get_follow_list_response(
+        request, session, user_id, "mutual", limit, cursor
+    )
 
 
 @router.post(
@@ -86,25 +232,91 @@ async def get_info_of_user_by_id(
 async def follow_user(
     user_id: int,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
-    user_to_follow = await get_user_by_id(user_id, session)
-    following_ability = await check_follow_user_ability(
-        current_user, user_to_follow
+    outcomes = await follow_users(
+        session, follower_id=current_user.id, user_ids=[user_id]
     )
-    if following_ability:
-        user_to_follow.followers.append(current_user)
-        await session.commit()
-    else:
+    outcome = outcomes[user_id]
+    if outcome == "not_found":
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User does not exist.",
+        )
+    elif outcome == "self":
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unable to follow yourself",
+        )
+    elif outcome == "already_following":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You already follow that user!",
         )
+
+    await backfill_home_timeline(
+        session, owner_id=current_user.id, author_ids=[user_id]
+    )
+    versions = await bump_versions(
+        session, user_scope(current_user.id), user_scope(user_id)
+    )
+    await notify_follow_edit(
+        session, current_user.id, [user_id], versions, followed=True
+    )
+    await session.commit()
+    invalidate_user(current_user.id)
+    invalidate_user(user_id)
+    response_cache.invalidate(user_scope(current_user.id), user_scope(user_id))
     return {"result": True}
 
 
+@router.post(
+    "/users/follow",
+    status_code=status.HTTP_200_OK,
+    response_model=FollowBatchOut,
+)
+async def follow_many_users(
+    follow_in: FollowBatchIn,
+    current_user: Annotated[
+        Principal, "Principal obtained from the api key"
+    ] = Depends(authenticate_user),
+    session: AsyncSession = Depends(async_get_db),
+):
+    """Follow many users at once, the outcome is reported for each user"""
+    outcomes = await follow_users(
+        session, follower_id=current_user.id, user_ids=follow_in.user_ids
+    )
+    followed_ids = [
+        user_id
+        for user_id, outcome in outcomes.items()
+        if outcome == "followed"
+    ]
+    if followed_ids:
+        await backfill_home_timeline(
+            session, owner_id=current_user.id, author_ids=followed_ids
+        )
+        scopes = [user_scope(user_id) for user_id in followed_ids]
+        scopes.append(user_scope(current_user.id))
+        versions = await bump_versions(session, *scopes)
+        await notify_follow_edit(
+            session, current_user.id, followed_ids, versions, followed=True
+        )
+        await session.commit()
+        for user_id in [current_user.id, *followed_ids]:
+            invalidate_user(user_id)
+        response_cache.invalidate(*scopes)
+
+    return {
+        "result": True,
+        "results": [
+            {"user_id": user_id, "status": outcome}
+            for user_id, outcome in outcomes.items()
+        ],
+    }
+
+
 @router.delete(
     "/users/{user_id}/follow",
     status_code=status.HTTP_200_OK,
@@ -113,18 +325,30 @@ async def follow_user(
 async def unsubscribe_from_user(
     user_id: int,
     current_user: Annotated[
-        User, "User model obtained from the api key"
+        Principal, "Principal obtained from the api key"
     ] = Depends(authenticate_user),
     session: AsyncSession = Depends(async_get_db),
 ):
-    follower_deleted = await get_user_by_id(user_id, session)
-
-    if follower_deleted not in current_user.following:
+    await get_user_by_id(user_id, session)
+    if not await unfollow_user(
+        session, follower_id=current_user.id, following_id=user_id
+    ):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="You are not following this user.",
         )
 
-    current_user.following.remove(follower_deleted)
+    await retract_home_timeline(
+        session, owner_id=current_user.id, author_id=user_id
+    )
+    versions = await bump_versions(
+        session, user_scope(current_user.id), user_scope(user_id)
+    )
+    await notify_follow_edit(
+        session, current_user.id, [user_id], versions, followed=False
+    )
     await session.commit()
+    invalidate_user(current_user.id)
+    invalidate_user(user_id)
+    response_cache.invalidate(user_scope(current_user.id), user_scope(user_id))
     return {"result": True}
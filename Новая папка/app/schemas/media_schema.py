@@ -1,3 +1,5 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 
 from .base_schema import ConfigDict, DefaultSchema
@@ -10,3 +12,13 @@ class MediaUpload(DefaultSchema):
 
 class Media(BaseModel):
     media_path: str
+
+
+class MediaBatchResult(BaseModel):
+    filename: Optional[str]
+    media_id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class MediaBatchOut(DefaultSchema):
+    medias: List[MediaBatchResult]
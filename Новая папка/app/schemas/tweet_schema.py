@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from models.likes import Like as LikeModel
 from pydantic import (
@@ -8,6 +8,7 @@ from pydantic import (
     field_validator,
     model_validator,
 )
+from utils.settings import BATCH_MAX_SIZE
 
 from .base_schema import DefaultSchema
 from .media_schema import Media
@@ -60,3 +61,17 @@ class Tweet(BaseModel):
 
 class TweetOut(DefaultSchema):
     tweets: List[Tweet]
+    next_cursor: Optional[str] = None
+
+
+class LikeBatchIn(BaseModel):
+    tweet_ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+
+
+class LikeBatchResult(BaseModel):
+    tweet_id: int
+    status: Literal["liked", "already_liked", "own_tweet", "not_found"]
+
+
+class LikeBatchOut(DefaultSchema):
+    results: List[LikeBatchResult]
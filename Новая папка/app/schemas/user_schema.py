@@ -1,6 +1,7 @@
-from typing import List
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
+from utils.settings import BATCH_MAX_SIZE
 
 from .base_schema import DefaultSchema
 
@@ -14,8 +15,30 @@ class DefaultUser(BaseModel):
 class User(DefaultUser):
     model_config = ConfigDict(from_attributes=True)
     followers: List[DefaultUser]
-    following: List[DefaultUser]
+    followings: List[DefaultUser]
+    followers_count: int
+    followings_count: int
+    tweets_count: int
+    likes_received_count: int
 
 
 class UserOutSchema(DefaultSchema):
     user: User
+
+
+class FollowListOut(DefaultSchema):
+    users: List[DefaultUser]
+    next_cursor: Optional[str] = None
+
+
+class FollowBatchIn(BaseModel):
+    user_ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_SIZE)
+
+
+class FollowBatchResult(BaseModel):
+    user_id: int
+    status: Literal["followed", "already_following", "self", "not_found"]
+
+
+class FollowBatchOut(DefaultSchema):
+    results: List[FollowBatchResult]
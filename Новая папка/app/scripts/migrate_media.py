@@ -0,0 +1,95 @@
+"""
+One-off migration of media stored flat in MEDIA_PATH to content-addressed
+storage.
+
+Run from the app directory once the media_files table exists:
+
+    python -m scripts.migrate_media
+
+Every Media row without a sha256 is hashed, its file is hard-linked to the
+sharded path (unless the same content is already stored) and the row is
+pointed at the new path. The old file is removed only after the batch is
+committed, so the script can be re-run safely after an interruption.
+"""
+
+import asyncio
+import logging
+from hashlib import sha256
+from pathlib import Path
+from typing import Tuple
+
+from aiofiles import os as aiofiles_os
+from database.database import session
+from database.utils import add_media_file_reference
+from models.media import Media
+from sqlalchemy import select
+from utils.file_utils import SavedFile, discard_file, get_storage_path
+from utils.settings import MEDIA_CHUNK_SIZE, MEDIA_PATH
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def hash_file(path: Path) -> Tuple[str, int]:
+    file_hash = sha256()
+    size = 0
+    with path.open("rb") as file:
+        while chunk := file.read(MEDIA_CHUNK_SIZE):
+            size += len(chunk)
+            file_hash.update(chunk)
+    return file_hash.hexdigest(), size
+
+
+async def migrate_batch(last_id: int) -> int:
+    """
+    Migrate the next batch of media rows.
+    :param last_id: Id of the last row handled by the previous batch.
+    :return: Id of the last row of this batch, 0 when nothing is left.
+    """
+    async with session() as db:
+        query = await db.execute(
+            select(Media)
+            .where(Media.sha256.is_(None), Media.id > last_id)
+            .order_by(Media.id)
+            .limit(BATCH_SIZE)
+        )
+        media_objects = query.scalars().all()
+        old_paths = []
+        for media in media_objects:
+            old_path = MEDIA_PATH / media.media_path
+            if not old_path.is_file():
+                logger.warning("Media %s: %s is missing", media.id, old_path)
+                continue
+            digest, size = await asyncio.to_thread(hash_file, old_path)
+            saved_file = SavedFile(
+                path=get_storage_path(digest, old_path.suffix),
+                sha256=digest,
+                size=size,
+                temp_path=old_path,
+            )
+            media_path, _ = await add_media_file_reference(db, saved_file)
+            new_path = MEDIA_PATH / media_path
+            if not await aiofiles_os.path.exists(new_path):
+                await aiofiles_os.makedirs(new_path.parent, exist_ok=True)
+                await aiofiles_os.link(old_path, new_path)
+            media.media_path = media_path
+            media.sha256 = digest
+            media.size = size
+            old_paths.append(old_path)
+        await db.commit()
+
+    for old_path in old_paths:
+        await discard_file(old_path)
+    return media_objects[-1].id if media_objects else 0
+
+
+async def main():
+    last_id = 0
+    while last_id := await migrate_batch(last_id):
+        logger.info("Migrated media up to id %s", last_id)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
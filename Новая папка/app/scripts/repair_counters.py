@@ -0,0 +1,45 @@
+"""
+Recompute the follow, tweet and received like counters of users.
+
+The counters are updated by the statements that change the rows they
+count, this job fixes any drift, e.g. after rows were changed by hand.
+Run from the app directory, safe to run on a live database:
+
+    python -m scripts.repair_counters [--batch-size 500]
+
+Users are handled in batches of ascending ids, each batch is committed
+on its own so row locks are held briefly.
+"""
+
+import argparse
+import asyncio
+import logging
+
+import models.media  # noqa: F401
+from database.counters import repair_counters
+from database.database import session
+
+logger = logging.getLogger(__name__)
+
+
+async def main(batch_size: int):
+    last_id = 0
+    total = 0
+    while True:
+        async with session() as db:
+            last_id, repaired = await repair_counters(db, last_id, batch_size)
+            await db.commit()
+        if not last_id:
+            break
+        total += repaired
+        if repaired:
+            logger.info("Repaired %s users up to id %s", repaired, last_id)
+    logger.info("Repaired the counters of %s users", total)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size))
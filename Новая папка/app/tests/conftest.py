@@ -1,11 +1,13 @@
 import os
 from collections.abc import AsyncGenerator
-from typing import Dict, Mapping
+from typing import Callable, ContextManager, Dict, Mapping
 
 import pytest
 import pytest_asyncio
 from database.database import Base
 from database.database import async_get_db as get_db_session
+from database.database import async_get_read_db as get_read_db_session
+from database.query_stats import QueryStats, instrument_engine, track_queries
 from faker import Faker
 from fastapi import FastAPI
 from httpx import AsyncClient
@@ -17,6 +19,8 @@ from sqlalchemy.ext.asyncio import (
     async_sessionmaker,
     create_async_engine,
 )
+from utils.auth import clear_auth_cache
+from utils.response_cache import response_cache
 
 TEST_USERNAME = os.environ.get("USERNAME")
 TEST_API_KEY = os.environ.get("API_KEY")
@@ -37,7 +41,10 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
         f'{os.environ.get("DB_HOST")}'
         f':5432/{os.environ.get("DB_NAME")}'
     )
+    clear_auth_cache()
+    response_cache.clear()
     engine = create_async_engine(DATABASE_URL, echo=True)
+    instrument_engine(engine)
     async_session = async_sessionmaker(engine, expire_on_commit=False)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
@@ -58,6 +65,7 @@ async def db_session() -> AsyncGenerator[AsyncSession, None]:
 def test_app(db_session: AsyncSession) -> FastAPI:
     """Create a test app with overridden dependencies."""
     app.dependency_overrides[get_db_session] = lambda: db_session
+    app.dependency_overrides[get_read_db_session] = lambda: db_session
     return app
 
 
@@ -88,6 +96,21 @@ async def invalid_client(
         yield client
 
 
+@pytest.fixture()
+def query_stats(
+    db_session: AsyncSession,
+) -> Callable[[], ContextManager[QueryStats]]:
+    """
+    Count the queries of the requests sent inside the returned context
+    manager, to assert the query budget of an endpoint:
+
+        with query_stats() as stats:
+            await client.get(...)
+        assert stats.count <= 3
+    """
+    return track_queries
+
+
 @pytest_asyncio.fixture()
 async def create_random_tweets(
     client: AsyncClient, faker: Faker, db_session: AsyncSession
@@ -0,0 +1,9 @@
+from benchmarks import bench_serialization
+
+
+class TestBenchmarks:
+    def test_bench_serialization_runs(self, capsys):
+        bench_serialization.main(tweet_count=2, like_count=1, number=1)
+        lines = capsys.readouterr().out.splitlines()
+        # The header, then three payloads for every response class.
+        assert len(lines) == 1 + 3 * len(bench_serialization.RESPONSE_CLASSES)
@@ -1,12 +1,18 @@
+from hashlib import sha256
 from io import BytesIO
 from pathlib import Path
 from shutil import rmtree
 
 import pytest
+from database.media_gc import collect_deleted_media, sweep_unattached_media
 from httpx import AsyncClient
-from utils.settings import MEDIA_PATH
+from models.media import Media, MediaFile
+from PIL import Image
+from utils.file_utils import get_storage_path
+from utils.middleware import BodySizeLimitMiddleware
+from utils.settings import IMAGE_VARIANT_SIZES, MEDIA_PATH
 
-from .conftest import TEST_USERNAME
+from .conftest import TEST_API_KEY, TEST_USERNAME
 
 
 @pytest.fixture(scope="class")
@@ -36,6 +42,220 @@ class TestMediaAPI:
             assert response.status_code == 201
             assert response.json() == {"result": True, "media_id": 1}
 
+    @pytest.mark.asyncio
+    async def test_media_hash_and_size(
+        self, client: AsyncClient, db_session, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            content = b"test media content"
+            files = {"file": ("hashed.jpg", BytesIO(content))}
+            response = await client.post(self.base_url, files=files)
+            media = await db_session.get(Media, response.json()["media_id"])
+
+            assert response.status_code == 201
+            assert media.sha256 == sha256(content).hexdigest()
+            assert media.size == len(content)
+
+    @pytest.mark.asyncio
+    async def test_media_deduplicated(
+        self, client: AsyncClient, db_session, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            content = b"duplicated media content"
+            media_ids = []
+            for filename in ("first.png", "second.png"):
+                files = {"file": (filename, BytesIO(content))}
+                response = await client.post(self.base_url, files=files)
+                media_ids.append(response.json()["media_id"])
+            first, second = [
+                await db_session.get(Media, media_id) for media_id in media_ids
+            ]
+            media_file = await db_session.get(MediaFile, first.sha256)
+
+            assert first.media_path == second.media_path
+            assert first.media_path.endswith(f"{first.sha256}.png")
+            assert (MEDIA_PATH / first.media_path).read_bytes() == content
+            assert media_file.ref_count == 2
+
+    @pytest.mark.asyncio
+    async def test_media_batch_upload(
+        self, client: AsyncClient, db_session, monkeypatch, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            monkeypatch.setattr("utils.file_utils.MEDIA_MAX_SIZE", 10)
+            content = b"batch"
+            files = [
+                ("files", ("first.png", BytesIO(content))),
+                ("files", ("second.png", BytesIO(content))),
+                ("files", ("too_large.png", BytesIO(b"large content"))),
+            ]
+            response = await client.post(f"{self.base_url}/batch", files=files)
+            medias = response.json()["medias"]
+            media_file = await db_session.get(
+                MediaFile, sha256(content).hexdigest()
+            )
+
+            assert response.status_code == 201
+            assert [media["filename"] for media in medias] == [
+                "first.png",
+                "second.png",
+                "too_large.png",
+            ]
+            assert medias[0]["media_id"] != medias[1]["media_id"]
+            assert medias[2]["media_id"] is None
+            assert medias[2]["error"] == "File is larger than 10 bytes."
+            assert media_file.ref_count == 2
+
+    @pytest.mark.asyncio
+    async def test_media_file_removed_with_last_reference(
+        self, client: AsyncClient, db_session, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            content = b"shared media content"
+            tweet_ids = []
+            for _ in range(2):
+                files = {"file": ("shared.png", BytesIO(content))}
+                response = await client.post(self.base_url, files=files)
+                response = await client.post(
+                    "/tweets",
+                    json={
+                        "tweet_data": "with media",
+                        "tweet_media_ids": [response.json()["media_id"]],
+                    },
+                )
+                tweet_ids.append(response.json()["tweet_id"])
+            stored_hash = sha256(content).hexdigest()
+            stored_path = MEDIA_PATH / get_storage_path(stored_hash, ".png")
+
+            await client.delete(f"/tweets/{tweet_ids[0]}")
+            await collect_deleted_media(db_session)
+            assert stored_path.exists()
+            await client.delete(f"/tweets/{tweet_ids[1]}")
+            assert stored_path.exists()
+            assert await collect_deleted_media(db_session) == 1
+            assert not stored_path.exists()
+            assert await db_session.get(MediaFile, stored_hash) is None
+
+    @pytest.mark.asyncio
+    async def test_media_file_uploaded_again_after_delete(
+        self, client: AsyncClient, db_session, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            content = b"media content uploaded again"
+            files = {"file": ("again.png", BytesIO(content))}
+            response = await client.post(self.base_url, files=files)
+            response = await client.post(
+                "/tweets",
+                json={
+                    "tweet_data": "with media",
+                    "tweet_media_ids": [response.json()["media_id"]],
+                },
+            )
+            await client.delete(f"/tweets/{response.json()['tweet_id']}")
+
+            files = {"file": ("again.png", BytesIO(content))}
+            response = await client.post(self.base_url, files=files)
+            assert response.status_code == 201
+            stored_hash = sha256(content).hexdigest()
+            media_file = await db_session.get(MediaFile, stored_hash)
+            await db_session.refresh(media_file)
+            assert media_file.ref_count == 1
+            assert media_file.deleted_at is None
+
+            assert await collect_deleted_media(db_session) == 0
+            stored_path = MEDIA_PATH / get_storage_path(stored_hash, ".png")
+            assert stored_path.read_bytes() == content
+
+    @pytest.mark.asyncio
+    async def test_unattached_media_swept(
+        self, client: AsyncClient, db_session, monkeypatch, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            monkeypatch.setattr("database.media_gc.MEDIA_ORPHAN_MAX_AGE", -60)
+            content = b"unattached media content"
+            files = {"file": ("unattached.png", BytesIO(content))}
+            response = await client.post(self.base_url, files=files)
+            media_id = response.json()["media_id"]
+            stored_hash = sha256(content).hexdigest()
+
+            assert await sweep_unattached_media(db_session) == 1
+            assert await db_session.get(Media, media_id) is None
+            media_file = await db_session.get(MediaFile, stored_hash)
+            await db_session.refresh(media_file)
+            assert media_file.deleted_at is not None
+
+            assert await collect_deleted_media(db_session) == 1
+            assert not (MEDIA_PATH / media_file.media_path).exists()
+
+    @pytest.mark.asyncio
+    async def test_image_variants(
+        self, client: AsyncClient, db_session, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            image_file = BytesIO()
+            Image.new("RGB", (1600, 1200), "red").save(image_file, "PNG")
+            image_file.seek(0)
+            files = {"file": ("photo.png", image_file, "image/png")}
+            response = await client.post(self.base_url, files=files)
+            media = await db_session.get(Media, response.json()["media_id"])
+            await db_session.refresh(media)
+
+            assert response.status_code == 201
+            assert media.thumbnail_path.endswith("_thumbnail.webp")
+            assert media.medium_path.endswith("_medium.webp")
+            with Image.open(MEDIA_PATH / media.thumbnail_path) as thumbnail:
+                assert thumbnail.format == "WEBP"
+                assert max(thumbnail.size) == IMAGE_VARIANT_SIZES["thumbnail"]
+
+    @pytest.mark.asyncio
+    async def test_media_too_large(
+        self, client: AsyncClient, monkeypatch, temp_media_dir
+    ):
+        if hasattr(self, "base_url"):
+            monkeypatch.setattr("utils.file_utils.MEDIA_MAX_SIZE", 2)
+            files = {"file": ("too_large.jpg", BytesIO(b"test"))}
+            response = await client.post(self.base_url, files=files)
+
+            assert response.status_code == 413
+            assert response.json()["result"] is False
+            assert not (MEDIA_PATH / "too_large.jpg").exists()
+
+    @pytest.mark.asyncio
+    async def test_upload_body_limit(self, test_app, temp_media_dir):
+        if hasattr(self, "base_url"):
+            limited_app = BodySizeLimitMiddleware(
+                test_app, limits={f"/api{self.base_url}": 500}
+            )
+            async with AsyncClient(
+                app=limited_app,
+                base_url="http://localhost/api",
+                headers={"api-key": str(TEST_API_KEY)},
+            ) as client:
+                files = {"file": ("large.jpg", BytesIO(b"x" * 1000))}
+                response = await client.post(self.base_url, files=files)
+                assert response.status_code == 413
+                assert response.json()["result"] is False
+
+                async def chunked_form():
+                    yield b"--limit\r\nContent-Disposition: form-data; "
+                    yield b'name="file"; filename="large.jpg"\r\n\r\n'
+                    yield b"x" * 1000
+                    yield b"\r\n--limit--\r\n"
+
+                response = await client.post(
+                    self.base_url,
+                    content=chunked_form(),
+                    headers={
+                        "content-type": "multipart/form-data; boundary=limit"
+                    },
+                )
+                assert response.status_code == 413
+                assert response.json()["result"] is False
+
+                files = {"file": ("small.jpg", BytesIO(b"x"))}
+                response = await client.post(self.base_url, files=files)
+                assert response.status_code == 201
+
     @pytest.mark.asyncio
     async def test_incorrect_api_key(self, client: AsyncClient):
         if hasattr(self, "base_url") and hasattr(self, "files"):
@@ -0,0 +1,174 @@
+import marshal
+from typing import Dict
+
+import pytest
+from fastapi import FastAPI
+from httpx import AsyncClient
+from prometheus_client.parser import text_string_to_metric_families
+from utils.middleware import ProfilingMiddleware
+
+
+def sample_value(text: str, name: str, labels: Dict[str, str]) -> float:
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == name and sample.labels == labels:
+                return sample.value
+    return 0.0
+
+
+class TestMetricsAPI:
+    @classmethod
+    def setup_class(cls):
+        cls.base_url = "/metrics"
+        cls.metrics_token = "metrics-secret"
+
+    @pytest.fixture(autouse=True)
+    def enable_metrics(self, monkeypatch):
+        if hasattr(self, "metrics_token"):
+            monkeypatch.setattr(
+                "routers.metrics.METRICS_TOKEN", self.metrics_token
+            )
+
+    async def scrape(self, client: AsyncClient, url: str, token: str) -> str:
+        response = await client.get(
+            str(client.base_url.copy_with(path=url)),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        return response.text
+
+    @pytest.mark.asyncio
+    async def test_metrics_token(self, client: AsyncClient, monkeypatch):
+        if hasattr(self, "base_url") and hasattr(self, "metrics_token"):
+            url = str(client.base_url.copy_with(path=self.base_url))
+            response = await client.get(url)
+            assert response.status_code == 401
+            response = await client.get(
+                url, headers={"Authorization": "Bearer wrong"}
+            )
+            assert response.status_code == 401
+            await self.scrape(client, self.base_url, self.metrics_token)
+
+            monkeypatch.setattr("routers.metrics.METRICS_TOKEN", "")
+            response = await client.get(
+                url,
+                headers={"Authorization": f"Bearer {self.metrics_token}"},
+            )
+            assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_metrics_request_counters(self, client: AsyncClient):
+        if hasattr(self, "base_url") and hasattr(self, "metrics_token"):
+            labels = {
+                "method": "POST",
+                "route": "/api/users/{user_id}/follow",
+                "status": "404",
+            }
+            before = sample_value(
+                await self.scrape(client, self.base_url, self.metrics_token),
+                "http_responses_total",
+                labels,
+            )
+            await client.post("/users/10000/follow")
+            text = await self.scrape(client, self.base_url, self.metrics_token)
+            assert (
+                sample_value(text, "http_responses_total", labels)
+                == before + 1
+            )
+            assert (
+                sample_value(
+                    text,
+                    "http_request_duration_seconds_count",
+                    {"method": "POST", "route": labels["route"]},
+                )
+                >= 1
+            )
+            assert 'route="/api/users/10000/follow"' not in text
+
+    @pytest.mark.asyncio
+    async def test_metrics_caches_and_uploads(self, client: AsyncClient):
+        if hasattr(self, "base_url") and hasattr(self, "metrics_token"):
+            before = await self.scrape(
+                client, self.base_url, self.metrics_token
+            )
+            await client.get("/users/me")
+            await client.post(
+                "/medias", files={"file": ("metrics.bin", b"12345")}
+            )
+            text = await self.scrape(client, self.base_url, self.metrics_token)
+            hits = {"cache": "api_key", "result": "hit"}
+            assert sample_value(
+                text, "cache_requests_total", hits
+            ) > sample_value(before, "cache_requests_total", hits)
+            assert (
+                sample_value(text, "media_upload_bytes_total", {})
+                == sample_value(before, "media_upload_bytes_total", {}) + 5
+            )
+            assert (
+                sample_value(
+                    text,
+                    "db_pool_capacity_connections",
+                    {"engine": "primary"},
+                )
+                > 0
+            )
+
+
+class TestDiagnosticsAPI:
+    @classmethod
+    def setup_class(cls):
+        cls.base_url = "/tweets"
+        cls.profile_token = "profile-secret"
+
+    @pytest.mark.asyncio
+    async def test_server_timing_header(
+        self, client: AsyncClient, create_random_tweets
+    ):
+        if hasattr(self, "base_url"):
+            response = await client.get(self.base_url)
+            assert response.status_code == 200
+            phases = {
+                metric.split(";")[0]: metric
+                for metric in response.headers["server-timing"].split(", ")
+            }
+            assert {"auth", "hydrate", "serialize", "db", "total"} <= set(
+                phases
+            )
+            assert 'desc="' in phases["db"]
+
+    @pytest.mark.asyncio
+    async def test_profile_request(
+        self, client: AsyncClient, test_app: FastAPI
+    ):
+        if hasattr(self, "base_url") and hasattr(self, "profile_token"):
+            async with AsyncClient(
+                app=ProfilingMiddleware(
+                    test_app, token=self.profile_token, top=200
+                ),
+                base_url=client.base_url,
+                headers=client.headers,
+            ) as profiled_client:
+                response = await profiled_client.get(self.base_url)
+                assert response.json()["result"] is True
+
+                headers = {"X-Profile-Token": self.profile_token}
+                response = await profiled_client.get(
+                    self.base_url, headers=headers
+                )
+                assert response.status_code == 200
+                assert response.headers["x-profiled-status"] == "200"
+                assert "cumulative" in response.text
+                assert "get_tweets" in response.text
+
+                headers["X-Profile-Format"] = "pstats"
+                response = await profiled_client.get(
+                    self.base_url, headers=headers
+                )
+                assert isinstance(marshal.loads(response.content), dict)
+
+                headers["X-Profile-Token"] = "wrong"
+                response = await profiled_client.get(
+                    self.base_url, headers=headers
+                )
+                assert "x-profiled-status" not in response.headers
@@ -1,10 +1,21 @@
-from typing import Dict
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Union
 
 import pytest
+from database.utils import get_all_tweets, timeline_flight
+from database.versions import TWEETS_SCOPE, get_versions, shard_scopes
 from faker import Faker
 from httpx import AsyncClient
+from models.likes import Like
+from models.tweets import Tweet
+from models.versions import DataVersion
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from utils.pagination import encode_cursor
+from utils.response_cache import response_cache
 
-from .conftest import unauthorized_structure_response
+from .conftest import TEST_USERNAME, unauthorized_structure_response
 
 
 async def create_random_tweet(
@@ -101,6 +112,56 @@ class TestTweetAPI:
             assert response.status_code == 201
             assert response.json() == self.expected_response
 
+    @pytest.mark.asyncio
+    async def test_like_a_tweet_twice(
+        self, client: AsyncClient, db_session, create_random_tweets
+    ):
+        if hasattr(self, "expected_response") and hasattr(self, "likes_url"):
+            url = self.likes_url.format("1")
+            for _ in range(2):
+                response = await client.post(url)
+                assert response.status_code == 201
+                assert response.json() == self.expected_response
+
+            likes = await db_session.execute(
+                select(func.count()).where(Like.tweet_id == 1)
+            )
+            like_count = await db_session.execute(
+                select(Tweet.like_count).where(Tweet.id == 1)
+            )
+            assert likes.scalar_one() == 1
+            assert like_count.scalar_one() == 1
+
+            await client.delete(url)
+            like_count = await db_session.execute(
+                select(Tweet.like_count).where(Tweet.id == 1)
+            )
+            assert like_count.scalar_one() == 0
+
+    @pytest.mark.asyncio
+    async def test_like_tweets_batch(
+        self, client: AsyncClient, db_session, create_random_tweets
+    ):
+        if hasattr(self, "likes_url"):
+            await client.post(self.likes_url.format("1"))
+            response = await client.post(
+                "/tweets/likes", json={"tweet_ids": [1, 2, 1000]}
+            )
+            like_count = await db_session.execute(
+                select(Tweet.like_count).where(Tweet.id == 2)
+            )
+
+            assert response.status_code == 200
+            assert response.json() == {
+                "result": True,
+                "results": [
+                    {"tweet_id": 1, "status": "already_liked"},
+                    {"tweet_id": 2, "status": "liked"},
+                    {"tweet_id": 1000, "status": "not_found"},
+                ],
+            }
+            assert like_count.scalar_one() == 1
+
     @pytest.mark.asyncio
     async def test_like_tweet_that_doesnt_exist(self, client: AsyncClient):
         if hasattr(self, "error_response") and hasattr(self, "likes_url"):
@@ -138,6 +199,385 @@ class TestTweetAPI:
             assert response.status_code == 404
             assert response.json() == self.error_response
 
+    @pytest.mark.asyncio
+    async def test_get_tweets_pagination(self, client: AsyncClient):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            for _ in range(3):
+                await create_random_tweet(
+                    client,
+                    json=self.tweet_structure,
+                    tweet_data=self.faker.sentence(),
+                )
+            response = await client.get(self.base_url, params={"limit": 2})
+            first_page = response.json()
+            assert response.status_code == 200
+            assert [tweet["id"] for tweet in first_page["tweets"]] == [3, 2]
+            assert first_page["next_cursor"] is not None
+
+            response = await client.get(
+                self.base_url,
+                params={"limit": 2, "cursor": first_page["next_cursor"]},
+            )
+            second_page = response.json()
+            assert [tweet["id"] for tweet in second_page["tweets"]] == [1]
+            assert second_page["next_cursor"] is None
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_since_id(self, client: AsyncClient):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            for _ in range(3):
+                await create_random_tweet(
+                    client,
+                    json=self.tweet_structure,
+                    tweet_data=self.faker.sentence(),
+                )
+            response = await client.get(self.base_url, params={"since_id": 1})
+            data = response.json()
+            assert response.status_code == 200
+            assert [tweet["id"] for tweet in data["tweets"]] == [3, 2]
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_invalid_cursor(self, client: AsyncClient):
+        if hasattr(self, "base_url"):
+            response = await client.get(
+                self.base_url, params={"cursor": "not a cursor"}
+            )
+            assert response.status_code == 400
+            assert response.json()["error_message"] == "Invalid cursor."
+
+            aware_cursor = encode_cursor(
+                datetime(2024, 1, 1, tzinfo=timezone.utc), 1
+            )
+            response = await client.get(
+                self.base_url, params={"cursor": aware_cursor}
+            )
+            assert response.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_search_tweets(self, client: AsyncClient):
+        if hasattr(self, "base_url") and hasattr(self, "tweet_structure"):
+            for tweet_data in (
+                "Cats and dogs",
+                "Cats cats cats, only cats",
+                "Dogs are loyal",
+                "A cat video",
+            ):
+                await create_random_tweet(
+                    client, self.tweet_structure, tweet_data
+                )
+            search_url = f"{self.base_url}/search"
+
+            response = await client.get(search_url, params={"q": "cats"})
+            data = response.json()
+            assert response.status_code == 200
+            assert [tweet["id"] for tweet in data["tweets"]] == [2, 1]
+            assert data["tweets"][0]["author"]["id"] == 1
+            assert data["next_cursor"] is None
+
+            response = await client.get(
+                search_url, params={"q": "cats -dogs", "limit": 1}
+            )
+            assert [tweet["id"] for tweet in response.json()["tweets"]] == [2]
+
+            pages: List[int] = []
+            cursor = None
+            while True:
+                params: Dict[str, Union[str, int]] = {
+                    "q": "cats or dogs",
+                    "limit": 1,
+                }
+                if cursor is not None:
+                    params["cursor"] = cursor
+                data = (await client.get(search_url, params=params)).json()
+                pages.extend(tweet["id"] for tweet in data["tweets"])
+                cursor = data["next_cursor"]
+                if cursor is None:
+                    break
+            assert sorted(pages) == [1, 2, 3]
+
+    @pytest.mark.asyncio
+    async def test_search_tweets_invalid_query(self, client: AsyncClient):
+        if hasattr(self, "base_url"):
+            search_url = f"{self.base_url}/search"
+            response = await client.get(search_url, params={"q": ""})
+            assert response.status_code == 422
+            response = await client.get(
+                search_url, params={"q": "cats", "cursor": "not a cursor"}
+            )
+            assert response.status_code == 400
+            response = await client.get(search_url, params={"q": "!!"})
+            assert response.status_code == 200
+            assert response.json()["tweets"] == []
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_by_tag_and_mention(self, client: AsyncClient):
+        if hasattr(self, "base_url") and hasattr(self, "tweet_structure"):
+            for tweet_data in (
+                "Learning #Python with @fake_user1",
+                "More #python, #async and a@fake_user2.com",
+                "Nothing to see",
+            ):
+                await create_random_tweet(
+                    client, self.tweet_structure, tweet_data
+                )
+
+            response = await client.get(f"{self.base_url}/tags/PYTHON")
+            data = response.json()
+            assert response.status_code == 200
+            assert [tweet["id"] for tweet in data["tweets"]] == [2, 1]
+
+            response = await client.get(
+                f"{self.base_url}/tags/python", params={"limit": 1}
+            )
+            data = response.json()
+            assert [tweet["id"] for tweet in data["tweets"]] == [2]
+            response = await client.get(
+                f"{self.base_url}/tags/python",
+                params={"limit": 1, "cursor": data["next_cursor"]},
+            )
+            data = response.json()
+            assert [tweet["id"] for tweet in data["tweets"]] == [1]
+            assert data["next_cursor"] is None
+
+            response = await client.get(f"{self.base_url}/mentions/2")
+            assert [tweet["id"] for tweet in response.json()["tweets"]] == [1]
+            response = await client.get(f"{self.base_url}/mentions/3")
+            assert response.json()["tweets"] == []
+
+            await client.delete(f"{self.base_url}/1")
+            response = await client.get(f"{self.base_url}/tags/python")
+            assert [tweet["id"] for tweet in response.json()["tweets"]] == [2]
+            response = await client.get(f"{self.base_url}/mentions/2")
+            assert response.json()["tweets"] == []
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_not_modified(
+        self, client: AsyncClient, create_random_tweets
+    ):
+        if hasattr(self, "base_url") and hasattr(self, "likes_url"):
+            response = await client.get(self.base_url)
+            etag = response.headers["etag"]
+            response = await client.get(
+                self.base_url, headers={"if-none-match": etag}
+            )
+            assert response.status_code == 304
+            assert response.headers["etag"] == etag
+
+            await client.post(self.likes_url.format("1"))
+            response = await client.get(
+                self.base_url, headers={"if-none-match": etag}
+            )
+            assert response.status_code == 200
+            assert response.headers["etag"] != etag
+
+    @pytest.mark.asyncio
+    async def test_tweets_version_sharded(
+        self, client: AsyncClient, db_session: AsyncSession
+    ):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            for _ in range(3):
+                await create_random_tweet(
+                    client, self.tweet_structure, self.faker.sentence()
+                )
+            await client.post(
+                "/tweets/likes",
+                json={"tweet_ids": [1, 2]},
+                headers={"api-key": "fake_api_key1"},
+            )
+            assert await get_versions(db_session, TWEETS_SCOPE) == (4,)
+            query = await db_session.execute(
+                select(DataVersion.scope).where(
+                    DataVersion.scope.startswith(TWEETS_SCOPE)
+                )
+            )
+            assert set(query.scalars()) <= set(shard_scopes(TWEETS_SCOPE))
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_response_cache(
+        self, client: AsyncClient, create_random_tweets, monkeypatch
+    ):
+        if hasattr(self, "base_url") and hasattr(self, "likes_url"):
+            monkeypatch.setattr(
+                "utils.response_cache.RESPONSE_CACHE_GZIP_MIN_SIZE", 0
+            )
+            first = await client.get(self.base_url)
+            second = await client.get(self.base_url)
+            assert second.json() == first.json()
+            assert second.headers["content-encoding"] == "gzip"
+            assert response_cache.stats()["hits"] == 1
+
+            await client.post(self.likes_url.format("1"))
+            assert response_cache.stats()["entries"] == 0
+            response = await client.get(self.base_url)
+            tweets = {
+                tweet["id"]: tweet for tweet in response.json()["tweets"]
+            }
+            assert len(tweets[1]["likes"]) == 1
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_coalesced(
+        self, db_session: AsyncSession, create_random_tweets
+    ):
+        await db_session.flush()
+        calls = timeline_flight.stats()["calls"]
+        first, second = await asyncio.gather(
+            get_all_tweets(db_session, limit=10),
+            get_all_tweets(db_session, limit=10),
+        )
+        assert first == second
+        assert len(first[0]) == 4
+        assert timeline_flight.stats()["calls"] == calls + 1
+        assert timeline_flight.stats()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_authors_and_likes(
+        self, client: AsyncClient, create_random_tweets
+    ):
+        if hasattr(self, "base_url") and hasattr(self, "likes_url"):
+            await client.post(self.likes_url.format("1"))
+            response = await client.get(self.base_url)
+            tweets = {
+                tweet["id"]: tweet for tweet in response.json()["tweets"]
+            }
+            assert response.status_code == 200
+            assert tweets[1]["author"] == {"id": 2, "name": "fake_user1"}
+            assert tweets[1]["likes"] == [
+                {"user_id": 1, "name": TEST_USERNAME}
+            ]
+            assert tweets[4]["author"] == {"id": 5, "name": "fake_user4"}
+
+    @pytest.mark.asyncio
+    async def test_get_tweets_query_budget(
+        self, client: AsyncClient, create_random_tweets, query_stats
+    ):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "likes_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            for tweet_id in range(1, 5):
+                await client.post(self.likes_url.format(tweet_id))
+            with query_stats() as stats:
+                response = await client.get(self.base_url)
+            assert len(response.json()["tweets"]) == 4
+            assert stats.repeated(2) == {}
+            assert stats.count <= 5
+
+            # More tweets on the page must not mean more queries.
+            for _ in range(4):
+                await create_random_tweet(
+                    client, self.tweet_structure, self.faker.sentence()
+                )
+            response_cache.clear()
+            with query_stats() as more_stats:
+                response = await client.get(self.base_url)
+            assert len(response.json()["tweets"]) == 8
+            assert more_stats.count <= stats.count
+
+    @pytest.mark.asyncio
+    async def test_get_following_tweets(
+        self, client: AsyncClient, create_random_tweets
+    ):
+        if hasattr(self, "base_url"):
+            await client.post("/users/2/follow")
+            response = await client.get(f"{self.base_url}/1")
+            data = response.json()
+            assert response.status_code == 200
+            assert [tweet["id"] for tweet in data["tweets"]] == [1]
+            assert data["tweets"][0]["author"]["id"] == 2
+
+    @pytest.mark.asyncio
+    async def test_home_timeline_fan_out(self, client: AsyncClient):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            author_headers = {"api-key": "fake_api_key1"}
+            await client.post("/users/2/follow")
+            self.tweet_structure["tweet_data"] = self.faker.sentence()
+            response = await client.post(
+                self.base_url,
+                json=self.tweet_structure,
+                headers=author_headers,
+            )
+            tweet_id = response.json()["tweet_id"]
+
+            response = await client.get(f"{self.base_url}/1")
+            assert [tweet["id"] for tweet in response.json()["tweets"]] == [
+                tweet_id
+            ]
+
+            await client.delete("/users/2/follow")
+            response = await client.get(f"{self.base_url}/1")
+            assert response.json()["tweets"] == []
+
+    @pytest.mark.asyncio
+    async def test_home_timeline_delete_tweet(self, client: AsyncClient):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            author_headers = {"api-key": "fake_api_key1"}
+            await client.post("/users/2/follow")
+            self.tweet_structure["tweet_data"] = self.faker.sentence()
+            response = await client.post(
+                self.base_url,
+                json=self.tweet_structure,
+                headers=author_headers,
+            )
+            tweet_id = response.json()["tweet_id"]
+            await client.delete(
+                f"{self.base_url}/{tweet_id}", headers=author_headers
+            )
+
+            response = await client.get(f"{self.base_url}/1")
+            assert response.json()["tweets"] == []
+
+    @pytest.mark.asyncio
+    async def test_home_timeline_above_fan_out_threshold(
+        self, client: AsyncClient, monkeypatch
+    ):
+        if (
+            hasattr(self, "base_url")
+            and hasattr(self, "tweet_structure")
+            and hasattr(self, "faker")
+        ):
+            monkeypatch.setattr(
+                "database.timeline.FANOUT_FOLLOWER_THRESHOLD", 0
+            )
+            author_headers = {"api-key": "fake_api_key1"}
+            await client.post("/users/2/follow")
+            self.tweet_structure["tweet_data"] = self.faker.sentence()
+            await client.post(
+                self.base_url,
+                json=self.tweet_structure,
+                headers=author_headers,
+            )
+            await create_random_tweet(
+                client,
+                json=self.tweet_structure,
+                tweet_data=self.faker.sentence(),
+            )
+
+            response = await client.get(f"{self.base_url}/1")
+            tweets = response.json()["tweets"]
+            assert [tweet["author"]["id"] for tweet in tweets] == [1, 2]
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize(
         "unauthorized",
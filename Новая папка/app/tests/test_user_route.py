@@ -1,5 +1,16 @@
+import asyncio
+from contextlib import suppress
+from typing import Dict, Optional
+
 import pytest
+from database import follow_graph
+from database.counters import repair_counters
+from database.versions import get_versions, user_scope
 from httpx import AsyncClient
+from models.users import user_to_user
+from sqlalchemy import insert
+from utils.auth import api_key_cache, rejected_api_key_cache
+from utils.follow_graph import FollowEdit, FollowGraph
 
 from .conftest import unauthorized_structure_response
 
@@ -63,6 +74,37 @@ class TestUserAPI:
             assert response.status_code == 400
             assert response.json() == self.error_response
 
+    @pytest.mark.asyncio
+    async def test_follow_users_batch(self, client: AsyncClient):
+        if hasattr(self, "base_url"):
+            await client.post(self.base_url.format("2"))
+            response = await client.post(
+                "/users/follow", json={"user_ids": [2, 3, 1, 10000]}
+            )
+            assert response.status_code == 200
+            assert response.json()["results"] == [
+                {"user_id": 2, "status": "already_following"},
+                {"user_id": 3, "status": "followed"},
+                {"user_id": 1, "status": "self"},
+                {"user_id": 10000, "status": "not_found"},
+            ]
+
+            response = await client.get("/users/me")
+            followings = response.json()["user"]["followings"]
+            assert sorted(user["id"] for user in followings) == [2, 3]
+
+    @pytest.mark.asyncio
+    async def test_follow_users_batch_query_budget(
+        self, client: AsyncClient, query_stats
+    ):
+        with query_stats() as stats:
+            response = await client.post(
+                "/users/follow", json={"user_ids": [2, 3, 4, 5]}
+            )
+        assert response.status_code == 200
+        assert stats.repeated(2) == {}
+        assert stats.count <= 8
+
     @pytest.mark.asyncio
     async def test_get_user_information(self, client: AsyncClient):
         if hasattr(self, "base_url"):
@@ -81,6 +123,232 @@ class TestUserAPI:
             assert response.status_code == 200
             assert data["result"] is True
 
+    @pytest.mark.asyncio
+    async def test_get_me_not_modified(self, client: AsyncClient):
+        if hasattr(self, "base_url"):
+            response = await client.get("/users/me")
+            etag = response.headers["etag"]
+            response = await client.get(
+                "/users/me", headers={"if-none-match": etag}
+            )
+            assert response.status_code == 304
+
+            await client.post(self.base_url.format("2"))
+            response = await client.get(
+                "/users/me", headers={"if-none-match": etag}
+            )
+            assert response.status_code == 200
+            assert response.json()["user"]["followings"] == [
+                {"id": 2, "name": "fake_user1"}
+            ]
+
+    @pytest.mark.asyncio
+    async def test_profile_etag_follows_own_counters(
+        self, client: AsyncClient, create_random_tweets
+    ):
+        response = await client.get("/users/2")
+        etag = response.headers["etag"]
+        # Tweet 2 is written by user 3, user 2 wrote tweet 1.
+        await client.post("/tweets/2/likes")
+        await client.post(
+            "/tweets", json={"tweet_data": "elsewhere", "tweet_media_ids": []}
+        )
+        response = await client.get(
+            "/users/2", headers={"if-none-match": etag}
+        )
+        assert response.status_code == 304
+
+        await client.post("/tweets/1/likes")
+        response = await client.get(
+            "/users/2", headers={"if-none-match": etag}
+        )
+        assert response.status_code == 200
+        assert response.json()["user"]["likes_received_count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_get_me_follow_counts(self, client: AsyncClient):
+        await client.post("/users/follow", json={"user_ids": [2, 3]})
+        user = (await client.get("/users/me")).json()["user"]
+        assert user["followings_count"] == 2
+        assert user["followers_count"] == 0
+
+        user = (await client.get("/users/2")).json()["user"]
+        assert user["followers_count"] == 1
+        assert [follower["id"] for follower in user["followers"]] == [1]
+
+    @pytest.mark.asyncio
+    async def test_profile_counters(
+        self, client: AsyncClient, create_random_tweets
+    ):
+        async def counters(user_id: int) -> Dict[str, int]:
+            response = await client.get(f"/users/{user_id}")
+            return {
+                key: value
+                for key, value in response.json()["user"].items()
+                if key.endswith("_count")
+            }
+
+        await client.post("/users/follow", json={"user_ids": [2, 3]})
+        await client.delete("/users/3/follow")
+        response = await client.post(
+            "/tweets", json={"tweet_data": "counted", "tweet_media_ids": []}
+        )
+        tweet_id = response.json()["tweet_id"]
+        await client.post("/tweets/likes", json={"tweet_ids": [1, 2]})
+        await client.delete("/tweets/2/likes")
+        assert await counters(1) == {
+            "followers_count": 0,
+            "followings_count": 1,
+            "tweets_count": 1,
+            "likes_received_count": 0,
+        }
+        assert (await counters(2))["followers_count"] == 1
+        assert (await counters(2))["likes_received_count"] == 1
+        assert (await counters(3))["likes_received_count"] == 0
+
+        await client.delete(f"/tweets/{tweet_id}")
+        assert (await counters(1))["tweets_count"] == 0
+
+    @pytest.mark.asyncio
+    async def test_repair_counters(
+        self, client: AsyncClient, db_session, create_random_tweets
+    ):
+        # The fixture adds the tweets behind the back of the counters.
+        assert await repair_counters(db_session, 0, 3) == (3, 2)
+        assert await repair_counters(db_session, 3, 3) == (6, 2)
+        assert await repair_counters(db_session, 6, 3) == (0, 0)
+        assert await repair_counters(db_session, 0, 10) == (6, 0)
+        response = await client.get("/users/2")
+        assert response.json()["user"]["tweets_count"] == 1
+
+    @pytest.mark.asyncio
+    async def test_follow_lists_paginated(self, client: AsyncClient):
+        await client.post("/users/follow", json={"user_ids": [2, 3, 4, 5, 6]})
+        pages = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor is not None:
+                params["cursor"] = cursor
+            response = await client.get("/users/1/following", params=params)
+            assert response.status_code == 200
+            data = response.json()
+            pages.append([user["id"] for user in data["users"]])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+        assert pages == [[6, 5], [4, 3], [2]]
+
+        response = await client.get("/users/4/followers")
+        assert [user["id"] for user in response.json()["users"]] == [1]
+
+    @pytest.mark.asyncio
+    async def test_follow_list_errors(self, client: AsyncClient):
+        response = await client.get(
+            "/users/1/followers", params={"cursor": "garbage"}
+        )
+        assert response.status_code == 400
+        response = await client.get("/users/10000/following")
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_mutual_follows(self, client: AsyncClient, db_session):
+        await client.post("/users/follow", json={"user_ids": [2, 3, 4]})
+        await db_session.execute(
+            insert(user_to_user),
+            [
+                {"follower_id": 2, "following_id": 1},
+                {"follower_id": 4, "following_id": 1},
+                {"follower_id": 5, "following_id": 1},
+            ],
+        )
+        response = await client.get("/users/1/mutual", params={"limit": 1})
+        data = response.json()
+        assert [user["id"] for user in data["users"]] == [4]
+        response = await client.get(
+            "/users/1/mutual", params={"cursor": data["next_cursor"]}
+        )
+        assert [user["id"] for user in response.json()["users"]] == [2]
+
+    def test_follow_graph_edits(self):
+        graph = FollowGraph()
+        graph.extend([(1, 2), (1, 3), (2, 1), (3, 5)])
+        graph.set_versions([(1, 4), (2, 1)])
+        assert graph.following(1) == [3, 2]
+        assert graph.mutual(1) == [2]
+
+        graph.apply(FollowEdit((1, 5), ((4, 1), (6, 1)), True))
+        graph.apply(FollowEdit((1, 6), ((2, 2),), False))
+        assert graph.following(1) == [6, 4, 3]
+        assert graph.following(1, before=6, limit=1) == [4]
+        assert graph.mutual(1) == []
+        # Already loaded or applied: the graph has a newer version of 1.
+        graph.apply(FollowEdit((1, 6), ((2, 2),), True))
+        assert not graph.follows(1, 2)
+        assert len(graph) == 5
+        assert graph.edits == 3
+
+        edit = FollowEdit((3, 1), ((1, 7),), True)
+        assert FollowEdit.loads(edit.dumps()) == edit
+
+    def test_follow_graph_edits_in_commit_order(self):
+        follows = FollowEdit((1, 1), ((2, 1),), True)
+        # Also bumps the version of 1, after the edit above committed.
+        followed_back = FollowEdit((3, 1), ((1, 2),), True)
+        graph = FollowGraph()
+        graph.apply(follows)
+        graph.apply(followed_back)
+        assert graph.following(1) == [2]
+        assert graph.following(3) == [1]
+        assert graph.version(1) == 2
+
+        # Loaded once the first edit committed, its notification is then
+        # received while loading.
+        graph = FollowGraph()
+        graph.extend([(1, 2)])
+        graph.set_versions([(1, 1), (2, 1)])
+        graph.apply(follows)
+        graph.apply(followed_back)
+        assert graph.following(1) == [2]
+        assert graph.following(3) == [1]
+        assert graph.edits == 1
+
+    @pytest.mark.asyncio
+    async def test_follow_graph_follows_notifications(
+        self, client: AsyncClient, db_session
+    ):
+        async def fresh_graph(user_id: int) -> Optional[FollowGraph]:
+            (version,) = await get_versions(db_session, user_scope(user_id))
+            for _ in range(500):
+                graph = follow_graph.get_follow_graph(user_id, version)
+                if graph is not None:
+                    return graph
+                await asyncio.sleep(0.01)
+            return None
+
+        # Also commits the users of the fixture before the graph loads.
+        await client.post("/users/follow", json={"user_ids": [2, 3]})
+        task = asyncio.create_task(follow_graph.run_follow_graph())
+        try:
+            graph = await fresh_graph(1)
+            assert graph is not None and graph.following(1) == [3, 2]
+
+            await client.delete("/users/2/follow")
+            await client.post(
+                "/users/1/follow", headers={"api-key": "fake_api_key2"}
+            )
+            graph = await fresh_graph(1)
+            assert graph is not None
+            assert graph.following(1) == [3]
+            assert graph.mutual(1) == [3]
+            response = await client.get("/users/1/mutual")
+            assert [user["id"] for user in response.json()["users"]] == [3]
+        finally:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        assert follow_graph.get_follow_graph(1, 0) is None
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize("unauthorized", ["/users/me", "/users/2"])
     async def test_get_wrong_auth(
@@ -96,3 +364,43 @@ class TestUserAPI:
             response = await invalid_client.post(self.base_url.format("1"))
             assert response.status_code == 401
             assert response.json() == unauthorized_structure_response
+
+    @pytest.mark.asyncio
+    async def test_api_key_is_cached(self, client: AsyncClient):
+        await client.get("/users/me")
+        await client.get("/users/me")
+        assert api_key_cache.stats()["hits"] == 1
+        assert api_key_cache.stats()["size"] == 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_api_key_is_cached(
+        self, invalid_client: AsyncClient
+    ):
+        await invalid_client.get("/users/me")
+        response = await invalid_client.get("/users/me")
+        assert response.status_code == 401
+        assert response.json() == unauthorized_structure_response
+        assert rejected_api_key_cache.stats()["hits"] == 1
+
+    @pytest.mark.asyncio
+    async def test_rejected_api_key_expires(
+        self, invalid_client: AsyncClient, monkeypatch
+    ):
+        clock = [0.0]
+        monkeypatch.setattr("utils.cache.monotonic", lambda: clock[0])
+        await invalid_client.get("/users/me")
+        # Retrying before the deadline must not push it back.
+        clock[0] = rejected_api_key_cache.ttl - 1
+        await invalid_client.get("/users/me")
+        clock[0] = rejected_api_key_cache.ttl + 1
+        response = await invalid_client.get("/users/me")
+        assert response.status_code == 401
+        assert rejected_api_key_cache.stats()["hits"] == 1
+        assert rejected_api_key_cache.stats()["misses"] == 2
+
+    @pytest.mark.asyncio
+    async def test_follow_invalidates_api_key_cache(self, client: AsyncClient):
+        if hasattr(self, "base_url"):
+            await client.get("/users/me")
+            await client.post(self.base_url.format("2"))
+            assert len(api_key_cache) == 0
@@ -1,24 +1,83 @@
+from typing import NamedTuple, Optional
+
 from database.database import async_get_db
 from database.utils import get_user_by_api_key
 from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import APIKeyHeader
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .cache import TTLCache
+from .settings import (
+    AUTH_CACHE_SIZE,
+    AUTH_CACHE_TTL,
+    AUTH_REJECTED_CACHE_SIZE,
+    AUTH_REJECTED_CACHE_TTL,
+)
+from .timing import timed
+
 API_KEY_HEADER = APIKeyHeader(name="api-key")
 
 
+class Principal(NamedTuple):
+    """Authenticated caller, cheap enough to be cached per api key"""
+
+    id: int
+    username: str
+
+
+api_key_cache: TTLCache[str, Principal] = TTLCache(
+    maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL, name="api_key"
+)
+rejected_api_key_cache: TTLCache[str, bool] = TTLCache(
+    maxsize=AUTH_REJECTED_CACHE_SIZE,
+    ttl=AUTH_REJECTED_CACHE_TTL,
+    name="rejected_api_key",
+)
+api_key_by_user_id: TTLCache[int, str] = TTLCache(
+    maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL, name="api_key_by_user_id"
+)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Drop the cached principal of the user, if there is one"""
+    api_key = api_key_by_user_id.pop(user_id)
+    if api_key is not None:
+        api_key_cache.pop(api_key)
+
+
+def clear_auth_cache() -> None:
+    api_key_cache.clear()
+    rejected_api_key_cache.clear()
+    api_key_by_user_id.clear()
+
+
 async def authenticate_user(
     api_key: str = Security(API_KEY_HEADER),
     session: AsyncSession = Depends(async_get_db),
-):
+) -> Principal:
     """Check if user exists otherwise raise errors"""
-    user = await get_user_by_api_key(api_key, session)
+    with timed("auth"):
+        principal: Optional[Principal] = api_key_cache.get(api_key)
+        if principal is not None:
+            return principal
+
+        user = None
+        rejected = rejected_api_key_cache.get(api_key) is not None
+        if not rejected:
+            user = await get_user_by_api_key(api_key, session)
 
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="API key authentication failed",
-            headers={"api-key": ""},
-        )
+        if user is None:
+            # A cached rejection keeps its deadline, a key created since
+            # it was cached is accepted once the entry expires.
+            if not rejected:
+                rejected_api_key_cache.set(api_key, True)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="API key authentication failed",
+                headers={"api-key": ""},
+            )
 
-    return user
+        principal = Principal(id=user.id, username=user.username)
+        api_key_cache.set(api_key, principal)
+        api_key_by_user_id.set(principal.id, api_key)
+        return principal
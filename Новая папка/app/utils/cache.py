@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from .metrics import CACHE_REQUESTS
+
+KeyType = TypeVar("KeyType", bound=Hashable)
+ValueType = TypeVar("ValueType")
+
+
+class TTLCache(Generic[KeyType, ValueType]):
+    """
+    Bounded in-process cache with per-entry expiry and LRU eviction.
+    The cache is local to a worker process and is not thread safe, it is
+    meant to be used from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._hit_metric = CACHE_REQUESTS.labels(name, "hit")
+        self._miss_metric = CACHE_REQUESTS.labels(name, "miss")
+        self._data: OrderedDict[KeyType, Tuple[float, ValueType]] = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: KeyType) -> Optional[ValueType]:
+        """
+        Return the cached value and mark it as recently used.
+        :param key: The cache key.
+        :return: The value, or None if it is missing or expired.
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            self._miss_metric.inc()
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        self._hit_metric.inc()
+        return entry[1]
+
+    def set(self, key: KeyType, value: ValueType) -> None:
+        self._data[key] = (monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: KeyType) -> Optional[ValueType]:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
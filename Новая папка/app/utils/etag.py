@@ -0,0 +1,32 @@
+from fastapi import Request, status
+from starlette.responses import Response
+
+# Responses depend on the api key, shared caches must not store them and
+# browsers have to revalidate every time.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: object) -> str:
+    """
+    Build a weak ETag from the versions a response depends on.
+    The tag is weak: the body may be re-encoded, e.g. gzipped by nginx.
+    """
+    return 'W/"{}"'.format("-".join(str(part) for part in parts))
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check the If-None-Match header with the weak comparison"""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": CACHE_CONTROL},
+    )
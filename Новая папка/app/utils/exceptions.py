@@ -2,7 +2,7 @@ from http.client import responses
 
 from fastapi import Request, status
 from fastapi.exceptions import RequestValidationError, ResponseValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from schemas.exception_schema import ErrorResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
@@ -14,7 +14,7 @@ async def validation_exception_handler(
     error_schema = ErrorResponse(
         error_type=error_type, error_message=repr(exc)
     )
-    return JSONResponse(
+    return ORJSONResponse(
         error_schema.model_dump(),
         status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
     )
@@ -27,7 +27,7 @@ async def response_validation_exception_handler(
     error_schema = ErrorResponse(
         error_type=error_type, error_message=repr(exc.errors())
     )
-    return JSONResponse(
+    return ORJSONResponse(
         error_schema.model_dump(),
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
     )
@@ -39,6 +39,6 @@ async def custom_http_exception_handler(
     error_schema = ErrorResponse(
         error_type=responses[exc.status_code], error_message=exc.detail
     )
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code, content=error_schema.model_dump()
     )
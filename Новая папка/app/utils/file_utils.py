@@ -1,45 +1,112 @@
+from hashlib import sha256
 from pathlib import Path
+from typing import NamedTuple, Optional
+from uuid import uuid4
 
 from aiofiles import open
+from aiofiles import os as aiofiles_os
 from fastapi import UploadFile
 
-from .settings import MEDIA_PATH
+from .metrics import MEDIA_UPLOAD_BYTES, MEDIA_UPLOADS
+from .settings import MEDIA_CHUNK_SIZE, MEDIA_MAX_SIZE, MEDIA_PATH
 
+MEDIA_TMP_PATH = MEDIA_PATH / ".tmp"
 
-async def check_or_get_filename(path: Path) -> Path:
+
+class SavedFile(NamedTuple):
+    path: str
+    sha256: str
+    size: int
+    temp_path: Path
+
+
+class FileTooLargeError(ValueError):
+    def __init__(self, max_size: int):
+        super().__init__(f"File is larger than {max_size} bytes.")
+
+
+def get_storage_path(file_hash: str, suffix: str = "") -> str:
     """
-    Adds a numerical suffix to the filename if a file with the same name
-    already exists.
-    :param path: The path to check and modify.
-    :return: The modified path with a numerical suffix.
+    Build the content-addressed path of a file relative to MEDIA_PATH.
+    Files are sharded by the first two bytes of the hash, so no directory
+    grows past a few thousand entries.
+    :param file_hash: Hex SHA-256 hash of the file content.
+    :param suffix: File extension including the leading dot.
+    :return: Relative path like "ab/cd/abcd...ef.png".
     """
-    original_path = path
-    counter = 0
-
-    while path.exists():
-        counter += 1
-        filename = f"{original_path.stem} ({counter}){original_path.suffix}"
-        path = original_path.with_name(filename)
-    return path
+    return f"{file_hash[:2]}/{file_hash[2:4]}/{file_hash}{suffix.lower()}"
 
 
-async def save_uploaded_file(uploaded_file: UploadFile) -> str:
+async def save_uploaded_file(uploaded_file: UploadFile) -> SavedFile:
     """
-    Uploads a file and returns the relative path
+    Receives an upload into a temporary file and returns its storage path
     :param uploaded_file: The FastAPI UploadFile object representing the
     uploaded file.
-    :return: The relative path to the saved file.
-    :raises: Any exceptions that may occur during file upload and storage.
+    :return: The content-addressed relative path of the file, its SHA-256
+    hash, size in bytes and the temporary file holding the content until
+    `store_file` moves it in place.
+    :raises: FileTooLargeError if the file is larger than MEDIA_MAX_SIZE,
+    any other exceptions that may occur during file upload and storage.
     """
+    if uploaded_file.size is not None and uploaded_file.size > MEDIA_MAX_SIZE:
+        raise FileTooLargeError(MEDIA_MAX_SIZE)
+
+    await aiofiles_os.makedirs(MEDIA_TMP_PATH, exist_ok=True)
+    temp_path = MEDIA_TMP_PATH / uuid4().hex
 
-    MEDIA_PATH.mkdir(parents=True, exist_ok=True)
+    file_hash = sha256()
+    size = 0
+    try:
+        async with open(temp_path, "wb") as file:
+            # UploadFile.read hands the blocking read of the spooled
+            # file to a thread, so the event loop is never blocked.
+            while chunk := await uploaded_file.read(MEDIA_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MEDIA_MAX_SIZE:
+                    raise FileTooLargeError(MEDIA_MAX_SIZE)
+                file_hash.update(chunk)
+                await file.write(chunk)
+    except BaseException:
+        await discard_file(temp_path)
+        raise
 
-    file_path: Path = MEDIA_PATH
+    MEDIA_UPLOADS.inc()
+    MEDIA_UPLOAD_BYTES.inc(size)
+    suffix = ""
     if uploaded_file.filename is not None:
-        file_path = MEDIA_PATH / uploaded_file.filename
-    filename = await check_or_get_filename(path=file_path)
-    img_path = f"{filename.stem}{filename.suffix}"
-    content = uploaded_file.file.read()
-    async with open(filename, "wb") as file:
-        await file.write(content)
-    return img_path
+        suffix = Path(uploaded_file.filename).suffix
+    digest = file_hash.hexdigest()
+    return SavedFile(
+        path=get_storage_path(digest, suffix),
+        sha256=digest,
+        size=size,
+        temp_path=temp_path,
+    )
+
+
+async def store_file(
+    temp_path: Path, media_path: str, overwrite: bool = False
+) -> None:
+    """
+    Move a received file to its content-addressed location. When the
+    content is already stored the temporary file is simply dropped.
+    :param temp_path: Temporary file returned by `save_uploaded_file`.
+    :param media_path: Path relative to MEDIA_PATH to store the file at.
+    :param overwrite: Replace the stored file even if it exists.
+    """
+    path = MEDIA_PATH / media_path
+    if not overwrite and await aiofiles_os.path.exists(path):
+        await discard_file(temp_path)
+        return
+    await aiofiles_os.makedirs(path.parent, exist_ok=True)
+    await aiofiles_os.replace(temp_path, path)
+
+
+async def discard_file(path: Optional[Path]) -> None:
+    """Remove a file if it still exists"""
+    if path is None:
+        return
+    try:
+        await aiofiles_os.remove(path)
+    except FileNotFoundError:
+        pass
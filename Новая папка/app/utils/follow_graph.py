@@ -0,0 +1,205 @@
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from itertools import islice
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import orjson
+
+
+class FollowEdit(NamedTuple):
+    """
+    Follows or unfollows committed by one transaction, along with the
+    versions of the user scopes it bumped: (user id, version) pairs.
+    """
+
+    follower: Tuple[int, int]
+    users: Tuple[Tuple[int, int], ...]
+    followed: bool
+
+    def dumps(self) -> str:
+        # orjson does not serialize tuple subclasses.
+        return orjson.dumps(tuple(self)).decode()
+
+    @classmethod
+    def loads(cls, payload: str) -> "FollowEdit":
+        follower, users, followed = orjson.loads(payload)
+        return cls(
+            follower=tuple(follower),
+            users=tuple(tuple(user) for user in users),
+            followed=followed,
+        )
+
+
+class FollowGraph:
+    """
+    Adjacency index of user_to_user: the users every user follows.
+
+    The loaded edges are stored CSR-style, the followings of all users
+    sorted in one int array and the start of the row of every user in
+    another, so an edge costs 4 bytes and no Python object. Edges added
+    or removed since the load are kept in sets on top of the arrays
+    until the graph is loaded again.
+
+    The graph also tracks the version of the scope of every user, see
+    database.versions.user_scope, which every follow change bumps. An
+    edit older than the graph is ignored, and readers only trust the
+    graph for a user when it is at least as new as the version they read.
+    Edits must be applied in the order they committed.
+    """
+
+    def __init__(self):
+        self._offsets = array("q")
+        self._targets = array("i")
+        self._versions = array("q")
+        self._added: Dict[int, Set[int]] = dict()
+        self._removed: Dict[int, Set[int]] = dict()
+        self.edits = 0
+
+    def __len__(self) -> int:
+        return (
+            len(self._targets)
+            + sum(map(len, self._added.values()))
+            - sum(map(len, self._removed.values()))
+        )
+
+    def extend(self, edges: Iterable[Tuple[int, int]]) -> None:
+        """
+        Append loaded edges. Edges come sorted by (follower, following)
+        and after the ones already loaded, before any edit is applied.
+        """
+        offsets = self._offsets
+        targets = self._targets
+        for follower_id, following_id in edges:
+            while len(offsets) <= follower_id:
+                offsets.append(len(targets))
+            targets.append(following_id)
+
+    def set_versions(self, versions: Iterable[Tuple[int, int]]) -> None:
+        """Record the versions of the user scopes the edges were read at"""
+        for user_id, version in versions:
+            self._set_version(user_id, version)
+
+    def version(self, user_id: int) -> int:
+        if user_id < len(self._versions):
+            return self._versions[user_id]
+        return 0
+
+    def _set_version(self, user_id: int, version: int) -> None:
+        if user_id >= len(self._versions):
+            self._versions.extend([0] * (user_id + 1 - len(self._versions)))
+        self._versions[user_id] = max(self._versions[user_id], version)
+
+    def _row(self, user_id: int) -> Tuple[int, int]:
+        """Bounds of the loaded followings of the user in `_targets`"""
+        offsets = self._offsets
+        if user_id >= len(offsets):
+            return len(self._targets), len(self._targets)
+        if user_id + 1 < len(offsets):
+            return offsets[user_id], offsets[user_id + 1]
+        return offsets[user_id], len(self._targets)
+
+    def _loaded(self, follower_id: int, following_id: int) -> bool:
+        low, high = self._row(follower_id)
+        position = bisect_left(self._targets, following_id, low, high)
+        return position < high and self._targets[position] == following_id
+
+    def follows(self, follower_id: int, following_id: int) -> bool:
+        """Does the follower follow the other user"""
+        if following_id in self._added.get(follower_id, ()):
+            return True
+        if following_id in self._removed.get(follower_id, ()):
+            return False
+        return self._loaded(follower_id, following_id)
+
+    def _iter_following(
+        self, user_id: int, before: Optional[int]
+    ) -> Iterable[int]:
+        low, high = self._row(user_id)
+        if before is not None:
+            high = bisect_left(self._targets, before, low, high)
+        removed = self._removed.get(user_id, ())
+        loaded = (
+            self._targets[position]
+            for position in range(high - 1, low - 1, -1)
+            if self._targets[position] not in removed
+        )
+        added = sorted(
+            (
+                following_id
+                for following_id in self._added.get(user_id, ())
+                if before is None or following_id < before
+            ),
+            reverse=True,
+        )
+        return merge(loaded, added, reverse=True)
+
+    def following(
+        self,
+        user_id: int,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Ids of the users the user follows, highest first.
+        :param before: Only return ids lower than this one.
+        :param limit: Return at most this many ids.
+        """
+        return list(islice(self._iter_following(user_id, before), limit))
+
+    def mutual(
+        self,
+        user_id: int,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Ids of the users who follow the user back, highest first. Costs
+        a binary search in the row of each followed user scanned.
+        """
+        mutual = (
+            following_id
+            for following_id in self._iter_following(user_id, before)
+            if self.follows(following_id, user_id)
+        )
+        return list(islice(mutual, limit))
+
+    def add(self, follower_id: int, following_id: int) -> None:
+        removed = self._removed.get(follower_id)
+        if removed is not None and following_id in removed:
+            removed.discard(following_id)
+            self.edits -= 1
+        elif not self._loaded(follower_id, following_id):
+            added = self._added.setdefault(follower_id, set())
+            if following_id not in added:
+                added.add(following_id)
+                self.edits += 1
+
+    def remove(self, follower_id: int, following_id: int) -> None:
+        added = self._added.get(follower_id)
+        if added is not None and following_id in added:
+            added.discard(following_id)
+            self.edits -= 1
+        elif self._loaded(follower_id, following_id):
+            removed = self._removed.setdefault(follower_id, set())
+            if following_id not in removed:
+                removed.add(following_id)
+                self.edits += 1
+
+    def apply(self, edit: FollowEdit) -> None:
+        """
+        Apply the edit unless the graph already has its version of the
+        follower. A version is bumped under the lock of its row, so the
+        versions of a user grow in commit order: applied in that order,
+        an edit not newer than the graph committed before it was loaded.
+        """
+        follower_id, follower_version = edit.follower
+        if follower_version <= self.version(follower_id):
+            return
+        for user_id, version in edit.users:
+            if edit.followed:
+                self.add(follower_id, user_id)
+            else:
+                self.remove(follower_id, user_id)
+            self._set_version(user_id, version)
+        self._set_version(follower_id, follower_version)
@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from .settings import IMAGE_VARIANT_SIZES, IMAGE_WEBP_QUALITY, IMAGE_WORKERS
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """
+    Pool resizing images outside of the event loop and of the GIL.
+    Workers are spawned rather than forked, so they do not inherit the
+    event loop, open sockets or locks of the API process.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=get_context("spawn")
+        )
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+def get_variant_path(media_path: str, variant: str) -> str:
+    """
+    Path of a derivative relative to MEDIA_PATH, stored next to the
+    original: "ab/cd/<hash>.png" -> "ab/cd/<hash>_thumbnail.webp".
+    """
+    path = Path(media_path)
+    return str(path.with_name(f"{path.stem}_{variant}.webp"))
+
+
+def make_image_variants(media_root: str, media_path: str) -> Dict[str, str]:
+    """
+    Write WebP derivatives of an image. Runs in a worker process.
+    :param media_root: Absolute path of MEDIA_PATH.
+    :param media_path: Path of the original relative to MEDIA_PATH.
+    :return: Paths of the derivatives relative to MEDIA_PATH by variant
+    name, empty if the file is not an image Pillow can read.
+    """
+    root = Path(media_root)
+    variants = dict()
+    try:
+        with Image.open(root / media_path) as original:
+            image = ImageOps.exif_transpose(original)
+            for variant, size in IMAGE_VARIANT_SIZES.items():
+                variant_path = get_variant_path(media_path, variant)
+                variants[variant] = variant_path
+                if (root / variant_path).exists():
+                    continue
+                resized = image.copy()
+                resized.thumbnail((size, size))
+                resized.save(
+                    root / variant_path, "WEBP", quality=IMAGE_WEBP_QUALITY
+                )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return dict()
+    return variants
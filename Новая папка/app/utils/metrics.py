@@ -0,0 +1,95 @@
+"""
+Prometheus metrics of the API.
+
+With several worker processes, point PROMETHEUS_MULTIPROC_DIR to a
+directory shared by the workers and emptied before they start: every
+worker writes its samples there and /metrics adds them up, whichever
+worker serves the scrape.
+"""
+
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.responses import Response
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time to send the response, by route template.",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being handled.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+RESPONSES = Counter(
+    "http_responses",
+    "Responses sent, by route template and status code.",
+    ["method", "route", "status"],
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection.",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections checked out of the pool.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CAPACITY = Gauge(
+    "db_pool_capacity_connections",
+    "Most connections the pool hands out, overflow included.",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+
+MEDIA_UPLOADS = Counter("media_uploads", "Files received.")
+MEDIA_UPLOAD_BYTES = Counter("media_upload_bytes", "Bytes of files received.")
+
+CACHE_REQUESTS = Counter(
+    "cache_requests",
+    "Lookups in the in-process caches, by cache and hit or miss.",
+    ["cache", "result"],
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls",
+    "Calls run, by coalescing group.",
+    ["group"],
+)
+SINGLE_FLIGHT_COALESCED = Counter(
+    "single_flight_coalesced",
+    "Calls served by a call already in flight, by coalescing group.",
+    ["group"],
+)
+
+
+def metrics_response() -> Response:
+    """Render the metrics of every worker in the Prometheus text format"""
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+def mark_worker_dead() -> None:
+    """Drop the live gauges of this worker from the shared directory"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,253 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import marshal
+import pstats
+from http.client import responses
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from database.query_stats import track_queries
+from fastapi import HTTPException, status
+from fastapi.responses import ORJSONResponse
+from schemas.exception_schema import ErrorResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.routing import BaseRoute, Route
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import REQUEST_DURATION, REQUESTS_IN_PROGRESS, RESPONSES
+from .timing import track_timings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """
+    Log requests that run more than `budget` queries, or repeat a
+    statement `repeat_threshold` times or more, with the statements at
+    fault.
+    """
+
+    def __init__(self, app: ASGIApp, budget: int, repeat_threshold: int):
+        self.app = app
+        self.budget = budget
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send)
+        repeated = stats.repeated(self.repeat_threshold)
+        if stats.count <= self.budget and not repeated:
+            return
+        logger.warning(
+            "%s %s ran %s queries in %.1f ms",
+            scope["method"],
+            scope["path"],
+            stats.count,
+            stats.duration * 1000,
+        )
+        for statement, count in repeated.items():
+            logger.warning("Statement repeated %s times: %s", count, statement)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Refuse the bodies larger than the limit of their path with 413 before
+    the application reads them. Starlette spools a whole multipart body
+    to disk before the route can check the size of the files.
+
+    A body announced larger by Content-Length is refused at once. A body
+    sent without it is counted while the application reads it, and the
+    read fails as soon as the limit is crossed.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = None
+        if scope["type"] == "http":
+            limit = self.limits.get(scope["path"])
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        detail = f"Request body is larger than {limit} bytes."
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > limit:
+            error_schema = ErrorResponse(
+                error_type=responses[413], error_message=detail
+            )
+            response = ORJSONResponse(
+                error_schema.model_dump(),
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Handled by the exception handler of the application.
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=detail,
+                    )
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class MetricsMiddleware:
+    """
+    Record the duration, status and concurrency of HTTP requests.
+    Requests are labelled with the template of the route they matched,
+    like "/api/tweets/{tweet_id}/likes", so the labels stay few.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._route_paths: Dict[Callable, str] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            route = self.route_path(scope)
+            REQUEST_DURATION.labels(method, route).observe(
+                perf_counter() - started
+            )
+            RESPONSES.labels(method, route, str(status_code)).inc()
+
+    def route_path(self, scope: Scope) -> str:
+        """Template of the route the router matched, set as the endpoint"""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._route_paths:
+            routes: List[BaseRoute] = scope["app"].routes
+            self._route_paths.update(
+                (route.endpoint, route.path)
+                for route in routes
+                if isinstance(route, Route)
+            )
+        return self._route_paths.get(endpoint, "unmatched")
+
+
+class ServerTimingMiddleware:
+    """
+    Add a Server-Timing header with the phases of the request: auth,
+    hydrate, serialize, db and total, in milliseconds.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = perf_counter()
+        with track_timings() as timings, track_queries() as queries:
+
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing",
+                        timings.header(queries, perf_counter() - started),
+                    )
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+
+class ProfilingMiddleware:
+    """
+    Answer requests carrying the profiling token in X-Profile-Token with
+    the cProfile statistics of the request instead of its response: the
+    `top` functions by cumulative time as text, or the raw statistics
+    loadable with pstats when X-Profile-Format is "pstats". The status
+    of the response is kept in X-Profiled-Status.
+
+    The profiler sees everything the event loop runs meanwhile, so
+    concurrent requests show up in the profile too. Profiled requests
+    run one at a time.
+    """
+
+    def __init__(self, app: ASGIApp, token: str, top: int):
+        self.app = app
+        self.token = token.encode()
+        self.top = top
+        self._lock = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        headers = Headers(scope=scope)
+        if scope["type"] != "http" or not hmac.compare_digest(
+            headers.get("x-profile-token", "").encode(), self.token
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def discard(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        async with self._lock:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await self.app(scope, receive, discard)
+            finally:
+                profiler.disable()
+
+        if headers.get("x-profile-format") == "pstats":
+            profiler.create_stats()
+            body = marshal.dumps(profiler.stats)
+            media_type = "application/octet-stream"
+        else:
+            output = io.StringIO()
+            stats = pstats.Stats(profiler, stream=output)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            body = output.getvalue().encode()
+            media_type = "text/plain"
+        response = Response(
+            content=body,
+            media_type=media_type,
+            headers={"X-Profiled-Status": str(status_code)},
+        )
+        await response(scope, receive, send)
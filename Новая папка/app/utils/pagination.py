@@ -0,0 +1,121 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from typing import List, NoReturn, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import ColumnElement, literal, tuple_
+
+
+def _encode(key: str, tweet_id: int) -> str:
+    raw = f"{key}|{tweet_id}".encode()
+    return urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> Tuple[str, int]:
+    padding = "=" * (-len(cursor) % 4)
+    raw = urlsafe_b64decode(cursor + padding).decode()
+    key, tweet_id = raw.rsplit("|", 1)
+    return key, int(tweet_id)
+
+
+def _raise_invalid_cursor() -> NoReturn:
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor.",
+    )
+
+
+def encode_cursor(create_date: datetime, tweet_id: int) -> str:
+    """
+    Build an opaque cursor pointing right after the given tweet.
+    :param create_date: Creation date of the last tweet on the page.
+    :param tweet_id: Id of the last tweet on the page.
+    :return: URL-safe cursor string.
+    """
+    return _encode(create_date.isoformat(), tweet_id)
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Restore the (create_date, id) pair hidden in a cursor.
+    :param cursor: Cursor previously returned by `encode_cursor`.
+    :return: Creation date and id of the tweet the cursor points to.
+    :raises: HTTPException with status 400 if the cursor is malformed.
+    """
+    try:
+        create_date, tweet_id = _decode(cursor)
+        parsed_date = datetime.fromisoformat(create_date)
+    except ValueError:
+        _raise_invalid_cursor()
+    # Creation dates are stored naive, as `encode_cursor` writes them.
+    if parsed_date.tzinfo is not None:
+        _raise_invalid_cursor()
+    return parsed_date, tweet_id
+
+
+def encode_rank_cursor(rank: float, tweet_id: int) -> str:
+    """
+    Build an opaque cursor pointing right after the given search result.
+    :param rank: Search rank of the last tweet on the page.
+    :param tweet_id: Id of the last tweet on the page.
+    :return: URL-safe cursor string.
+    """
+    return _encode(repr(rank), tweet_id)
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    Restore the (rank, id) pair hidden in a search cursor.
+    :raises: HTTPException with status 400 if the cursor is malformed.
+    """
+    try:
+        rank, tweet_id = _decode(cursor)
+        return float(rank), tweet_id
+    except ValueError:
+        _raise_invalid_cursor()
+
+
+def encode_user_cursor(user_id: int) -> str:
+    """Build an opaque cursor pointing right after the given user"""
+    return _encode("user", user_id)
+
+
+def decode_user_cursor(cursor: str) -> int:
+    """
+    Restore the user id hidden in a follow list cursor.
+    :raises: HTTPException with status 400 if the cursor is malformed.
+    """
+    try:
+        key, user_id = _decode(cursor)
+    except ValueError:
+        _raise_invalid_cursor()
+    if key != "user":
+        _raise_invalid_cursor()
+    return user_id
+
+
+def keyset_conditions(
+    create_date_column: ColumnElement,
+    id_column: ColumnElement,
+    cursor: Optional[str] = None,
+    since_id: Optional[int] = None,
+) -> List[ColumnElement]:
+    """
+    Build WHERE conditions selecting the page after `cursor` and newer
+    than the tweet with id `since_id`.
+    :param create_date_column: Column holding the tweet creation date.
+    :param id_column: Column holding the tweet id.
+    :param cursor: Cursor returned with the previous page.
+    :param since_id: Id of the newest tweet the client already has.
+    :return: Conditions to pass to `Select.where`.
+    """
+    conditions = []
+    if cursor is not None:
+        create_date, tweet_id = decode_cursor(cursor)
+        conditions.append(
+            tuple_(create_date_column, id_column)
+            < tuple_(literal(create_date), literal(tweet_id))
+        )
+    if since_id is not None:
+        conditions.append(id_column > since_id)
+    return conditions
@@ -0,0 +1,136 @@
+import gzip
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from starlette.responses import Response
+
+from .etag import CACHE_CONTROL
+from .metrics import CACHE_REQUESTS
+from .settings import (
+    RESPONSE_CACHE_GZIP_LEVEL,
+    RESPONSE_CACHE_GZIP_MIN_SIZE,
+    RESPONSE_CACHE_MAX_BYTES,
+)
+
+CacheKey = Tuple[str, Hashable]
+
+
+class CachedBody(NamedTuple):
+    etag: str
+    plain: bytes
+    gzipped: Optional[bytes]
+
+    @property
+    def size(self) -> int:
+        return len(self.plain) + len(self.gzipped or b"")
+
+
+class ResponseCache:
+    """
+    In-process LRU cache of encoded JSON bodies, bounded by their total
+    size in bytes.
+
+    Keys are (scope, parameters) where scope is a data version scope.
+    An entry is served only while the ETag built from the current
+    versions matches the one it was stored with, so a worker never serves
+    a body older than the database, even if another worker handled the
+    write. Writes still invalidate their scopes to free the memory early.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[CacheKey, CachedBody] = OrderedDict()
+        self._hit_metric = CACHE_REQUESTS.labels("response", "hit")
+        self._miss_metric = CACHE_REQUESTS.labels("response", "miss")
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: CacheKey, etag: str) -> Optional[CachedBody]:
+        entry = self._data.get(key)
+        if entry is None or entry.etag != etag:
+            self.misses += 1
+            self._miss_metric.inc()
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        self._hit_metric.inc()
+        return entry
+
+    def set(self, key: CacheKey, etag: str, body: bytes) -> CachedBody:
+        """
+        Store a body along with its gzip-compressed copy.
+        :return: The stored entry, served right away by the caller.
+        """
+        gzipped = None
+        if len(body) >= RESPONSE_CACHE_GZIP_MIN_SIZE:
+            gzipped = gzip.compress(
+                body, compresslevel=RESPONSE_CACHE_GZIP_LEVEL, mtime=0
+            )
+        entry = CachedBody(etag=etag, plain=body, gzipped=gzipped)
+        if entry.size > self.max_bytes:
+            return entry
+
+        self._remove(key)
+        self._data[key] = entry
+        self.size += entry.size
+        while self.size > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self.size -= evicted.size
+        return entry
+
+    def invalidate(self, *scopes: str) -> None:
+        """Drop every entry stored under the given scopes"""
+        for key in [key for key in self._data if key[0] in scopes]:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+response_cache = ResponseCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+
+
+def accepts_gzip(request: Request) -> bool:
+    for coding in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = coding.partition(";")
+        if name.strip().lower() == "gzip":
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00")
+    return False
+
+
+def cached_response(request: Request, entry: CachedBody) -> Response:
+    """Send a cached body as is, compressed if the client accepts gzip"""
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    body = entry.plain
+    if entry.gzipped is not None and accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        body = entry.gzipped
+    return Response(
+        content=body, media_type="application/json", headers=headers
+    )
@@ -1,4 +1,105 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+# "check" refuses to start unless the database is migrated to the latest
+# revision, "create" creates missing tables at startup (local development
+# without migrations).
+DB_SCHEMA_MODE = os.environ.get("DB_SCHEMA_MODE", "check")
+
 MEDIA_PATH = BASE_DIR / "media"
+MEDIA_MAX_SIZE = int(os.environ.get("MEDIA_MAX_SIZE", 50 * 1024 * 1024))
+MEDIA_CHUNK_SIZE = int(os.environ.get("MEDIA_CHUNK_SIZE", 1024 * 1024))
+# Room for the boundaries and part headers of an upload form, on top of
+# the size of its files.
+MEDIA_FORM_OVERHEAD = int(os.environ.get("MEDIA_FORM_OVERHEAD", 64 * 1024))
+
+MEDIA_BATCH_MAX_FILES = int(os.environ.get("MEDIA_BATCH_MAX_FILES", 10))
+MEDIA_GC_INTERVAL = float(os.environ.get("MEDIA_GC_INTERVAL", 60))
+MEDIA_GC_BATCH_SIZE = int(os.environ.get("MEDIA_GC_BATCH_SIZE", 100))
+MEDIA_GC_CONCURRENCY = int(os.environ.get("MEDIA_GC_CONCURRENCY", 8))
+# Media uploaded but not attached to a tweet for that long is deleted.
+MEDIA_ORPHAN_MAX_AGE = int(os.environ.get("MEDIA_ORPHAN_MAX_AGE", 24 * 3600))
+MEDIA_ORPHAN_SWEEP_INTERVAL = float(
+    os.environ.get("MEDIA_ORPHAN_SWEEP_INTERVAL", 3600)
+)
+
+IMAGE_VARIANT_SIZES = {
+    "thumbnail": int(os.environ.get("IMAGE_THUMBNAIL_SIZE", 160)),
+    "medium": int(os.environ.get("IMAGE_MEDIUM_SIZE", 720)),
+}
+IMAGE_WEBP_QUALITY = int(os.environ.get("IMAGE_WEBP_QUALITY", 80))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 100))
+
+TIMELINE_PAGE_SIZE = int(os.environ.get("TIMELINE_PAGE_SIZE", 50))
+TIMELINE_MAX_PAGE_SIZE = int(os.environ.get("TIMELINE_MAX_PAGE_SIZE", 100))
+
+HOME_TIMELINE_DEPTH = int(os.environ.get("HOME_TIMELINE_DEPTH", 800))
+HOME_TIMELINE_TRIM_INTERVAL = int(
+    os.environ.get("HOME_TIMELINE_TRIM_INTERVAL", 100)
+)
+FANOUT_FOLLOWER_THRESHOLD = int(
+    os.environ.get("FANOUT_FOLLOWER_THRESHOLD", 10000)
+)
+
+# Profiles carry the follow counts and only this many followers and
+# followings, the full lists are paged by the follow list endpoints.
+PROFILE_PREVIEW_SIZE = int(os.environ.get("PROFILE_PREVIEW_SIZE", 20))
+FOLLOW_PAGE_SIZE = int(os.environ.get("FOLLOW_PAGE_SIZE", 50))
+FOLLOW_MAX_PAGE_SIZE = int(os.environ.get("FOLLOW_MAX_PAGE_SIZE", 200))
+
+# Every worker keeps the follow graph in memory, about 4 bytes a follow.
+# Its listener needs a session of its own: FOLLOW_GRAPH_DB_HOST has to
+# reach Postgres directly when DB_HOST is pgbouncer in transaction mode.
+FOLLOW_GRAPH = os.environ.get("FOLLOW_GRAPH", "true").lower() == "true"
+FOLLOW_GRAPH_DB_HOST = os.environ.get("FOLLOW_GRAPH_DB_HOST", "")
+# The graph is loaded again once this many edits piled up on top of it.
+FOLLOW_GRAPH_MAX_EDITS = int(os.environ.get("FOLLOW_GRAPH_MAX_EDITS", 100000))
+FOLLOW_GRAPH_RETRY_INTERVAL = float(
+    os.environ.get("FOLLOW_GRAPH_RETRY_INTERVAL", 10)
+)
+
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+)
+RESPONSE_CACHE_GZIP_MIN_SIZE = int(
+    os.environ.get("RESPONSE_CACHE_GZIP_MIN_SIZE", 1024)
+)
+RESPONSE_CACHE_GZIP_LEVEL = int(os.environ.get("RESPONSE_CACHE_GZIP_LEVEL", 6))
+
+AUTH_CACHE_SIZE = int(os.environ.get("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", 300))
+AUTH_REJECTED_CACHE_SIZE = int(
+    os.environ.get("AUTH_REJECTED_CACHE_SIZE", 10000)
+)
+AUTH_REJECTED_CACHE_TTL = float(os.environ.get("AUTH_REJECTED_CACHE_TTL", 10))
+
+# Requests running more queries are logged, with the statements repeated
+# QUERY_REPEAT_THRESHOLD times or more. 0 turns the logging off.
+QUERY_BUDGET = int(os.environ.get("QUERY_BUDGET", 0))
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", 5))
+
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "true").lower() == "true"
+# Requests with this value in the X-Profile-Token header get the profile
+# of the request instead of the response. Empty turns profiling off.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_TOP_FUNCTIONS = int(os.environ.get("PROFILE_TOP_FUNCTIONS", 50))
+# /metrics requires this value as a bearer token, the scrape config of
+# Prometheus sends it with its authorization option. Empty turns the
+# route off.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Search ranks this many of the most recent matching tweets, so a query
+# matching millions of tweets costs the same as a rare one.
+SEARCH_CANDIDATES = int(os.environ.get("SEARCH_CANDIDATES", 1000))
+SEARCH_QUERY_MAX_LENGTH = int(os.environ.get("SEARCH_QUERY_MAX_LENGTH", 256))
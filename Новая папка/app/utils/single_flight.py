@@ -0,0 +1,73 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, TypeVar
+
+from .metrics import SINGLE_FLIGHT_CALLS, SINGLE_FLIGHT_COALESCED
+
+ResultType = TypeVar("ResultType")
+
+
+class SingleFlight(Generic[ResultType]):
+    """
+    Coalesce concurrent calls for the same key into one execution.
+
+    The first caller of a key runs the call, callers arriving while it is
+    in flight wait for its result instead of running their own. Results
+    are shared, not copied: they must not be mutated by the callers.
+    Nothing is cached once the call completes.
+
+    If the running call is cancelled, e.g. because its client went away,
+    the waiting callers run the call themselves. Any other exception is
+    raised to every caller.
+    """
+
+    def __init__(self, name: str):
+        self.calls = 0
+        self.coalesced = 0
+        self._in_flight: Dict[Hashable, asyncio.Future] = dict()
+        self._calls_metric = SINGLE_FLIGHT_CALLS.labels(name)
+        self._coalesced_metric = SINGLE_FLIGHT_COALESCED.labels(name)
+
+    async def do(
+        self, key: Hashable, func: Callable[[], Awaitable[ResultType]]
+    ) -> ResultType:
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            self._coalesced_metric.inc()
+            try:
+                # Shielded, so a cancelled waiter does not cancel the
+                # result every other caller is waiting for.
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            self.calls += 1
+            self._calls_metric.inc()
+            return await func()
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.calls += 1
+        self._calls_metric.inc()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved when nobody was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterator, Optional
+
+from database.query_stats import QueryStats, track_queries
+
+
+class RequestTimings:
+    """Time spent by a request in each phase, in seconds"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def add(self, phase: str, duration: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration
+
+    def header(self, queries: QueryStats, total: float) -> str:
+        """
+        Build the Server-Timing header value. The SQL time of a phase is
+        counted in db as well, except for hydrate which excludes it.
+        """
+        metrics = [
+            f"{phase};dur={duration * 1000:.2f}"
+            for phase, duration in self.phases.items()
+        ]
+        metrics.append(
+            f'db;dur={queries.duration * 1000:.2f};desc="{queries.count} '
+            f'queries"'
+        )
+        metrics.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(metrics)
+
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+@contextmanager
+def track_timings() -> Iterator[RequestTimings]:
+    """Collect the phases timed in the current context"""
+    timings = RequestTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Add the time spent in the block to a phase of the request"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, perf_counter() - started)
+
+
+@contextmanager
+def hydration() -> Iterator[None]:
+    """
+    Time the loading of ORM objects and the building of the payload into
+    the hydrate phase, leaving out the time spent waiting for SQL.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    with track_queries() as queries:
+        try:
+            yield
+        finally:
+            timings.add("hydrate", perf_counter() - started - queries.duration)
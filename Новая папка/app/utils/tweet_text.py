@@ -0,0 +1,26 @@
+import re
+from typing import List
+
+# A tag or mention starts after a non-word character, so e-mail addresses
+# and "C#" are not picked up. Keep in line with migration 0007.
+HASHTAG_PATTERN = re.compile(r"(?<!\w)#(\w+)")
+MENTION_PATTERN = re.compile(r"(?<!\w)@(\w+)")
+
+
+def extract_hashtags(text: str, max_length: int) -> List[str]:
+    """
+    Find the hashtags of a tweet.
+    :param text: Text of the tweet.
+    :param max_length: Longer tags are ignored.
+    :return: Lowercased tags without "#", each one once, in order.
+    """
+    tags = (tag.lower() for tag in HASHTAG_PATTERN.findall(text))
+    return list(dict.fromkeys(tag for tag in tags if len(tag) <= max_length))
+
+
+def extract_mentions(text: str) -> List[str]:
+    """
+    Find the usernames mentioned in a tweet.
+    :return: Usernames without "@", each one once, in order.
+    """
+    return list(dict.fromkeys(MENTION_PATTERN.findall(text)))